@@ -0,0 +1,127 @@
+""" Asyncio pipeline between mitm proxy and the bot (optional mode, enabled by setting async_pipeline)
+Websocket messages are handed over by the mitm addon in mitm event loop, instead of crossing into the bot manager
+thread through a queue. A consumer task in the loop only peeks the liqi header (dropping unknown msgs);
+it touches no bot manager state. Routing (flow/lobby/game state changes), game state processing (bot inference)
+and automation of each msg run as one job on a single worker executor. Housekeeping (overlay, lobby actions, etc.)
+is scheduled as jobs on the same worker, so all bot manager and game state access is serialized in that thread.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, TYPE_CHECKING
+
+import mitm
+import liqi
+from common.latency import TRACER, Stage, DecisionTrace
+from common.log_helper import LOGGER
+
+if TYPE_CHECKING:
+    from bot_manager import BotManager
+
+
+def _run_traced(trace:DecisionTrace, func:Callable, *args):
+    """ run func in executor thread, continuing the latency trace of the caller"""
+    TRACER.attach(trace)
+    try:
+        return func(*args)
+    finally:
+        TRACER.discard()
+
+
+class AsyncPipeline:
+    """ Process ws messages as asyncio tasks for bot manager"""
+
+    def __init__(self, bot_manager:'BotManager'):
+        """ params:
+            bot_manager(BotManager): bot manager whose msg routing, game state and automation are used"""
+        self.bm = bot_manager
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="BotWorker")
+        self._loop:asyncio.AbstractEventLoop = None
+        self._queue:asyncio.Queue = None
+        self._task:asyncio.Task = None
+        self._pending_job:Future = None         # last scheduled msg job
+        self.on_processed:Callable[[mitm.WSMessage], None] = None
+        """ optional callback when a msg is fully processed (called in loop or worker thread). for benchmarking"""
+
+    def on_message(self, msg:mitm.WSMessage):
+        """ mitm msg handler: queue msg for the consumer task. Must be called in an event loop"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:      # first msg, or mitm restarted with a new loop
+            self._attach(loop)
+        self._queue.put_nowait(msg)
+
+    def _attach(self, loop:asyncio.AbstractEventLoop):
+        """ start consumer task in the loop"""
+        self.detach()
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._task = loop.create_task(self._consume(self._queue), name="AsyncPipeline")
+        LOGGER.debug("Async pipeline attached to event loop %s", id(loop))
+
+    def detach(self):
+        """ cancel consumer task (e.g. before the mitm loop stops). Thread safe"""
+        if self._task and not self._task.done() and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        self._loop = None
+        self._queue = None
+        self._task = None
+
+    def close(self):
+        """ detach and shutdown worker"""
+        self.detach()
+        self._executor.shutdown(wait=False)
+
+    def run_job(self, func:Callable, *args):
+        """ run func in the bot worker and wait for the result (blocking). for jobs from other threads"""
+        return self._executor.submit(func, *args).result()
+
+    async def drain(self):
+        """ wait until all queued msgs and scheduled jobs are processed"""
+        if self._queue:
+            await self._queue.join()
+        if self._pending_job is not None:      # worker runs jobs in order, so the last one finishes last
+            job, self._pending_job = self._pending_job, None
+            if not job.done():
+                await asyncio.wrap_future(job)
+
+    async def _consume(self, queue:asyncio.Queue):
+        """ consumer task: process msgs in order"""
+        while True:
+            msg:mitm.WSMessage = await queue.get()
+            try:
+                await self._process(msg)
+            except Exception as e:
+                LOGGER.error("Error processing msg: %s", e, exc_info=True)
+                self.bm.game_exception = e
+            finally:
+                queue.task_done()
+
+    async def _process(self, msg:mitm.WSMessage):
+        header = None
+        if msg.type == mitm.WsType.MESSAGE:
+            TRACER.begin(msg.timestamp)
+            TRACER.mark(Stage.DEQUEUE)
+            # peek in frame order here (the parser tracks REQ/RES ids); drop unknown msgs
+            header = self.bm._peek(msg)          # pylint: disable=protected-access
+            if header is None:
+                TRACER.discard()
+                if self.on_processed:
+                    self.on_processed(msg)
+                return
+        trace = TRACER.current
+        TRACER.discard()
+        # jobs run in order on the single worker, so routing sees the state left by the previous msg
+        self._pending_job = self._executor.submit(_run_traced, trace, self._process_msg, msg, header)
+        if self.on_processed:
+            self._pending_job.add_done_callback(lambda _f: self.on_processed(msg))
+
+    def _process_msg(self, msg:mitm.WSMessage, header:liqi.LiqiHeader | None):
+        """ job in bot worker: route msg, then feed game msg into game state (bot inference)
+        and automate the reaction"""
+        try:
+            liqimsg = self.bm._route_msg(msg, header)       # pylint: disable=protected-access
+            if liqimsg is not None:
+                reaction = self.bm.game_state.input(liqimsg)
+                self.bm._process_reaction(liqimsg, reaction)        # pylint: disable=protected-access
+        except Exception as e:
+            LOGGER.error("Error processing msg: %s", e, exc_info=True)
+            self.bm.game_exception = e
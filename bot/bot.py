@@ -1,17 +1,18 @@
 """ Bot represents a mjai protocol bot
 implement wrappers for supportting different bot types
 """
-import json
 from abc import ABC, abstractmethod
 
-from common.log_helper import LOGGER
-from common.mj_helper import meta_to_options, MjaiType
+from common.mj_helper import meta_to_options
 from common.utils import GameMode, BotNotSupportingMode
+from common.log_helper import LOGGER
+from bot.speculative import Speculator
+from bot.lookahead import LookaheadBot
 
 
 def reaction_convert_meta(reaction:dict, is_3p:bool=False):
-    """ add meta_options to reaction """
-    if 'meta' in reaction:
+    """ add meta_options to reaction (computed once per reaction, shared by GUI, overlay and automation)"""
+    if 'meta' in reaction and 'meta_options' not in reaction:
         meta = reaction['meta']
         reaction['meta_options'] = meta_to_options(meta, is_3p)
 
@@ -74,6 +75,11 @@ class Bot(ABC):
         last_reaction = self.react(input_list[-1])
         return last_reaction
 
+    def feed_ahead(self, input_list:list[dict]):
+        """ Optional: called with the pending input msgs when no decision is needed yet. The same msgs
+        (same dict objects, in order) are passed again as the first msgs of the next react/react_batch.
+        Bots can send them ahead (can_act=False) so only the new msgs remain at decision time. Default: no-op"""
+
 
 class BotMjai(Bot):
     """ base class for libriichi.mjai Bots"""
@@ -81,12 +87,17 @@ class BotMjai(Bot):
         super().__init__(name)
         
         self.mjai_bot = None
-        self.ignore_next_turn_self_reach:bool = False
+        self.speculative:bool = False       # precompute next own tsumo decision (see speculative.py)
+        self._speculator:Speculator = None
+        self._fed_ahead:list[dict] = []     # pending msgs already passed to the speculator by feed_ahead
         
     
     @property
     def info_str(self) -> str:
-        return f"{self.name}: [{','.join([m.value for m in self.supported_modes])}]"
+        info = f"{self.name}: [{','.join([m.value for m in self.supported_modes])}]"
+        if self._speculator and self._speculator.engine.rounds:
+            info += f" (speculation hit: {self._speculator.engine.hit_rate:.0%})"
+        return info
     
     
     def _get_engine(self, mode:GameMode):
@@ -94,49 +105,67 @@ class BotMjai(Bot):
         raise NotImplementedError("Subclass must implement this method")
     
     
-    def _init_bot_impl(self, mode:GameMode=GameMode.MJ4P):
-        engine = self._get_engine(mode)
-        if not engine:
-            raise BotNotSupportingMode(mode)
+    def _new_mjai_bot(self, mode:GameMode, engine):
+        """ create libriichi mjai bot for mode and current seat"""
         if mode == GameMode.MJ4P:
             try:
                 import libriichi
             except:
                 import riichi as libriichi
-            self.mjai_bot = libriichi.mjai.Bot(engine, self.seat)
+            return libriichi.mjai.Bot(engine, self.seat)
         elif mode == GameMode.MJ3P:
             import libriichi3p
-            self.mjai_bot = libriichi3p.mjai.Bot(engine, self.seat)
+            return libriichi3p.mjai.Bot(engine, self.seat)
         else:
-            raise BotNotSupportingMode(mode)          
+            raise BotNotSupportingMode(mode)
+    
+    
+    def _init_bot_impl(self, mode:GameMode=GameMode.MJ4P):
+        engine = self._get_engine(mode)
+        if not engine:
+            raise BotNotSupportingMode(mode)
+        if self._speculator:
+            self._speculator.shutdown()
+            self._speculator = None
+        self._fed_ahead = []
+        if self.speculative:
+            self._speculator = Speculator(
+                engine, lambda e: self._new_mjai_bot(mode, e), self.seat, mode == GameMode.MJ3P)
+            engine = self._speculator.engine
+        self.mjai_bot = LookaheadBot(lambda e: self._new_mjai_bot(mode, e), engine, self.seat)
             
         
     def react(self, input_msg:dict) -> dict:
-        if self.mjai_bot is None:
-            return None        
-        if self.ignore_next_turn_self_reach:    # ignore repetitive self reach. only for the very next msg
-            if input_msg['type'] == MjaiType.REACH and input_msg['actor'] == self.seat:
-                LOGGER.debug("Ignoring repetitive self reach msg, reach msg already sent to AI last turn")
-                return None
-            self.ignore_next_turn_self_reach = False
-            
-        str_input = json.dumps(input_msg)
+        return self.react_batch([input_msg])
+
 
-        react_str = self.mjai_bot.react(str_input)
-        if react_str is None:
+    def react_batch(self, input_list:list[dict]) -> dict | None:
+        if self.mjai_bot is None or len(input_list) == 0:
             return None
-        reaction = json.loads(react_str)
-        # Special treatment for self reach output msg
-        # mjai only outputs dahai msg after the reach msg
-        if reaction['type'] == MjaiType.REACH and reaction['actor'] == self.seat:  # Self reach
-            # get the subsequent dahai message,
-            # appeding it to the reach reaction msg as 'reach_dahai' key
-            LOGGER.debug("Send reach msg to get reach_dahai. Cannot go back to unreach!")
-            # TODO make a clone of mjai_bot so reach can be tested to get dahai without affecting the game
-
-            reach_msg = {'type': MjaiType.REACH, 'actor': self.seat}
-            reach_dahai_str = self.mjai_bot.react(json.dumps(reach_msg))
-            reach_dahai = json.loads(reach_dahai_str)
-            reaction['reach_dahai'] = reach_dahai
-            self.ignore_next_turn_self_reach = True     # ignore very next reach msg
+        return self.react_msgs(input_list)
+
+
+    def react_msgs(self, input_list:list[dict], can_act:bool=True) -> dict | None:
+        """ feed msgs to the mjai bot (and the speculator) and return the reaction to the last msg if can_act"""
+        # msgs are serialized once, reaction meta q_values come as array (see mjai_codec.py)
+        # self reach reaction comes with 'reach_dahai' (see lookahead.py). bot state is not changed by it
+        reaction = self.mjai_bot.react_msgs(input_list, can_act)
+        if self._speculator:
+            # msgs fed ahead are the first msgs of this batch (see Bot.feed_ahead). the speculator has them already
+            n_ahead = len(self._fed_ahead) if input_list[:len(self._fed_ahead)] == self._fed_ahead else 0
+            self._fed_ahead = []
+            self._speculator.on_inputs(input_list[n_ahead:])
         return reaction
+
+
+    def feed_ahead(self, input_list:list[dict]):
+        # libriichi bot only gets the msgs at decision time. the speculator gets them now,
+        # so a round starts on kamicha's discard even when there is no call option (no decision)
+        if self._speculator is None:
+            return
+        n_ahead = len(self._fed_ahead)
+        if input_list[:n_ahead] != self._fed_ahead:
+            LOGGER.debug("Pending msgs changed since fed ahead (new round): %s", self._fed_ahead)
+            n_ahead = 0
+        self._speculator.on_inputs(input_list[n_ahead:])
+        self._fed_ahead = list(input_list)
@@ -1,8 +1,11 @@
 """ Bot factory"""
 from common.settings import Settings
-from common.utils import Folder, sub_file
+from common.utils import Folder, sub_file, LocalModelException
+from common.log_helper import LOGGER
 from .bot import Bot, GameMode
 from .local.bot_local import BotMortalLocal
+from .local.worker import BotMortalWorker
+from .local.batch_server import BotMortalRemote
 from .mjapi.bot_mjapi import BotMjapi
 from .akagiot.bot_akagiot import BotAkagiOt
 
@@ -19,7 +22,18 @@ def get_bot(settings:Settings) -> Bot:
                 GameMode.MJ4P: sub_file(Folder.MODEL, settings.model_file),
                 GameMode.MJ3P: sub_file(Folder.MODEL, settings.model_file_3p)
             }
-            bot = BotMortalLocal(model_files)
+            bot = None
+            if settings.local_model_server_port:
+                try:
+                    bot = BotMortalRemote(settings.local_model_server_port)
+                except LocalModelException as e:
+                    LOGGER.warning("Shared inference server not available, loading models locally: %s", e)
+            if bot is None:
+                if settings.local_model_worker:
+                    bot = BotMortalWorker(model_files, settings.local_model_backend)
+                else:
+                    bot = BotMortalLocal(model_files, settings.local_model_backend)
+            bot.speculative = settings.local_model_speculative
         case "AkagiOT":
             bot = BotAkagiOt(settings.akagi_ot_url, settings.akagi_ot_apikey)
         case "MJAPI":
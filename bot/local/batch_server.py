@@ -0,0 +1,397 @@
+""" Micro-batching inference server for running multiple game clients on one machine
+One server process owns one MortalEngine per game mode. Client processes (BotMortalRemote) keep their own
+libriichi mjai bot state and only send the model inputs (react_batch calls) to the server.
+Calls arriving within a short window are stacked into one forward pass (MicroBatcher), which gives better
+CPU throughput per core than separate batch=1 passes when several tables are active.
+
+Usage:
+    python -m bot.local.batch_server serve [--port PORT] [--window MS]
+        serve local models configured in settings (model files and backend)
+    python -m bot.local.batch_server bench <model_file> [--tables N] [--window MS]
+        compare per-table latency and throughput, batched vs separate engines
+"""
+import time
+import queue
+import argparse
+import threading
+from dataclasses import dataclass, field
+from multiprocessing.connection import Listener, Client, Connection
+
+from common.utils import LocalModelException
+from common.log_helper import LOGGER
+from bot.bot import BotMjai, GameMode
+
+DEFAULT_PORT = 28690
+AUTHKEY = b'mahjong-copilot-batch'
+DEFAULT_WINDOW = 0.003      # seconds to wait for more calls before running a batch
+MAX_BATCH = 32              # max number of observations in one forward pass
+# engine attributes libriichi mjai.Bot may read, copied to remote engine proxies
+ENGINE_ATTRS = ('engine_type', 'name', 'version', 'is_oracle', 'enable_quick_eval',
+    'enable_rule_based_agari_guard', 'enable_amp', 'stochastic_latent',
+    'boltzmann_epsilon', 'boltzmann_temp', 'top_p')
+
+# protocol: request (cmd, *args) -> response (status, result)
+CMD_INFO = 'info'           # (CMD_INFO, mode value) -> {attr: value} | error if mode not served
+CMD_REACT = 'react'         # (CMD_REACT, mode value, obs, masks, invisible_obs) -> react_batch result
+STATUS_OK = 'ok'
+STATUS_ERR = 'err'
+
+
+@dataclass
+class _Request:
+    obs:list
+    masks:list
+    invisible_obs:list | None
+    done:threading.Event = field(default_factory=threading.Event)
+    result:tuple = None
+    error:Exception = None
+
+
+class MicroBatcher:
+    """ Collect react_batch calls from multiple threads and run them as one stacked forward pass"""
+
+    def __init__(self, engine, window:float=DEFAULT_WINDOW, max_batch:int=MAX_BATCH):
+        """ params:
+            engine(MortalEngine): engine to run batches on
+            window(float): max seconds to wait for more calls after the first one (bounded added latency)
+            max_batch(int): max observations per forward pass"""
+        self.engine = engine
+        self.window = window
+        self.max_batch = max_batch
+        self.n_callers = 0          # number of registered callers. No waiting if only one is active
+        self.n_batches = 0
+        self.n_requests = 0
+        self._lock = threading.Lock()
+        self._queue:queue.Queue[_Request] = queue.Queue()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="MicroBatcher", daemon=True)
+        self._thread.start()
+
+    def register(self):
+        """ register a caller (table)"""
+        with self._lock:
+            self.n_callers += 1
+
+    def unregister(self):
+        """ unregister a caller"""
+        with self._lock:
+            self.n_callers = max(0, self.n_callers - 1)
+
+    def react_batch(self, obs, masks, invisible_obs):
+        """ same as MortalEngine.react_batch, blocking until the batch containing this call is done"""
+        req = _Request(obs, masks, invisible_obs)
+        self._queue.put(req)
+        req.done.wait()
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def stop(self):
+        """ stop batching thread"""
+        self._stop_event.set()
+        self._queue.put(None)
+        self._thread.join()
+
+    @property
+    def mean_batch_size(self) -> float:
+        """ mean number of calls per forward pass"""
+        return self.n_requests / self.n_batches if self.n_batches else 0.0
+
+    def _collect(self, first:_Request) -> list[_Request]:
+        """ collect calls arriving within window after the first one"""
+        batch = [first]
+        size = len(first.obs)
+        if self.n_callers <= 1:
+            return batch
+        deadline = time.monotonic() + self.window
+        while size < self.max_batch and len(batch) < self.n_callers:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                req = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if req is None:
+                self._queue.put(None)
+                break
+            batch.append(req)
+            size += len(req.obs)
+        return batch
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            first = self._queue.get()
+            if first is None:
+                continue
+            batch = self._collect(first)
+            self._run_batch(batch)
+
+    def _run_batch(self, batch:list[_Request]):
+        obs, masks, invisible_obs = [], [], []
+        for req in batch:
+            obs.extend(req.obs)
+            masks.extend(req.masks)
+            if req.invisible_obs is not None:
+                invisible_obs.extend(req.invisible_obs)
+        try:
+            actions, q_out, masks_out, is_greedy = self.engine.react_batch(obs, masks, invisible_obs or None)
+        except Exception as e:      # pylint: disable=broad-except
+            for req in batch:
+                req.error = e
+                req.done.set()
+            return
+        self.n_batches += 1
+        self.n_requests += len(batch)
+        i = 0
+        for req in batch:
+            j = i + len(req.obs)
+            req.result = (actions[i:j], q_out[i:j], masks_out[i:j], is_greedy[i:j])
+            req.done.set()
+            i = j
+
+
+class BatchedEngine:
+    """ MortalEngine proxy for one caller (libriichi mjai.Bot), batching its calls with other callers"""
+    def __init__(self, batcher:MicroBatcher, attrs:dict):
+        self._batcher = batcher
+        self.__dict__.update(attrs)
+        batcher.register()
+
+    def react_batch(self, obs, masks, invisible_obs):
+        """ same as MortalEngine.react_batch"""
+        return self._batcher.react_batch(obs, masks, invisible_obs)
+
+    def close(self):
+        """ unregister from the batcher"""
+        if self._batcher:
+            self._batcher.unregister()
+            self._batcher = None
+
+    def __del__(self):
+        self.close()
+
+
+def engine_attrs(engine) -> dict:
+    """ return the engine attributes to copy to proxies"""
+    return {k: getattr(engine, k) for k in ENGINE_ATTRS if hasattr(engine, k)}
+
+
+class InferenceServer:
+    """ Serve react_batch of local Mortal engines to client processes, micro-batching calls across clients"""
+
+    def __init__(self, engines:dict[GameMode, object], port:int=DEFAULT_PORT, window:float=DEFAULT_WINDOW):
+        """ params:
+            engines(dict): {mode: MortalEngine} to serve
+            port(int): localhost port to listen on
+            window(float): micro-batching window in seconds"""
+        self.port = port
+        self.batchers = {mode: MicroBatcher(e, window) for mode, e in engines.items()}
+        self._attrs = {mode: engine_attrs(e) for mode, e in engines.items()}
+        self._listener:Listener = None
+        self._thread:threading.Thread = None
+
+    def start(self):
+        """ start listening in a background thread"""
+        self._listener = Listener(('127.0.0.1', self.port), authkey=AUTHKEY)
+        self._thread = threading.Thread(target=self._accept_loop, name="InferenceServer", daemon=True)
+        self._thread.start()
+        LOGGER.info("Inference server listening on port %d, modes=%s", self.port, list(self.batchers))
+
+    def stop(self):
+        """ stop listening and batching"""
+        if self._listener:
+            self._listener.close()
+            self._listener = None
+        for b in self.batchers.values():
+            b.stop()
+
+    def _accept_loop(self):
+        while self._listener:
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError):
+                return          # listener closed
+            except Exception as e:      # pylint: disable=broad-except
+                LOGGER.warning("Inference server failed to accept client: %s", e)
+                continue
+            threading.Thread(target=self._serve_client, args=(conn,), name="InferenceClient", daemon=True).start()
+
+    def _serve_client(self, conn:Connection):
+        """ serve one client connection until it closes.
+        A client plays one game at a time, so it is registered as a caller only with the batcher of the mode
+        it is sending react calls for (batchers wait for registered callers)"""
+        active:MicroBatcher = None
+        try:
+            while True:
+                try:
+                    req = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    cmd, mode = req[0], GameMode(req[1])
+                    if mode not in self.batchers:
+                        raise ValueError(f"Mode {mode} not served")
+                    if cmd == CMD_INFO:
+                        res = self._attrs[mode]
+                    elif cmd == CMD_REACT:
+                        batcher = self.batchers[mode]
+                        if batcher is not active:       # first react for this mode
+                            if active:
+                                active.unregister()
+                            batcher.register()
+                            active = batcher
+                        res = batcher.react_batch(*req[2:])
+                    else:
+                        raise ValueError(f"Unknown command: {cmd}")
+                    conn.send((STATUS_OK, res))
+                except Exception as e:  # pylint: disable=broad-except
+                    conn.send((STATUS_ERR, repr(e)))
+        finally:
+            if active:
+                active.unregister()
+            conn.close()
+
+
+class RemoteEngine:
+    """ MortalEngine proxy calling react_batch on an InferenceServer"""
+    def __init__(self, conn:Connection, lock:threading.Lock, mode:GameMode):
+        self._conn = conn
+        self._lock = lock
+        self._mode = mode
+        self.__dict__.update(self._request(CMD_INFO, mode.value))
+
+    def _request(self, *req):
+        with self._lock:
+            self._conn.send(req)
+            status, res = self._conn.recv()
+        if status != STATUS_OK:
+            raise RuntimeError(f"Inference server error: {res}")
+        return res
+
+    def react_batch(self, obs, masks, invisible_obs):
+        """ same as MortalEngine.react_batch"""
+        return self._request(CMD_REACT, self._mode.value, obs, masks, invisible_obs)
+
+
+class BotMortalRemote(BotMjai):
+    """ Mortal bot using the models of a local InferenceServer"""
+    def __init__(self, port:int=DEFAULT_PORT) -> None:
+        """ params:
+            port(int): inference server port on localhost"""
+        super().__init__("Local Mortal Bot (Shared)")
+        try:
+            self._conn = Client(('127.0.0.1', port), authkey=AUTHKEY)
+        except OSError as e:
+            raise LocalModelException(f"Cannot connect to inference server on port {port}: {e}") from e
+        self._lock = threading.Lock()
+        self._engines:dict[GameMode, RemoteEngine] = {}
+        for mode in GameMode:
+            try:
+                self._engines[mode] = RemoteEngine(self._conn, self._lock, mode)
+            except RuntimeError:
+                pass        # mode not served
+        if not self._engines:
+            raise LocalModelException("Inference server has no models")
+
+    @property
+    def supported_modes(self) -> list[GameMode]:
+        return list(self._engines.keys())
+
+    def _get_engine(self, mode:GameMode):
+        return self._engines.get(mode, None)
+
+    def __del__(self):
+        conn = getattr(self, '_conn', None)
+        if conn:
+            conn.close()
+
+
+def _bench(model_file:str, n_tables:int, window:float, n_decisions:int=20):
+    """ simulate n_tables tables each making decisions, with separate engine calls vs micro-batched"""
+    # pylint: disable=import-outside-toplevel
+    import numpy as np
+    from bot.local.engine import get_engine
+    engine = get_engine(model_file)
+    obs_shape = (engine.brain.encoder.net[0].in_channels, 34)
+    action_space = engine.dqn.action_space
+    rng = np.random.default_rng(0)
+    inputs = [[rng.random(obs_shape, dtype=np.float32)] for _ in range(n_decisions)]
+    masks = [np.ones(action_space, dtype=bool)]
+    engine.react_batch(inputs[0], masks, None)      # warm up
+
+    def run(make_engine) -> tuple[list[float], float]:
+        latencies = []
+        lock = threading.Lock()
+        def table():
+            e = make_engine()
+            for obs in inputs:
+                start = time.perf_counter()
+                e.react_batch(obs, masks, None)
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+        threads = [threading.Thread(target=table) for _ in range(n_tables)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return latencies, time.perf_counter() - start
+
+    def report(label, latencies, elapsed):
+        latencies = sorted(latencies)
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[int(len(latencies) * 0.95)]
+        print(f"{label}: {len(latencies)/elapsed:.1f} decisions/s, latency p50={p50*1000:.1f}ms p95={p95*1000:.1f}ms")
+
+    print(f"{n_tables} tables x {n_decisions} decisions, window={window*1000:.1f}ms")
+    report("Separate", *run(lambda: engine))
+    batcher = MicroBatcher(engine, window)
+    report("Batched ", *run(lambda: BatchedEngine(batcher, engine_attrs(engine))))
+    print(f"Mean batch size: {batcher.mean_batch_size:.2f}")
+    batcher.stop()
+
+
+def main():
+    """ run inference server or benchmark"""
+    parser = argparse.ArgumentParser(description="Micro-batching Mortal inference server")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_serve = sub.add_parser("serve", help="serve local models configured in settings")
+    p_serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p_serve.add_argument("--window", type=float, default=DEFAULT_WINDOW * 1000, help="batching window (ms)")
+    p_bench = sub.add_parser("bench", help="benchmark batched vs separate inference")
+    p_bench.add_argument("model_file", help="Mortal model file (.pth)")
+    p_bench.add_argument("--tables", type=int, default=4)
+    p_bench.add_argument("--window", type=float, default=DEFAULT_WINDOW * 1000, help="batching window (ms)")
+    args = parser.parse_args()
+
+    if args.cmd == "bench":
+        _bench(args.model_file, args.tables, args.window / 1000)
+        return
+
+    # pylint: disable=import-outside-toplevel
+    from common.settings import Settings
+    from common.utils import Folder, sub_file
+    from bot.local.bot_local import BotMortalLocal
+    st = Settings()
+    try:
+        bot = BotMortalLocal({
+            GameMode.MJ4P: sub_file(Folder.MODEL, st.model_file),
+            GameMode.MJ3P: sub_file(Folder.MODEL, st.model_file_3p)}, st.local_model_backend)
+    except LocalModelException as e:
+        print(f"Cannot load models: {e}")
+        return
+    engines = {mode: bot._get_engine(mode) for mode in bot.supported_modes}     # pylint: disable=protected-access
+    engines = {k: v for k, v in engines.items() if v is not None}
+    server = InferenceServer(engines, args.port, args.window / 1000)
+    server.start()
+    print(f"Serving {[m.value for m in engines]} on port {args.port}. Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,22 +3,26 @@
 from pathlib import Path
 import threading
 
-from common.utils import LocalModelException
+from common.utils import LocalModelException, BACKEND_EAGER
 from common.log_helper import LOGGER
-from bot.local.engine import get_engine
+from bot.local.registry import MODEL_REGISTRY
+from bot.local.corpus import ObsCorpus, RecordingEngine
 from bot.bot import BotMjai, GameMode
 
 
 class BotMortalLocal(BotMjai):
     """ Mortal model based mjai bot"""
-    def __init__(self, model_files:dict[GameMode, str]) -> None:
+    def __init__(self, model_files:dict[GameMode, str], backend:str=BACKEND_EAGER) -> None:
         """ params:
         model_files(dicty): model files for different modes {mode, file_path}
+        backend(str): inference backend, one of utils.LOCAL_MODEL_BACKENDS
         """
         super().__init__("Local Mortal Bot")   
         self._supported_modes: list[GameMode] = []  
         self.model_files = model_files
+        self.backend = backend
         self._engines:dict[GameMode, any] = {}
+        self._obs_corpora:dict[GameMode, ObsCorpus] = None
         for k,v in model_files.items():
             if not Path(v).exists() or not Path(v).is_file():
                 # test file exists
@@ -26,23 +30,21 @@ class BotMortalLocal(BotMjai):
             else:
                 if k == GameMode.MJ4P:
                     try:
-                        self._engines[k] = get_engine(self.model_files[k])
+                        self._engines[k] = MODEL_REGISTRY.get_engine(self.model_files[k], k, backend)
+                        self._supported_modes.append(k)
                     except Exception as e:
                         LOGGER.warning("Cannot create engine for mode %s: %s", k, e, exc_info=True)
                 elif k == GameMode.MJ3P:
-                    # test import libraries for 3p
+                    # test import libraries for 3p. engine is loaded when the first 3p game starts
                     try:
                         import libriichi3p
-                        from bot.local.engine3p import get_engine as get_engine_3p
-                        self._engines[k] = get_engine_3p(self.model_files[k])
+                        self._supported_modes.append(k)
                     except Exception as e: # pylint: disable=broad-except
                         LOGGER.warning("Cannot create engine for mode %s: %s", k, e, exc_info=True)
-        self._supported_modes = list(self._engines.keys())
         if not self._supported_modes:
             raise LocalModelException("No valid model files found")
         
         self.mjai_bot = None
-        self.ignore_next_turn_self_reach:bool = False
         # thread lock for mjai.bot access
         # "mutable borrow" issue when running multiple methods at the same time        
         self.lock = threading.Lock()
@@ -53,5 +55,24 @@ class BotMortalLocal(BotMjai):
     
     
     def _get_engine(self, mode: GameMode):
-        return self._engines.get(mode, None)
-    
\ No newline at end of file
+        if mode not in self._engines and mode in self._supported_modes:
+            # lazy loading (3p)
+            LOGGER.info("Loading engine for mode %s", mode)
+            try:
+                engine = MODEL_REGISTRY.get_engine(self.model_files[mode], mode, self.backend)
+            except Exception as e: # pylint: disable=broad-except
+                LOGGER.warning("Cannot create engine for mode %s: %s", mode, e, exc_info=True)
+                self._supported_modes.remove(mode)
+                return None
+            self._engines[mode] = engine
+        engine = self._engines.get(mode, None)
+        if engine is not None and self._obs_corpora is not None:
+            engine = RecordingEngine(engine, self._obs_corpora[mode])
+        return engine
+    
+
+    def record_obs(self) -> dict[GameMode, ObsCorpus]:
+        """ start recording model inputs of this bot, from the next init_bot (other bots sharing the engines
+        are not recorded). returns {mode: corpus} being recorded"""
+        self._obs_corpora = {mode: ObsCorpus() for mode in self._supported_modes}
+        return dict(self._obs_corpora)
@@ -0,0 +1,163 @@
+""" Compiled (TorchScript) inference backend for Mortal engine
+BatchNorm layers are folded into the preceding Conv1d weights, and the Brain -> DQN graph is traced
+and frozen into one TorchScript module. The compiled module is checked against the eager modules
+before use, and the eager path is kept if they disagree.
+
+Usage: python -m bot.local.compiled <model_file> [--corpus obs.npz] [--3p]
+    compare compiled vs eager backend (q value difference, action agreement, latency)
+"""
+import copy
+import time
+import warnings
+import argparse
+
+import numpy as np
+import torch
+from torch import nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+from common.log_helper import LOGGER
+from bot.local.corpus import ObsCorpus
+
+PARITY_ATOL = 1e-3      # max abs q value difference allowed between compiled and eager
+
+
+class MortalNet(nn.Module):
+    """ Brain -> DQN combined network: (obs, masks) -> q values, using deterministic latent for version 1"""
+    def __init__(self, brain:nn.Module, dqn:nn.Module):
+        super().__init__()
+        self.brain = brain
+        self.dqn = dqn
+        self.version = brain.version
+
+    def forward(self, obs:torch.Tensor, masks:torch.Tensor) -> torch.Tensor:
+        if self.version == 1:
+            mu, _logsig = self.brain(obs)
+            return self.dqn(mu, masks)
+        return self.dqn(self.brain(obs), masks)
+
+
+def fold_batchnorm(module:nn.Module) -> int:
+    """ fold each BatchNorm1d into the Conv1d right before it, in all Sequential containers (in place).
+    module must be in eval mode. returns: number of BatchNorm layers folded"""
+    n_folded = 0
+    for seq in [m for m in module.modules() if isinstance(m, nn.Sequential)]:
+        for i in range(len(seq) - 1):
+            if isinstance(seq[i], nn.Conv1d) and isinstance(seq[i + 1], nn.BatchNorm1d):
+                seq[i] = fuse_conv_bn_eval(seq[i], seq[i + 1])
+                seq[i + 1] = nn.Identity()
+                n_folded += 1
+    return n_folded
+
+
+def model_io_shapes(brain:nn.Module, dqn:nn.Module) -> tuple[tuple[int, int], int]:
+    """ return (obs_shape, action_space) of the model"""
+    in_channels = brain.encoder.net[0].in_channels
+    match dqn.version:
+        case 1:
+            action_space = dqn.a_head.out_features
+        case 2 | 3:
+            action_space = dqn.a_head[-1].out_features
+        case _:
+            action_space = dqn.net.out_features - 1
+    return (in_channels, 34), action_space
+
+
+def compile_mortal(brain:nn.Module, dqn:nn.Module, device:torch.device) -> torch.jit.ScriptModule:
+    """ fold BatchNorm, trace and freeze Brain -> DQN into a TorchScript module (original modules are not changed)"""
+    net = MortalNet(copy.deepcopy(brain), copy.deepcopy(dqn)).to(device).eval()
+    n_folded = fold_batchnorm(net)
+    obs_shape, action_space = model_io_shapes(brain, dqn)
+    example = (
+        torch.zeros((1, *obs_shape), device=device),
+        torch.ones((1, action_space), dtype=torch.bool, device=device))
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)     # jit deprecation warnings in newer torch
+        traced = torch.jit.trace(net, example)
+        compiled = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+    with torch.inference_mode():
+        for _ in range(3):      # warm up jit profiling executor, so the first decisions are not slow
+            compiled(*example)
+    LOGGER.debug("Compiled Mortal model: %d BatchNorm layers folded", n_folded)
+    return compiled
+
+
+def q_values(net:nn.Module, corpus:ObsCorpus, device:torch.device, batch_size:int=32) -> np.ndarray:
+    """ return q values of net (MortalNet or compiled) over corpus, masked entries set to -inf"""
+    out = []
+    with torch.inference_mode():
+        for i in range(0, len(corpus), batch_size):
+            obs = torch.as_tensor(np.stack(corpus.obs[i:i+batch_size]), device=device)
+            masks = torch.as_tensor(np.stack(corpus.masks[i:i+batch_size]), device=device)
+            out.append(net(obs, masks).float().cpu().numpy())
+    return np.concatenate(out)
+
+
+def compare_q(q_ref:np.ndarray, q_new:np.ndarray) -> tuple[float, float]:
+    """ compare q values on legal actions. returns: (max abs difference, action agreement rate)"""
+    legal = np.isfinite(q_ref)
+    max_diff = float(np.abs(q_ref[legal] - q_new[legal]).max()) if legal.any() else 0.0
+    agreement = float((q_ref.argmax(-1) == q_new.argmax(-1)).mean())
+    return max_diff, agreement
+
+
+def check_parity(brain:nn.Module, dqn:nn.Module, compiled:nn.Module, device:torch.device,
+    corpus:ObsCorpus=None, atol:float=PARITY_ATOL) -> bool:
+    """ check compiled module against eager modules over corpus (synthetic if None). return True if within atol"""
+    if corpus is None:
+        corpus = ObsCorpus.synthetic(*model_io_shapes(brain, dqn), n=16)
+    eager = MortalNet(brain, dqn).eval()
+    max_diff, agreement = compare_q(q_values(eager, corpus, device), q_values(compiled, corpus, device))
+    LOGGER.debug("Compiled model parity: max q diff=%.2e, action agreement=%.3f", max_diff, agreement)
+    return max_diff <= atol
+
+
+def _latency(net:nn.Module, corpus:ObsCorpus, device:torch.device, n:int=200) -> float:
+    """ mean batch=1 forward time (seconds)"""
+    n = min(n, len(corpus))
+    with torch.inference_mode():
+        inputs = [(torch.as_tensor(corpus.obs[i][None], device=device),
+            torch.as_tensor(corpus.masks[i][None], device=device)) for i in range(n)]
+        for obs, masks in inputs[:10]:     # warm up
+            net(obs, masks)
+        start = time.perf_counter()
+        for obs, masks in inputs:
+            net(obs, masks)
+        return (time.perf_counter() - start) / n
+
+
+def main():
+    """ compare compiled vs eager backend on a model file"""
+    parser = argparse.ArgumentParser(description="Verify and benchmark compiled Mortal backend")
+    parser.add_argument("model_file", help="Mortal model file (.pth)")
+    parser.add_argument("--corpus", help="recorded observation corpus (.npz). random observations if not given")
+    parser.add_argument("--3p", dest="is_3p", action="store_true", help="model is for 3p")
+    args = parser.parse_args()
+
+    # pylint: disable=import-outside-toplevel
+    if args.is_3p:
+        from bot.local.engine3p import get_engine
+    else:
+        from bot.local.engine import get_engine
+    engine = get_engine(args.model_file)
+    device = engine.device
+    if args.corpus:
+        corpus = ObsCorpus.load(args.corpus)
+    else:
+        corpus = ObsCorpus.synthetic(*model_io_shapes(engine.brain, engine.dqn), n=256)
+    eager = MortalNet(engine.brain, engine.dqn).eval()
+    compiled = compile_mortal(engine.brain, engine.dqn, device)
+
+    max_diff, agreement = compare_q(q_values(eager, corpus, device), q_values(compiled, corpus, device))
+    print(f"Corpus: {len(corpus)} observations")
+    print(f"Max q diff: {max_diff:.3e} (tolerance {PARITY_ATOL:.0e}) -> "
+        f"{'PASS' if max_diff <= PARITY_ATOL else 'FAIL'}")
+    print(f"Action agreement: {agreement*100:.2f}%")
+    t_eager = _latency(eager, corpus, device)
+    t_compiled = _latency(compiled, corpus, device)
+    print(f"Latency (batch=1): eager {t_eager*1000:.3f}ms, compiled {t_compiled*1000:.3f}ms, "
+        f"speedup {t_eager/t_compiled:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+""" Corpus of recorded model inputs (observations and masks)
+for verifying and benchmarking model backends against the eager engine
+"""
+import numpy as np
+
+
+class ObsCorpus:
+    """ Recorded (obs, mask) pairs fed to MortalEngine.react_batch"""
+    def __init__(self, obs:list[np.ndarray]=None, masks:list[np.ndarray]=None):
+        self.obs:list[np.ndarray] = obs or []
+        self.masks:list[np.ndarray] = masks or []
+
+    def __len__(self):
+        return len(self.obs)
+
+    def add_batch(self, obs:list[np.ndarray], masks:list[np.ndarray]):
+        """ add a react_batch input"""
+        self.obs.extend(np.array(o, copy=True) for o in obs)
+        self.masks.extend(np.array(m, copy=True) for m in masks)
+
+    def save(self, file:str):
+        """ save corpus to npz file"""
+        np.savez_compressed(file, obs=np.stack(self.obs), masks=np.stack(self.masks))
+
+    @staticmethod
+    def load(file:str) -> 'ObsCorpus':
+        """ load corpus from npz file"""
+        with np.load(file) as data:
+            return ObsCorpus(list(data['obs']), list(data['masks']))
+
+    @staticmethod
+    def synthetic(obs_shape:tuple, action_space:int, n:int=64, seed:int=0) -> 'ObsCorpus':
+        """ generate random binary observations and masks, when no recorded corpus is available"""
+        rng = np.random.default_rng(seed)
+        obs = list(rng.integers(0, 2, (n, *obs_shape)).astype(np.float32))
+        masks = list(rng.random((n, action_space)) < 0.3)
+        for m in masks:
+            m[rng.integers(action_space)] = True    # at least one legal action
+        return ObsCorpus(obs, masks)
+
+
+class RecordingEngine:
+    """ engine wrapper recording react_batch inputs into a corpus. Wraps the engine of one bot,
+    since engines are shared between bots (see registry.py)"""
+    def __init__(self, engine, corpus:ObsCorpus):
+        self._engine = engine
+        self.corpus = corpus
+
+    def __getattr__(self, name):
+        return getattr(self._engine, name)
+
+    def react_batch(self, obs, masks, invisible_obs):
+        """ same as MortalEngine.react_batch"""
+        self.corpus.add_batch(obs, masks)
+        return self._engine.react_batch(obs, masks, invisible_obs)
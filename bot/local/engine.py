@@ -1,8 +1,12 @@
-""" Mortal Engine for 4p game"""
+""" Mortal Engine for 4p and 3p game"""
 import torch
 import numpy as np
 from torch.distributions import Normal, Categorical
 from bot.local.model import Brain, DQN
+from bot.local.compiled import compile_mortal, check_parity
+from bot.local.quantized import get_quantized
+from common.log_helper import LOGGER
+from common.utils import BACKEND_EAGER, BACKEND_TORCHSCRIPT, BACKEND_INT8
 
 class MortalEngine:
     """ Mortal Engine for local Bot 4p"""
@@ -21,6 +25,7 @@ class MortalEngine:
         boltzmann_epsilon = 0,
         boltzmann_temp = 1,
         top_p = 1,
+        net = None,
     ):
         self.engine_type = 'mortal'
         self.device = device or torch.device('cpu')
@@ -39,11 +44,13 @@ class MortalEngine:
         self.boltzmann_epsilon = boltzmann_epsilon
         self.boltzmann_temp = boltzmann_temp
         self.top_p = top_p
+        # compiled Brain -> DQN module (see compiled.py), used instead of brain and dqn if set
+        self.net = net
 
     def react_batch(self, obs, masks, invisible_obs):
         with (
             torch.autocast(self.device.type, enabled=self.enable_amp),
-            torch.no_grad(),
+            torch.inference_mode(),
         ):
             return self._react_batch(obs, masks, invisible_obs)
 
@@ -55,17 +62,10 @@ class MortalEngine:
             invisible_obs = torch.as_tensor(np.stack(invisible_obs, axis=0), device=self.device)
         batch_size = obs.shape[0]
 
-        match self.version:
-            case 1:
-                mu, logsig = self.brain(obs, invisible_obs)
-                if self.stochastic_latent:
-                    latent = Normal(mu, logsig.exp() + 1e-6).sample()
-                else:
-                    latent = mu
-                q_out = self.dqn(latent, masks)
-            case 2 | 3 | 4:
-                phi = self.brain(obs)
-                q_out = self.dqn(phi, masks)
+        if self.net is not None:
+            q_out = self.net(obs, masks)
+        else:
+            q_out = self._forward_eager(obs, masks, invisible_obs)
 
         if self.boltzmann_epsilon > 0:
             is_greedy = torch.full((batch_size,), 1-self.boltzmann_epsilon, device=self.device).bernoulli().to(torch.bool)
@@ -78,6 +78,20 @@ class MortalEngine:
 
         return actions.tolist(), q_out.tolist(), masks.tolist(), is_greedy.tolist()
 
+    def _forward_eager(self, obs, masks, invisible_obs):
+        match self.version:
+            case 1:
+                mu, logsig = self.brain(obs, invisible_obs)
+                if self.stochastic_latent:
+                    latent = Normal(mu, logsig.exp() + 1e-6).sample()
+                else:
+                    latent = mu
+                q_out = self.dqn(latent, masks)
+            case 2 | 3 | 4:
+                phi = self.brain(obs)
+                q_out = self.dqn(phi, masks)
+        return q_out
+
 def sample_top_p(logits, p):
     if p >= 1:
         return Categorical(logits=logits).sample()
@@ -91,25 +105,55 @@ def sample_top_p(logits, p):
     sampled = probs_idx.gather(-1, probs_sort.multinomial(1)).squeeze(-1)
     return sampled
 
-def get_engine(model_file:str) -> MortalEngine:
+def get_engine(model_file:str, backend:str=BACKEND_EAGER, state:dict=None, is_3p:bool=False) -> MortalEngine:
     """ Create and return Mortal engine object
     params:
-        model_file(str): Mortal model file path"""
+        model_file(str): Mortal model file path
+        backend(str): inference backend, one of utils.LOCAL_MODEL_BACKENDS
+        state(dict): model state already loaded from model_file (e.g. by registry), None to load here
+        is_3p(bool): True for 3p model (libriichi3p consts and rule based agari guard)"""
     # check if GPU is available
     if torch.cuda.is_available():
         device = torch.device('cuda')
     else:
         device = torch.device('cpu')
 
-    # Get the path of control_state_file = current directory / control_state_file
-    state = torch.load(model_file, map_location=device)
+    if state is None:
+        state = torch.load(model_file, map_location=device)
+
+    if is_3p:
+        import libriichi3p      # pylint: disable=import-outside-toplevel
+        consts = libriichi3p.consts
+    else:
+        consts = None       # libriichi default
 
-    mortal = Brain(version=state['config']['control']['version'],
-        conv_channels=state['config']['resnet']['conv_channels'],
-        num_blocks=state['config']['resnet']['num_blocks']).eval()
-    dqn = DQN(version=state['config']['control']['version']).eval()
-    mortal.load_state_dict(state['mortal'])
-    dqn.load_state_dict(state['current_dqn'])
+    # build on meta device (skip weight init) and take over the loaded tensors
+    with torch.device('meta'):
+        mortal = Brain(version=state['config']['control']['version'],
+            conv_channels=state['config']['resnet']['conv_channels'],
+            num_blocks=state['config']['resnet']['num_blocks'],
+            consts=consts).eval()
+        dqn = DQN(version=state['config']['control']['version'], consts=consts).eval()
+    mortal.load_state_dict(state['mortal'], assign=True)
+    dqn.load_state_dict(state['current_dqn'], assign=True)
+
+    net = None
+    if backend == BACKEND_TORCHSCRIPT:
+        try:
+            net = compile_mortal(mortal, dqn, device)
+            if not check_parity(mortal.to(device), dqn.to(device), net, device):
+                LOGGER.warning("Compiled model results differ from eager model. Using eager backend")
+                net = None
+        except Exception as e:
+            LOGGER.warning("Failed to compile model, using eager backend: %s", e, exc_info=True)
+            net = None
+    elif backend == BACKEND_INT8:
+        if device.type == 'cpu':
+            net = get_quantized(model_file, mortal, dqn)
+            if net is None:
+                LOGGER.warning("Quantized model not available, using eager backend")
+        else:
+            LOGGER.info("Int8 backend is for CPU only, using eager backend on %s", device)
 
     engine = MortalEngine(
         mortal,
@@ -118,8 +162,9 @@ def get_engine(model_file:str) -> MortalEngine:
         device = device,
         enable_amp = False,
         enable_quick_eval = False,
-        enable_rule_based_agari_guard = False,
-        name = 'mortal',
+        net = net,
+        enable_rule_based_agari_guard = is_3p,
+        name = 'mortal_3p' if is_3p else 'mortal',
         version = state['config']['control']['version'],
     )
 
@@ -1,4 +1,7 @@
-""" Model related classes that support Mortal engine """
+""" Model related classes that support Mortal engine
+Brain and DQN take the libriichi consts module of the game mode (libriichi for 4p, libriichi3p for 3p)
+for observation shape and action space, so the same classes serve 4p and 3p models.
+"""
 #pylint:disable=no-member, C0115, C0116
 from itertools import permutations
 from functools import partial
@@ -112,14 +115,15 @@ class ResNet(nn.Module):
         return self.net(x)
 
 class Brain(nn.Module):
-    def __init__(self, *, conv_channels, num_blocks, is_oracle=False, version=1):
+    def __init__(self, *, conv_channels, num_blocks, is_oracle=False, version=1, consts=None):
         super().__init__()
         self.is_oracle = is_oracle
         self.version = version
+        consts = consts or libriichi.consts
 
-        in_channels = libriichi.consts.obs_shape(version)[0]
+        in_channels = consts.obs_shape(version)[0]
         if is_oracle:
-            in_channels += libriichi.consts.oracle_obs_shape(version)[0]
+            in_channels += consts.oracle_obs_shape(version)[0]
 
         norm_builder = partial(nn.BatchNorm1d, conv_channels, momentum=0.01)
         actv_builder = partial(nn.Mish, inplace=True)
@@ -201,13 +205,14 @@ class AuxNet(nn.Module):
         return self.net(x).split(self.dims, dim=-1)
 
 class DQN(nn.Module):
-    def __init__(self, *, version=1):
+    def __init__(self, *, version=1, consts=None):
         super().__init__()
         self.version = version
+        self.action_space = (consts or libriichi.consts).ACTION_SPACE
         match version:
             case 1:
                 self.v_head = nn.Linear(512, 1)
-                self.a_head = nn.Linear(512, libriichi.consts.ACTION_SPACE)
+                self.a_head = nn.Linear(512, self.action_space)
             case 2 | 3:
                 hidden_size = 512 if version == 2 else 256
                 self.v_head = nn.Sequential(
@@ -218,15 +223,15 @@ class DQN(nn.Module):
                 self.a_head = nn.Sequential(
                     nn.Linear(1024, hidden_size),
                     nn.Mish(inplace=True),
-                    nn.Linear(hidden_size, libriichi.consts.ACTION_SPACE),
+                    nn.Linear(hidden_size, self.action_space),
                 )
             case 4:
-                self.net = nn.Linear(1024, 1 + libriichi.consts.ACTION_SPACE)
+                self.net = nn.Linear(1024, 1 + self.action_space)
                 nn.init.constant_(self.net.bias, 0)
 
     def forward(self, phi, mask):
         if self.version == 4:
-            v, a = self.net(phi).split((1, libriichi.consts.ACTION_SPACE), dim=-1)
+            v, a = self.net(phi).split((1, self.action_space), dim=-1)
         else:
             v = self.v_head(phi)
             a = self.a_head(phi)
@@ -0,0 +1,246 @@
+""" Int8 quantized inference backend for Mortal engine (CPU)
+BatchNorm layers are folded into the preceding Conv1d weights, the Conv1d stack is statically quantized
+(FX graph mode, activation ranges calibrated on observations), and Linear layers are dynamically quantized.
+Ops without int8 kernels (Mish, channel attention pooling) stay in fp32 between quant/dequant.
+Static quantization needs recorded game observations (replay.py --record-obs), saved next to the model file as
+<model_file>.obs.npz: half of them calibrate the activation ranges, the other half check the action agreement.
+Random observations have very different activations, so without a recorded corpus only Linear layers are
+(dynamically) quantized.
+The result is traced to TorchScript and cached next to the model file (<model_file>.int8.pt).
+The quantized module is checked against the fp32 modules before use, and the eager path is kept if
+the action agreement is too low.
+
+Usage: python -m bot.local.quantized <model_file> [--corpus obs.npz] [--calib obs.npz] [--3p]
+    compare int8 vs fp32 backend (latency, model memory, action agreement)
+"""
+import io
+import copy
+import json
+import warnings
+import argparse
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch import nn
+from torch.ao.quantization import QConfigMapping, get_default_qconfig, quantize_dynamic
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+from common.log_helper import LOGGER
+from bot.local.corpus import ObsCorpus
+from bot.local.compiled import MortalNet, fold_batchnorm, model_io_shapes, q_values, compare_q, _latency
+
+CACHE_SUFFIX = '.int8.pt'
+CORPUS_SUFFIX = '.obs.npz'  # recorded observations next to the model file, for calibration and checking
+CACHE_VERSION = 2           # bump when quantization recipe changes, to invalidate cached files
+MIN_AGREEMENT = 0.9         # min action agreement with fp32 model to accept the quantized model
+CHECK_SIZE = 64             # number of synthetic observations for checking dynamic-only quantization
+
+
+def _calibrate(net:nn.Module, corpus:ObsCorpus, batch_size:int=16):
+    """ run observations through prepared model to record activation ranges"""
+    with torch.inference_mode():
+        for i in range(0, len(corpus), batch_size):
+            net(torch.as_tensor(np.stack(corpus.obs[i:i+batch_size])),
+                torch.as_tensor(np.stack(corpus.masks[i:i+batch_size])))
+
+
+def quantize_mortal(brain:nn.Module, dqn:nn.Module, calib:ObsCorpus=None) -> torch.jit.ScriptModule:
+    """ build int8 TorchScript module of Brain -> DQN on CPU (original modules are not changed)
+    params:
+        brain, dqn: fp32 Mortal modules
+        calib(ObsCorpus): recorded observations for calibrating conv activation ranges.
+            None to quantize Linear layers only (dynamic quantization, no calibration)
+    returns:
+        ScriptModule: (obs, masks) -> q values"""
+    obs_shape, action_space = model_io_shapes(brain, dqn)
+    net = MortalNet(copy.deepcopy(brain).cpu(), copy.deepcopy(dqn).cpu()).eval()
+    n_folded = fold_batchnorm(net)
+    example = (torch.zeros((1, *obs_shape)), torch.ones((1, action_space), dtype=torch.bool))
+
+    # qconfig by module name: Conv1d stack, and ReLU right after Conv1d (version 1/2 models) which is fused
+    # with it and must share the qconfig. Linear (-> ReLU) is left to dynamic quantization
+    qconfig = get_default_qconfig(torch.backends.quantized.engine)
+    qconfig_mapping = QConfigMapping()
+    for name, module in net.brain.encoder.named_modules(prefix='brain.encoder'):
+        if isinstance(module, nn.Conv1d) or (isinstance(module, nn.ReLU) and '.shared_mlp.' not in name):
+            qconfig_mapping.set_module_name(name, qconfig)
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter("ignore")     # FX/jit deprecation and observer warnings in newer torch
+        if calib is not None:
+            prepared = prepare_fx(net, qconfig_mapping, example)
+            _calibrate(prepared, calib)
+            quantized = convert_fx(prepared)
+        else:
+            quantized = net
+        quantized = quantize_dynamic(quantized, {nn.Linear}, dtype=torch.qint8)
+        traced = torch.jit.freeze(torch.jit.trace(quantized, example, check_trace=False))   # agreement checked after
+    LOGGER.debug("Quantized Mortal model: %d BatchNorm layers folded, conv %s", n_folded,
+        "int8 (calibrated)" if calib is not None else "fp32")
+    return traced
+
+
+def _cache_key(model_file:str) -> dict:
+    """ identity of the source model file and corpus, stored in the cached file"""
+    stat = Path(model_file).stat()
+    corpus_file = corpus_file_of(model_file)
+    corpus_stat = corpus_file.stat() if corpus_file.exists() else None
+    return {
+        'version': CACHE_VERSION,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'corpus': [corpus_stat.st_size, corpus_stat.st_mtime_ns] if corpus_stat else None,
+        'torch': torch.__version__,
+        'qengine': torch.backends.quantized.engine,
+    }
+
+
+def corpus_file_of(model_file:str) -> Path:
+    """ return recorded observation corpus path for model file"""
+    return Path(str(model_file) + CORPUS_SUFFIX)
+
+
+def load_corpus(model_file:str) -> ObsCorpus | None:
+    """ load recorded observation corpus next to model file, None if there is none (or it fails to load)"""
+    corpus_file = corpus_file_of(model_file)
+    if not corpus_file.exists():
+        return None
+    try:
+        corpus = ObsCorpus.load(str(corpus_file))
+    except Exception as e:      # pylint: disable=broad-except
+        LOGGER.warning("Failed to load observation corpus %s: %s", corpus_file, e)
+        return None
+    if len(corpus) < 2:
+        LOGGER.warning("Observation corpus %s is too small (%d)", corpus_file, len(corpus))
+        return None
+    return corpus
+
+
+def cache_file_of(model_file:str) -> Path:
+    """ return cache file path for model file"""
+    return Path(str(model_file) + CACHE_SUFFIX)
+
+
+def load_cached(model_file:str) -> torch.jit.ScriptModule | None:
+    """ load cached quantized module for model file, None if no valid cache"""
+    cache_file = cache_file_of(model_file)
+    if not cache_file.exists():
+        return None
+    extra = {'source.json': ''}
+    try:
+        net = torch.jit.load(str(cache_file), map_location='cpu', _extra_files=extra)
+        if json.loads(extra['source.json']) != _cache_key(model_file):
+            LOGGER.info("Quantized model cache is outdated: %s", cache_file)
+            return None
+    except Exception as e:      # pylint: disable=broad-except
+        LOGGER.warning("Failed to load quantized model cache %s: %s", cache_file, e)
+        return None
+    LOGGER.info("Loaded quantized model from cache: %s", cache_file)
+    return net
+
+
+def save_cache(model_file:str, net:torch.jit.ScriptModule):
+    """ save quantized module next to model file. failure is logged and ignored (e.g. read-only folder)"""
+    cache_file = cache_file_of(model_file)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", FutureWarning)     # jit deprecation warnings in newer torch
+            torch.jit.save(net, str(cache_file), _extra_files={'source.json': json.dumps(_cache_key(model_file))})
+        LOGGER.info("Saved quantized model cache: %s", cache_file)
+    except Exception as e:      # pylint: disable=broad-except
+        LOGGER.warning("Failed to save quantized model cache %s: %s", cache_file, e)
+
+
+def check_agreement(brain:nn.Module, dqn:nn.Module, quantized:nn.Module,
+    corpus:ObsCorpus=None, min_agreement:float=MIN_AGREEMENT) -> bool:
+    """ check quantized module against fp32 modules over corpus (synthetic if None, only meaningful for
+    dynamic-only quantization). returns True if action agreement rate >= min_agreement"""
+    if corpus is None:
+        corpus = ObsCorpus.synthetic(*model_io_shapes(brain, dqn), n=CHECK_SIZE, seed=1)
+    device = torch.device('cpu')
+    fp32 = MortalNet(copy.deepcopy(brain).cpu(), copy.deepcopy(dqn).cpu()).eval()
+    max_diff, agreement = compare_q(q_values(fp32, corpus, device), q_values(quantized, corpus, device))
+    LOGGER.debug("Quantized model check: max q diff=%.2e, action agreement=%.3f", max_diff, agreement)
+    return agreement >= min_agreement
+
+
+def get_quantized(model_file:str, brain:nn.Module, dqn:nn.Module) -> torch.jit.ScriptModule | None:
+    """ return quantized module for model file, from cache or newly built (and cached).
+    Conv layers are quantized only if a recorded corpus is next to the model file (see module doc).
+    None if quantization fails or does not agree with the fp32 model"""
+    net = load_cached(model_file)
+    if net is not None:
+        return net
+    corpus = load_corpus(model_file)
+    calib = check = None
+    if corpus is not None:
+        half = len(corpus) // 2
+        calib = ObsCorpus(corpus.obs[:half], corpus.masks[:half])
+        check = ObsCorpus(corpus.obs[half:], corpus.masks[half:])
+        LOGGER.info("Quantizing model %s with %d recorded observations (cached for later runs)",
+            model_file, len(corpus))
+    else:
+        LOGGER.info("No recorded observations (%s), quantizing Linear layers only (cached for later runs)",
+            corpus_file_of(model_file))
+    try:
+        net = quantize_mortal(brain, dqn, calib)
+    except Exception as e:      # pylint: disable=broad-except
+        LOGGER.warning("Failed to quantize model: %s", e, exc_info=True)
+        return None
+    if not check_agreement(brain, dqn, net, check):
+        LOGGER.warning("Quantized model actions differ too much from fp32 model")
+        return None
+    save_cache(model_file, net)
+    return net
+
+
+def model_bytes(net:nn.Module) -> int:
+    """ serialized size of the module weights (bytes)"""
+    buf = io.BytesIO()
+    if isinstance(net, torch.jit.ScriptModule):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", FutureWarning)
+            torch.jit.save(net, buf)
+    else:
+        torch.save(net.state_dict(), buf)
+    return buf.getbuffer().nbytes
+
+
+def main():
+    """ compare int8 vs fp32 backend on a model file"""
+    parser = argparse.ArgumentParser(description="Verify and benchmark int8 quantized Mortal backend")
+    parser.add_argument("model_file", help="Mortal model file (.pth)")
+    parser.add_argument("--corpus", help="recorded observation corpus (.npz). random observations if not given")
+    parser.add_argument("--calib", help="recorded observation corpus (.npz) for calibration. "
+        "Linear layers only if not given")
+    parser.add_argument("--3p", dest="is_3p", action="store_true", help="model is for 3p")
+    args = parser.parse_args()
+
+    # pylint: disable=import-outside-toplevel
+    if args.is_3p:
+        from bot.local.engine3p import get_engine
+    else:
+        from bot.local.engine import get_engine
+    engine = get_engine(args.model_file)
+    device = torch.device('cpu')
+    brain, dqn = engine.brain.cpu(), engine.dqn.cpu()
+    shapes = model_io_shapes(brain, dqn)
+    corpus = ObsCorpus.load(args.corpus) if args.corpus else ObsCorpus.synthetic(*shapes, n=256)
+    calib = ObsCorpus.load(args.calib) if args.calib else None
+    fp32 = MortalNet(brain, dqn).eval()
+    int8 = quantize_mortal(brain, dqn, calib)
+
+    max_diff, agreement = compare_q(q_values(fp32, corpus, device), q_values(int8, corpus, device))
+    print(f"Corpus: {len(corpus)} observations, quantized engine: {torch.backends.quantized.engine}")
+    print(f"Max q diff: {max_diff:.3e}")
+    print(f"Action agreement: {agreement*100:.2f}% (min {MIN_AGREEMENT*100:.0f}%) -> "
+        f"{'PASS' if agreement >= MIN_AGREEMENT else 'FAIL'}")
+    m_fp32, m_int8 = model_bytes(fp32), model_bytes(int8)
+    print(f"Model memory: fp32 {m_fp32/2**20:.1f}MB, int8 {m_int8/2**20:.1f}MB, ratio {m_fp32/m_int8:.2f}x")
+    t_fp32 = _latency(fp32, corpus, device)
+    t_int8 = _latency(int8, corpus, device)
+    print(f"Latency (batch=1): fp32 {t_fp32*1000:.3f}ms, int8 {t_int8*1000:.3f}ms, speedup {t_fp32/t_int8:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
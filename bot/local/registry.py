@@ -0,0 +1,204 @@
+""" Process-wide registry of loaded Mortal engines
+Engines are reused across bot re-creation (e.g. settings changes), keyed by model content hash, mode and backend.
+Model files are identified by path + size + mtime, and their content hash is remembered, so unchanged files
+are not read again.
+For fast cold start, the model weights are kept in a weights-only artifact next to the model file
+(<model_file>.weights.pt), which is memory-mapped on load instead of unpickling the full checkpoint.
+Identical tensors across loaded checkpoints (e.g. 4p and 3p models sharing layers) share one storage (WeightPool).
+"""
+import hashlib
+import weakref
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import torch
+
+from common.log_helper import LOGGER
+from common.utils import GameMode, BACKEND_EAGER
+from bot.local.engine import get_engine
+
+ARTIFACT_SUFFIX = '.weights.pt'
+ARTIFACT_VERSION = 1
+STATE_KEYS = ('config', 'mortal', 'current_dqn')     # checkpoint entries needed for inference
+MAX_ENGINES = 4             # max number of engines kept in the registry (least recently used are dropped)
+
+
+@dataclass(frozen=True)
+class ModelFileId:
+    """ identity of a model file"""
+    path:str
+    size:int
+    mtime_ns:int
+    sha256:str
+
+
+def file_sha256(file:str) -> str:
+    """ return sha256 hex digest of file content"""
+    h = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def tensor_fingerprint(t:torch.Tensor) -> tuple:
+    """ cheap key for finding identical tensors: dtype, shape and the first/last elements.
+    Tensors with equal fingerprints are compared in full before sharing"""
+    flat = t.detach().reshape(-1)
+    return (t.dtype, tuple(t.shape), t.device.type, bytes(flat[:16].cpu().numpy()), bytes(flat[-16:].cpu().numpy()))
+
+
+class WeightPool:
+    """ Share storage of identical tensors between loaded models.
+    Holds weak refs to the tensors of loaded modules, so pooled tensors go away with their models"""
+    def __init__(self):
+        self._tensors:weakref.WeakValueDictionary[tuple, torch.Tensor] = weakref.WeakValueDictionary()
+        self.shared_tensors = 0     # number of tensors replaced by a pooled one
+        self.saved_bytes = 0        # memory saved by sharing
+
+    def share(self, state_dict:dict[str, torch.Tensor]) -> tuple[dict[str, torch.Tensor], int]:
+        """ return (state dict with tensors replaced by identical pooled ones, bytes saved)"""
+        saved = 0
+        result = {}
+        for name, t in state_dict.items():
+            pooled = self._tensors.get(tensor_fingerprint(t))
+            if pooled is not None and torch.equal(pooled, t):
+                t = pooled
+                saved += t.nelement() * t.element_size()
+                self.shared_tensors += 1
+            result[name] = t
+        self.saved_bytes += saved
+        return result, saved
+
+    def add(self, module:torch.nn.Module):
+        """ add parameters and buffers of a loaded module to the pool"""
+        for t in module.state_dict(keep_vars=True).values():
+            self._tensors.setdefault(tensor_fingerprint(t), t)
+
+
+def artifact_file_of(model_file:str) -> Path:
+    """ return weights artifact file path for model file"""
+    return Path(str(model_file) + ARTIFACT_SUFFIX)
+
+
+class ModelRegistry:
+    """ Thread-safe cache of Mortal engines and model file identities"""
+
+    def __init__(self, max_engines:int=MAX_ENGINES):
+        """ params:
+            max_engines(int): max number of engines to keep"""
+        self.max_engines = max_engines
+        self._lock = threading.RLock()
+        self._file_ids:dict[tuple[str, int, int], ModelFileId] = {}     # (path, size, mtime_ns) -> id
+        self._engines:OrderedDict[tuple, object] = OrderedDict()        # (mode, sha256, backend) -> engine
+        self.pool = WeightPool()
+        self.hits = 0
+        self.misses = 0
+
+    def get_engine(self, model_file:str, mode:GameMode, backend:str=BACKEND_EAGER):
+        """ return MortalEngine for model file, reusing the loaded engine if the model content is unchanged
+        params:
+            model_file(str): Mortal model file path
+            mode(GameMode): game mode the model is for
+            backend(str): inference backend, one of utils.LOCAL_MODEL_BACKENDS
+        returns:
+            MortalEngine: engine for 4p or 3p"""
+        with self._lock:
+            file_id, state = self._identify(model_file)
+            key = (mode, file_id.sha256, backend)
+            engine = self._engines.get(key)
+            if engine is not None:
+                self._engines.move_to_end(key)
+                self.hits += 1
+                LOGGER.info("Reusing loaded %s engine for %s (%s)", mode.value, model_file, backend)
+                return engine
+
+            self.misses += 1
+            if state is None:
+                state = self._load_artifact(model_file)
+                if state is None or state['source']['sha256'] != file_id.sha256:
+                    state = self._load_state(model_file, file_id)
+            state = self._share_weights(state)
+            engine = get_engine(model_file, backend, state, is_3p=(mode == GameMode.MJ3P))
+            self.pool.add(engine.brain)
+            self.pool.add(engine.dqn)
+            self._engines[key] = engine
+            while len(self._engines) > self.max_engines:
+                self._engines.popitem(last=False)
+            return engine
+
+    def _share_weights(self, state:dict) -> dict:
+        """ share identical weight tensors with already loaded models"""
+        state = dict(state)
+        saved = 0
+        for k in ('mortal', 'current_dqn'):
+            state[k], n_bytes = self.pool.share(state[k])
+            saved += n_bytes
+        if saved:
+            LOGGER.info("Model weights shared with loaded models: %.1f MB saved (total %.1f MB)",
+                saved / 2**20, self.pool.saved_bytes / 2**20)
+        return state
+
+    def clear(self):
+        """ drop all cached engines and file ids"""
+        with self._lock:
+            self._engines.clear()
+            self._file_ids.clear()
+
+    def _identify(self, model_file:str) -> tuple[ModelFileId, dict | None]:
+        """ return file id of model file, and the artifact state if the artifact was loaded to identify it.
+        The file is only hashed if neither memory nor artifact knows its (size, mtime)"""
+        path = str(Path(model_file).resolve())
+        stat = Path(path).stat()
+        stat_key = (path, stat.st_size, stat.st_mtime_ns)
+        file_id = self._file_ids.get(stat_key)
+        if file_id is not None:
+            return file_id, None
+
+        state = self._load_artifact(model_file)
+        source = state['source'] if state is not None else None
+        if source is not None and source['size'] == stat.st_size and source['mtime_ns'] == stat.st_mtime_ns:
+            file_id = ModelFileId(path, stat.st_size, stat.st_mtime_ns, source['sha256'])
+        else:
+            file_id = ModelFileId(path, stat.st_size, stat.st_mtime_ns, file_sha256(path))
+            if state is not None and state['source']['sha256'] != file_id.sha256:
+                state = None        # model file replaced, artifact is outdated
+        self._file_ids[stat_key] = file_id
+        return file_id, state
+
+    def _load_artifact(self, model_file:str) -> dict | None:
+        """ load weights artifact (memory-mapped), None if not available"""
+        artifact_file = artifact_file_of(model_file)
+        if not artifact_file.exists():
+            return None
+        try:
+            state = torch.load(artifact_file, map_location='cpu', mmap=True, weights_only=True)
+            if state.get('version') != ARTIFACT_VERSION:
+                return None
+            return state
+        except Exception as e:      # pylint: disable=broad-except
+            LOGGER.warning("Failed to load model artifact %s: %s", artifact_file, e)
+            return None
+
+    def _load_state(self, model_file:str, file_id:ModelFileId) -> dict:
+        """ load full checkpoint and write weights artifact for next cold start"""
+        LOGGER.info("Loading model file %s", model_file)
+        checkpoint = torch.load(model_file, map_location='cpu')
+        state = {k: checkpoint[k] for k in STATE_KEYS}
+        artifact = {
+            'version': ARTIFACT_VERSION,
+            'source': {'size': file_id.size, 'mtime_ns': file_id.mtime_ns, 'sha256': file_id.sha256},
+            **state,
+        }
+        artifact_file = artifact_file_of(model_file)
+        try:
+            torch.save(artifact, artifact_file)
+            LOGGER.info("Saved model artifact: %s", artifact_file)
+        except Exception as e:      # pylint: disable=broad-except
+            LOGGER.warning("Failed to save model artifact %s: %s", artifact_file, e)
+        return state
+
+
+MODEL_REGISTRY = ModelRegistry()
@@ -0,0 +1,218 @@
+""" Out-of-process Mortal inference worker
+The worker process holds the Mortal engines and the libriichi mjai bot state, so torch inference does not
+hold the GIL in the main process (mitm, GUI and browser threads).
+BotMortalWorker talks to the worker through a pipe. If the worker crashes or hangs, it is restarted and
+the mjai bot state is rebuilt by replaying the game's input history (warm restart).
+"""
+import weakref
+import threading
+import multiprocessing as mp
+from multiprocessing.connection import Connection
+
+from common.utils import LocalModelException, BACKEND_EAGER
+from common.log_helper import LOGGER
+from bot.bot import BotMjai, GameMode
+
+# pipe protocol: request (cmd, *args) -> response (status, result)
+CMD_INIT = 'init'           # (CMD_INIT, seat, mode value, speculative) -> None
+CMD_REACT = 'react'         # (CMD_REACT, [mjai msg dicts], can_act) -> reaction dict | None (see BotMjai.react_msgs)
+CMD_FEED = 'feed'           # (CMD_FEED, [pending mjai msg dicts]) -> None (see Bot.feed_ahead)
+CMD_STOP = 'stop'           # (CMD_STOP,) -> no response, worker exits
+STATUS_OK = 'ok'
+STATUS_ERR = 'err'
+
+READY_TIMEOUT = 180         # seconds to wait for worker loading models
+REACT_TIMEOUT = 30          # seconds before a react request is considered hanging
+MAX_RESTARTS = 3            # max consecutive restarts for one request
+
+
+def _worker_main(conn:Connection, model_files:dict[str, str], backend:str):
+    """ worker process entry: load engines and serve requests until stopped or pipe closed"""
+    # pylint: disable=import-outside-toplevel
+    from bot.local.bot_local import BotMortalLocal
+    try:
+        bot = BotMortalLocal({GameMode(k): v for k, v in model_files.items()}, backend)
+    except Exception as e:      # pylint: disable=broad-except
+        conn.send((STATUS_ERR, repr(e)))
+        return
+    conn.send((STATUS_OK, [m.value for m in bot.supported_modes]))
+
+    while True:
+        try:
+            req = conn.recv()
+        except EOFError:        # parent is gone
+            return
+        cmd = req[0]
+        try:
+            res = None
+            if cmd == CMD_REACT:      # reach lookahead and speculation run in the worker, same as BotMortalLocal
+                res = bot.react_msgs(req[1], req[2])
+            elif cmd == CMD_FEED:
+                bot.feed_ahead(req[1])
+            elif cmd == CMD_INIT:
+                bot.speculative = req[3]
+                bot.init_bot(req[1], GameMode(req[2]))
+            elif cmd == CMD_STOP:
+                return
+            else:
+                raise ValueError(f"Unknown worker command: {cmd}")
+            conn.send((STATUS_OK, res))
+        except Exception as e:  # pylint: disable=broad-except
+            conn.send((STATUS_ERR, repr(e)))
+
+
+class WorkerError(Exception):
+    """ worker process crashed, hung or failed to start"""
+
+
+class _WorkerMjaiBot:
+    """ proxy for libriichi mjai.Bot that lives in the worker process"""
+    def __init__(self, owner:'BotMortalWorker'):
+        self._owner = weakref.ref(owner)   # no ref cycle, so the worker stops as soon as the bot is dropped
+
+    def react_msgs(self, msgs:list[dict], can_act:bool=True) -> dict | None:
+        """ same as BotMjai.react_msgs"""
+        return self._owner().worker_react(msgs, can_act)
+
+
+class BotMortalWorker(BotMjai):
+    """ Local Mortal bot running inference in a persistent worker process"""
+    def __init__(self, model_files:dict[GameMode, str], backend:str=BACKEND_EAGER) -> None:
+        """ params:
+        model_files(dict): model files for different modes {mode, file_path}
+        backend(str): inference backend, one of utils.LOCAL_MODEL_BACKENDS
+        """
+        super().__init__("Local Mortal Bot (Worker)")
+        self.model_files = model_files
+        self.backend = backend
+        self._supported_modes:list[GameMode] = []
+        self._lock = threading.Lock()           # one request at a time on the pipe
+        self._proc:mp.Process = None
+        self._conn:Connection = None
+        self._mode:GameMode = None
+        self._history:list[dict] = []           # mjai msgs fed since init, for rebuilding state on restart
+        self.n_restarts:int = 0
+        self._start_worker()
+
+    @property
+    def supported_modes(self) -> list[GameMode]:
+        return self._supported_modes
+
+    @property
+    def info_str(self) -> str:
+        info = super().info_str
+        if self.n_restarts:
+            info += f" (restarts: {self.n_restarts})"
+        return info
+
+    def _start_worker(self):
+        """ start worker process and wait for models to load"""
+        ctx = mp.get_context('spawn')
+        parent_conn, child_conn = ctx.Pipe()
+        model_files = {k.value: str(v) for k, v in self.model_files.items()}
+        self._proc = ctx.Process(
+            target=_worker_main, args=(child_conn, model_files, self.backend), name="MortalWorker", daemon=True)
+        self._proc.start()
+        child_conn.close()
+        self._conn = parent_conn
+        try:
+            status, res = self._recv(READY_TIMEOUT)
+        except WorkerError as e:
+            self.stop_worker()
+            raise LocalModelException(f"Mortal worker failed to start: {e}") from e
+        if status != STATUS_OK:
+            self.stop_worker()
+            raise LocalModelException(f"Mortal worker failed to load models: {res}")
+        self._supported_modes = [GameMode(m) for m in res]
+        if not self._supported_modes:
+            self.stop_worker()
+            raise LocalModelException("No valid model files found")
+        LOGGER.info("Mortal worker started (pid=%s), modes=%s", self._proc.pid, self._supported_modes)
+
+    def stop_worker(self):
+        """ stop the worker process"""
+        if self._conn:
+            try:
+                self._conn.send((CMD_STOP,))
+            except (OSError, ValueError):
+                pass
+            self._conn.close()
+            self._conn = None
+        if self._proc:
+            self._proc.join(1)
+            if self._proc.is_alive():
+                self._proc.kill()
+                self._proc.join()
+            self._proc = None
+
+    def __del__(self):
+        self.stop_worker()
+
+    def _recv(self, timeout:float):
+        """ receive a response, raise WorkerError if worker died or timed out"""
+        try:
+            if not self._conn.poll(timeout):
+                raise WorkerError(f"no response in {timeout}s")
+            return self._conn.recv()
+        except (EOFError, OSError) as e:
+            raise WorkerError(f"worker pipe broken: {e!r}") from e
+
+    def _request(self, *req, timeout:float=REACT_TIMEOUT):
+        """ send request and return result. raise WorkerError on crash/hang, RuntimeError on worker exception"""
+        try:
+            self._conn.send(req)
+        except (OSError, ValueError) as e:
+            raise WorkerError(f"worker pipe broken: {e!r}") from e
+        status, res = self._recv(timeout)
+        if status != STATUS_OK:
+            raise RuntimeError(f"Mortal worker error: {res}")
+        return res
+
+    def _restart_worker(self):
+        """ restart worker and rebuild mjai bot state by replaying the input history"""
+        self.n_restarts += 1
+        LOGGER.warning("Restarting Mortal worker (restart #%d), replaying %d msgs", self.n_restarts, len(self._history))
+        self.stop_worker()
+        self._start_worker()
+        if self._mode is None:
+            return
+        self._request(CMD_INIT, self.seat, self._mode.value, self.speculative)
+        self._request(CMD_REACT, self._history, False)     # only update state
+
+    def _request_with_restart(self, *req):
+        """ send request, restarting the worker on crash/hang. Must hold self._lock"""
+        need_restart = False
+        for _ in range(MAX_RESTARTS + 1):
+            try:
+                if need_restart:
+                    self._restart_worker()
+                return self._request(*req)
+            except WorkerError as e:
+                LOGGER.error("Mortal worker error on %s: %s", req[0], e)
+                need_restart = True
+        raise LocalModelException("Mortal worker keeps failing")
+
+    def _get_engine(self, mode:GameMode):
+        # the engine lives in the worker process (see _worker_main). the mjai bot here is a proxy
+        return None
+
+    def _init_bot_impl(self, mode:GameMode=GameMode.MJ4P):
+        with self._lock:
+            self._mode = None
+            self._history = []
+            self._request_with_restart(CMD_INIT, self.seat, mode.value, self.speculative)
+            self._mode = mode
+        self.mjai_bot = _WorkerMjaiBot(self)
+
+    def worker_react(self, msgs:list[dict], can_act:bool=True) -> dict | None:
+        """ feed mjai msgs to the worker bot in one request and return the reaction. restart the worker if it crashes"""
+        with self._lock:
+            res = self._request_with_restart(CMD_REACT, msgs, can_act)
+            self._history.extend(msgs)
+            return res
+
+    def feed_ahead(self, input_list:list[dict]):
+        if not self.speculative:        # only the speculator in the worker uses msgs fed ahead
+            return
+        with self._lock:
+            self._request_with_restart(CMD_FEED, input_list)
@@ -0,0 +1,113 @@
+""" Non-destructive reach lookahead for libriichi mjai bots
+When the bot decides to reach, the discard after reach ('reach_dahai') is needed at once, but feeding the reach
+msg to the bot would commit its state before the game confirms the reach.
+libriichi bots can't be copied, so the post-reach state is evaluated on a clone: a new bot fed with the game's
+input history (can_act=False) and then the reach msg. When reach is an option of the decision, the clone's model
+input is computed in the same batched forward pass as the main decision.
+"""
+from typing import Callable
+
+from common.mj_helper import MjaiType, MJAI_MASK_LIST
+from bot.mjai_codec import encode_msg, no_act_line, decode_reaction
+
+REACH_INDEX = MJAI_MASK_LIST.index('reach')     # same index in 3p mask list
+
+
+class _ForwardEngine:
+    """ engine for clone bots: forwards react_batch to a function"""
+    def __init__(self, engine, react_batch:Callable):
+        self._engine = engine
+        self.react_batch = react_batch
+
+    def __getattr__(self, name):
+        return getattr(self._engine, name)
+
+
+class _LookaheadEngine:
+    """ engine wrapper for the main bot: decisions with reach option also compute the post-reach discard"""
+    def __init__(self, engine, owner:'LookaheadBot'):
+        self._engine = engine
+        self._owner = owner
+
+    def __getattr__(self, name):
+        return getattr(self._engine, name)
+
+    def react_batch(self, obs, masks, invisible_obs):
+        """ same as MortalEngine.react_batch"""
+        if len(obs) == 1 and masks[0][REACH_INDEX]:
+            return self._owner.react_with_reach(obs, masks, invisible_obs)
+        return self._engine.react_batch(obs, masks, invisible_obs)
+
+
+class LookaheadBot:
+    """ Wrapper of libriichi mjai.Bot taking and returning mjai msg dicts (see mjai_codec.py).
+    Self reach reactions get 'reach_dahai' attached, computed without changing the bot state"""
+    def __init__(self, new_bot:Callable, engine, seat:int):
+        """ params:
+            new_bot(Callable): (engine) -> new libriichi mjai.Bot for the same seat and mode
+            engine: MortalEngine of the bot
+            seat(int): seat of the bot"""
+        self._new_bot = new_bot
+        self._engine = engine
+        self.seat = seat
+        self._start_game:str = None         # start_game input line (can_act=False)
+        self._history:list[str] = []        # input lines of current kyoku (can_act=False)
+        self._current:str = None            # current input line with can_act=False
+        self._reach_dahai:str = None        # reach dahai computed along with the current decision
+        self.bot = new_bot(_LookaheadEngine(engine, self))
+
+    def react_msgs(self, msgs:list[dict], can_act:bool=True) -> dict | None:
+        """ feed mjai msgs to the bot and return the reaction to the last one (None if no reaction).
+        msgs before the last one only update the bot state (can_act=False)
+        params:
+            msgs(list[dict]): mjai msgs
+            can_act(bool): False to only update bot state with the last msg as well"""
+        reaction = None
+        for i, msg in enumerate(msgs):
+            reaction = self._react(msg, can_act and i == len(msgs) - 1)
+        return reaction
+
+    def _react(self, msg:dict, can_act:bool) -> dict | None:
+        line = encode_msg(msg, can_act)
+        self._current = no_act_line(line)
+        msg_type = msg['type']
+        if msg_type == MjaiType.START_GAME:
+            self._start_game = self._current
+            self._history = []
+        elif msg_type == MjaiType.START_KYOKU:
+            self._history = []
+        self._reach_dahai = None
+        try:
+            react_str = self.bot.react(line)
+        finally:
+            if msg_type != MjaiType.START_GAME:
+                self._history.append(self._current)
+        reaction = decode_reaction(react_str)
+        if reaction and reaction['type'] == MjaiType.REACH and reaction['actor'] == self.seat:
+            reaction['reach_dahai'] = decode_reaction(self._reach_dahai or self._clone_react(self._engine))
+        return reaction
+
+    def react_with_reach(self, obs, masks, invisible_obs):
+        """ compute decision (obs, masks) and the decision after reach on a clone in one batch.
+        returns the result for the decision, keeps the reach dahai for react()"""
+        results = []
+        def forward(r_obs, r_masks, r_invisible_obs):
+            inv = None if invisible_obs is None or r_invisible_obs is None else [*invisible_obs, *r_invisible_obs]
+            out = self._engine.react_batch([*obs, *r_obs], [*masks, *r_masks], inv)
+            results.append(tuple(x[:len(obs)] for x in out))
+            return tuple(x[len(obs):] for x in out)
+        self._reach_dahai = self._clone_react(_ForwardEngine(self._engine, forward), [self._current])
+        if results:
+            return results[0]
+        return self._engine.react_batch(obs, masks, invisible_obs)    # clone made no decision after reach
+
+    def _clone_react(self, engine, extra_lines:list[str]=()) -> str | None:
+        """ feed history (+ extra lines) and self reach msg to a new bot, return its reaction"""
+        bot = self._new_bot(engine)
+        if self._start_game:
+            bot.react(self._start_game)
+        for line in self._history:
+            bot.react(line)
+        for line in extra_lines:
+            bot.react(line)
+        return bot.react(encode_msg({'type': MjaiType.REACH, 'actor': self.seat}))
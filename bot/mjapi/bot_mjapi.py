@@ -1,6 +1,12 @@
-""" Bot for mjapi"""
+""" Bot for mjapi
+In streaming mode (settings mjapi_stream), msgs that need no decision are sent to MJAPI (can_act=False) in a
+background thread as soon as the game produces them (feed_ahead), so at a decision point only the new msgs are
+sent. All MJAPI requests run in order in that one thread, so seq numbers stay in order. If a streamed request
+fails, the msgs are still recorded, and the bot state is restored (restart + replay) at the next decision."""
 
 import time
+import random
+from concurrent.futures import ThreadPoolExecutor
 from common.settings import Settings
 from common.log_helper import LOGGER
 from common.utils import random_str
@@ -13,8 +19,10 @@ from bot.bot import Bot, GameMode
 class BotMjapi(Bot):
     """ Bot using mjapi online API"""
     batch_size = 24
-    retries = 3
-    retry_interval = 1
+    retries = 4
+    backoff_base = 0.2          # max delay before the first retry (seconds), doubled for each retry
+    backoff_max = 2.0           # cap of retry delay
+    decision_timeout = 8.0      # deadline of one decision (react/react_batch), including retries
     bound = 256
 
     """ MJAPI based mjai bot"""
@@ -25,7 +33,12 @@ class BotMjapi(Bot):
         self.mjapi = MjapiClient(self.st.mjapi_url)
         self._login_or_reg()
         self.id = -1
-        self.ignore_next_turn_self_reach:bool = False
+        self._deadline:float = None             # time.monotonic() deadline of the current decision
+        self._history:list[dict] = []           # msgs fed in current game (start_game + current kyoku)
+        self._lookahead_msgs:list[dict] = []    # msgs fed ahead of the game (reach lookahead), not confirmed yet
+        self._streamed:list[dict] = []          # game msgs streamed ahead, still pending in the game's input list
+        self._stream_gap = False                # a streamed request failed. bot state must be restored
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="MjapiStream") if self.st.mjapi_stream else None
         
     @property
     def info_str(self):
@@ -65,65 +78,178 @@ class BotMjapi(Bot):
 
     def __del__(self):
         LOGGER.debug("Deleting bot %s", self.name)
+        if self._executor:
+            self._executor.shutdown(wait=True)
         if self.initialized:
             self.mjapi.stop_bot()
         if self.mjapi.token:    # update usage and logout on deleting
             self.st.mjapi_usage = self.mjapi.get_usage()
             self.st.save_json()
             self.mjapi.logout()
+        self.mjapi.close()
 
     def _init_bot_impl(self, _mode:GameMode=GameMode.MJ4P):
+        self._streamed = []
+        self._run(self._start)
+
+    def _start(self):
         self.mjapi.start_bot(self.seat, BotMjapi.bound, self.model_name)
         self.id = -1
+        self._history = []
+        self._lookahead_msgs = []
+        self._stream_gap = False
 
-    def _process_reaction(self, reaction, recurse):
-        if reaction:
-            pass
-        else:
+    def _run(self, func, *args):
+        """ run func in the stream thread (after the streamed requests) if streaming, and return its result"""
+        if self._executor:
+            return self._executor.submit(func, *args).result()
+        return func(*args)
+
+    def _record(self, input_list:list[dict]):
+        """ record msgs fed to the bot, for restoring bot state"""
+        for msg in input_list:
+            if msg['type'] == MjaiType.START_GAME:
+                self._history = []
+            elif msg['type'] == MjaiType.START_KYOKU:     # keep start_game msg only
+                self._history = [m for m in self._history if m['type'] == MjaiType.START_GAME]
+            self._history.append(msg)
+
+    def _restore(self):
+        """ restore bot state to the recorded history: restart bot and replay history (can_act=False)"""
+        LOGGER.info("Restoring MJAPI bot state, replaying %d msgs", len(self._history))
+        self._lookahead_msgs = []
+        self.mjapi.start_bot(self.seat, BotMjapi.bound, self.model_name)
+        self.id = -1
+        for start in range(0, len(self._history), BotMjapi.batch_size):
+            self._react_batch_impl(self._history[start:start + BotMjapi.batch_size], can_act=False)
+
+    def _confirm_lookahead(self, input_list:list[dict]) -> list[dict]:
+        """ match input msgs with the msgs already fed for lookahead, and return the msgs still to be fed.
+        If the game went differently (e.g. no reach after all), the bot state is restored first"""
+        if not self._lookahead_msgs:
+            return input_list
+        n = len(self._lookahead_msgs)
+        def kinds(msgs:list[dict]) -> list[tuple]:
+            return [(m['type'], m.get('actor')) for m in msgs]
+        if kinds(input_list[:n]) == kinds(self._lookahead_msgs):
+            self._record(self._lookahead_msgs)
+            self._lookahead_msgs = []
+            return input_list[n:]
+        LOGGER.debug("Lookahead msgs not confirmed by the game: %s", self._lookahead_msgs)
+        self._restore()
+        return input_list
+
+    def _process_reaction(self, reaction:dict | None) -> dict | None:
+        if not reaction:
             return None
 
-        # process self reach
-        if recurse and reaction['type'] == MjaiType.REACH and reaction['actor'] == self.seat:
+        # process self reach: feed reach msg ahead to get reach_dahai. restored if the game doesn't confirm it
+        if reaction['type'] == MjaiType.REACH and reaction['actor'] == self.seat:
             LOGGER.debug("Send reach msg to get reach_dahai.")
             reach_msg = {'type': MjaiType.REACH, 'actor': self.seat}
-            reach_dahai = self.react(reach_msg, recurse=False)
-            reaction['reach_dahai'] = self._process_reaction(reach_dahai, False)
-            self.ignore_next_turn_self_reach = True
+            self._lookahead_msgs = [reach_msg]
+            reaction['reach_dahai'] = self._act(reach_msg)
 
         return reaction
 
-    def react(self, input_msg:dict, recurse=True) -> dict | None:
-        # input_msg['can_act'] = True
-        msg_type = input_msg['type']
-        if self.ignore_next_turn_self_reach:
-            if  msg_type == MjaiType.REACH and input_msg['actor'] == self.seat:
-                LOGGER.debug("Ignoring repetitive self reach msg, reach msg already sent to AI last turn")
-                return None
-            self.ignore_next_turn_self_reach = False
+    def _with_retries(self, api_func, *args):
+        """ call MJAPI function, retrying with exponential backoff and full jitter within the decision deadline.
+        Request timeouts are limited to the time left. Raises the last error if all attempts failed"""
+        deadline = self._deadline if self._deadline is not None else time.monotonic() + BotMjapi.decision_timeout
+        for attempt in range(BotMjapi.retries):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"MJAPI decision deadline ({BotMjapi.decision_timeout}s) exceeded")
+            try:
+                return api_func(*args, timeout=min(self.mjapi.timeout, remaining))
+            except Exception as e:
+                delay = random.uniform(0, min(BotMjapi.backoff_max, BotMjapi.backoff_base * 2**attempt))
+                if attempt + 1 == BotMjapi.retries or time.monotonic() + delay >= deadline:
+                    raise
+                LOGGER.warning("MJAPI request failed (%s), retry in %.2fs", e, delay)
+                time.sleep(delay)
 
+    def _act(self, input_msg:dict) -> dict | None:
+        """ feed one msg to MJAPI bot and return the reaction"""
         old_id = self.id
-        err = None
         self.id = (self.id + 1) % BotMjapi.bound
-        reaction = None
-        for _ in range(BotMjapi.retries):
-            try:
-                reaction = self.mjapi.act(self.id, input_msg)
-                err = None
-                break
-            except Exception as e:
-                err = e
-                time.sleep(BotMjapi.retry_interval)
-        if err:
+        try:
+            return self._with_retries(self.mjapi.act, self.id, input_msg)
+        except Exception:
             self.id = old_id
-            raise err
-        return self._process_reaction(reaction, recurse)
+            raise
+
+    def feed_ahead(self, input_list:list[dict]):
+        if not self._executor:
+            return
+        n = len(self._streamed)
+        if len(input_list) >= n and all(a is b for a, b in zip(input_list, self._streamed)):
+            new_msgs = input_list[n:]
+        else:       # game dropped the pending msgs (e.g. new round). they are in the bot state already
+            new_msgs = input_list
+            self._streamed = []
+        if new_msgs:
+            self._streamed.extend(new_msgs)
+            self._executor.submit(self._stream, list(new_msgs))
+
+    def _unstreamed(self, input_list:list[dict]) -> list[dict]:
+        """ return input msgs that have not been streamed ahead"""
+        n = len(self._streamed)
+        streamed, self._streamed = self._streamed, []
+        if n and len(input_list) >= n and all(a is b for a, b in zip(input_list, streamed)):
+            return input_list[n:]
+        return input_list
+
+    def _stream(self, input_list:list[dict]):
+        """ send msgs that need no decision (in the stream thread)"""
+        self._deadline = time.monotonic() + BotMjapi.decision_timeout
+        if self._stream_gap:      # will be replayed on restore
+            self._record(input_list)
+            return
+        try:
+            input_list = self._confirm_lookahead(input_list)
+            for start in range(0, len(input_list), BotMjapi.batch_size):
+                reaction = self._react_batch_impl(input_list[start:start + BotMjapi.batch_size], can_act=False)
+                if reaction and 'error' in reaction:
+                    raise RuntimeError(f"MJAPI error: {reaction['error']}")
+        except Exception as e:     # pylint: disable=broad-except
+            LOGGER.warning("Streaming msgs to MJAPI failed, bot state will be restored at next decision: %s", e)
+            self._stream_gap = True
+        self._record(input_list)
+
+    def _repair_stream(self):
+        """ restore bot state if a streamed request failed"""
+        if self._stream_gap:
+            self._stream_gap = False
+            self._restore()
+
+    def react(self, input_msg:dict) -> dict | None:
+        return self.react_batch([input_msg])
 
     def react_batch(self, input_list: list[dict]) -> dict | None:
-        if self.ignore_next_turn_self_reach and len(input_list) > 0:
-            if input_list[0]['type'] == MjaiType.REACH and input_list[0]['actor'] == self.seat:
-                LOGGER.debug("Ignoring repetitive self reach msg, reach msg already sent to AI last turn")
-                input_list = input_list[1:]
-            self.ignore_next_turn_self_reach = False
+        input_list = self._unstreamed(input_list)
+        if len(input_list) == 0:
+            LOGGER.debug("All input msgs were streamed ahead, no decision")
+            return None
+        if len(input_list) == 1:
+            return self._run(self._react_one, input_list[0])
+        return self._run(self._react_many, input_list)
+
+    def _react_one(self, input_msg:dict) -> dict | None:
+        # input_msg['can_act'] = True
+        self._deadline = time.monotonic() + BotMjapi.decision_timeout
+        self._repair_stream()
+        input_list = self._confirm_lookahead([input_msg])
+        if len(input_list) == 0:
+            return None
+        reaction = self._act(input_msg)
+        self._record(input_list)
+        return self._process_reaction(reaction)
+
+    def _react_many(self, input_list: list[dict]) -> dict | None:
+        self._deadline = time.monotonic() + BotMjapi.decision_timeout
+        self._repair_stream()
+        input_list = self._confirm_lookahead(input_list)
         if len(input_list) == 0:
             return None
         num_batches = (len(input_list) - 1) // BotMjapi.batch_size + 1
@@ -132,7 +258,8 @@ class BotMjapi(Bot):
             reaction = self._react_batch_impl(
                 input_list[start:start + BotMjapi.batch_size],
                 can_act= i + 1 == num_batches)
-        return reaction
+        self._record(input_list)
+        return self._process_reaction(reaction)
 
     def _react_batch_impl(self, input_list, can_act):
         if len(input_list) == 0:
@@ -140,7 +267,6 @@ class BotMjapi(Bot):
         batch_data = []
 
         old_id = self.id
-        err = None
         for (i, msg) in enumerate(input_list):
             self.id = (self.id + 1) % BotMjapi.bound
             if i + 1 == len(input_list) and not can_act:
@@ -148,16 +274,8 @@ class BotMjapi(Bot):
                 msg['can_act'] = False
             action = {'seq': self.id, 'data': msg}
             batch_data.append(action)
-        reaction = None
-        for _ in range(BotMjapi.retries):
-            try:
-                reaction = self.mjapi.batch(batch_data)
-                err = None
-                break
-            except Exception as e:
-                err = e
-                time.sleep(BotMjapi.retry_interval)
-        if err:
+        try:
+            return self._with_retries(self.mjapi.batch, batch_data)
+        except Exception:
             self.id = old_id
-            raise err
-        return self._process_reaction(reaction, True)
+            raise
@@ -0,0 +1,221 @@
+""" Local stand-in MJAPI server, for testing the MJAPI bot/client and measuring request round trips
+It implements the API endpoints MjapiClient uses, with in-memory users. Bots don't run a model: acts return
+{'type': 'none'} for the last msg if it can act. Acts with out-of-order seq are rejected, and received msgs are
+kept per bot (for tests). Server-side processing latency and failures can be simulated.
+
+Usage:
+    python -m bot.mjapi.local_server serve [--port PORT] [--latency MS] [--msg-latency MS] [--fail-rate RATE]
+        run the server. Set settings mjapi_url to http://127.0.0.1:PORT to use it
+    python -m bot.mjapi.local_server bench [--n N] [--latency MS]
+        compare act round trip: new connection per request (requests.post) vs pooled keep-alive client
+"""
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULT_PORT = 28700
+MODELS = ['baseline', 'local']
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """ request handler. HTTP/1.1 with Content-Length, so clients can keep connections alive"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True      # headers and body are written separately
+    server:'LocalMjapiServer'
+
+    def log_message(self, format, *args):     # pylint: disable=redefined-builtin
+        pass
+
+    def do_GET(self):       # pylint: disable=invalid-name
+        """ GET endpoints"""
+        self._handle(None)
+
+    def do_POST(self):      # pylint: disable=invalid-name
+        """ POST endpoints"""
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        self._handle(json.loads(body) if body else None)
+
+    def _handle(self, data):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.msg_latency and self.path in ('/mjai/act', '/mjai/batch'):
+            time.sleep(self.server.msg_latency * (len(data) if isinstance(data, list) else 1))
+        if self.server.fail_rate and random.random() < self.server.fail_rate:
+            self._reply(503, None)
+            return
+        try:
+            status, result = self.server.dispatch(self.command, self.path, data, self.headers.get('Authorization'))
+        except Exception as e:     # pylint: disable=broad-except
+            status, result = 400, {'error': str(e)}
+        self._reply(status, result)
+
+    def _reply(self, status:int, result:dict | None):
+        body = json.dumps(result).encode() if result is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class LocalMjapiServer(ThreadingHTTPServer):
+    """ In-memory MJAPI stand-in server"""
+    daemon_threads = True
+
+    def __init__(self, port:int=0, latency:float=0.0, fail_rate:float=0.0, msg_latency:float=0.0):
+        """ params:
+            port(int): port to listen on (127.0.0.1). 0 for any free port
+            latency(float): simulated processing time per request (seconds)
+            fail_rate(float): rate of requests answered with 503 (no body), for testing retries
+            msg_latency(float): simulated processing time per mjai msg in act/batch requests (seconds)"""
+        super().__init__(('127.0.0.1', port), _Handler)
+        self.latency = latency
+        self.msg_latency = msg_latency
+        self.fail_rate = fail_rate
+        self._lock = threading.Lock()
+        self.users:dict[str, str] = {}          # name -> secret
+        self.tokens:dict[str, str] = {}         # token -> name
+        self.usage:dict[str, int] = {}          # name -> number of acts
+        self.bots:dict[str, dict] = {}          # name -> {'id', 'bound', 'model', 'seq', 'msgs'}
+        self.requests = 0
+        self._thread:threading.Thread = None
+
+    @property
+    def url(self) -> str:
+        """ base url of the server"""
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        """ serve in a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, name="LocalMjapiServer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ stop serving and close the socket"""
+        self.shutdown()
+        self.server_close()
+
+    def dispatch(self, method:str, path:str, data, auth:str | None) -> tuple[int, dict | None]:
+        """ process API request. returns (http status, response json)"""
+        with self._lock:
+            self.requests += 1
+            if path == '/user/register':
+                if data['name'] in self.users:
+                    return 400, {'error': 'user exists'}
+                self.users[data['name']] = uuid.uuid4().hex
+                return 200, {'name': data['name'], 'secret': self.users[data['name']]}
+            if path == '/user/login':
+                if self.users.get(data['name']) != data['secret']:
+                    return 401, {'error': 'invalid name or secret'}
+                token = uuid.uuid4().hex
+                self.tokens[token] = data['name']
+                return 200, {'id': token}
+
+            user = self.tokens.get((auth or '').removeprefix('Bearer '))
+            if user is None:
+                return 401, {'error': 'unauthorized'}
+            match (method, path):
+                case ('GET', '/user'):
+                    return 200, {'name': user}
+                case ('POST', '/user/logout'):
+                    self.tokens = {k: v for k, v in self.tokens.items() if v != user}
+                    return 200, None
+                case ('GET', '/mjai/list'):
+                    return 200, {'models': MODELS}
+                case ('GET', '/mjai/usage'):
+                    return 200, {'used': self.usage.get(user, 0)}
+                case ('GET', '/mjai/limit'):
+                    return 200, {'limit': 0, 'used': self.usage.get(user, 0)}
+                case ('POST', '/mjai/start'):
+                    self.bots[user] = {**data, 'seq': -1, 'msgs': []}
+                    return 200, None
+                case ('POST', '/mjai/stop'):
+                    self.bots.pop(user, None)
+                    return 200, None
+                case ('POST', '/mjai/act'):
+                    return self._act(user, [data])
+                case ('POST', '/mjai/batch'):
+                    return self._act(user, data)
+            return 404, {'error': f'unknown endpoint {method} {path}'}
+
+    def _act(self, user:str, actions:list[dict]) -> tuple[int, dict | None]:
+        bot = self.bots.get(user)
+        if bot is None:
+            return 400, {'error': 'bot not started'}
+        for action in actions:
+            if action['seq'] != (bot['seq'] + 1) % bot['bound']:
+                return 400, {'error': f"seq gap: expected {(bot['seq'] + 1) % bot['bound']}, got {action['seq']}"}
+            bot['seq'] = action['seq']
+            bot['msgs'].append(action['data'])
+        self.usage[user] = self.usage.get(user, 0) + 1
+        if actions[-1]['data'].get('can_act', True):
+            return 200, {'act': {'type': 'none'}}
+        return 200, None
+
+
+def _bench(n:int, latency:float):
+    """ act round trip of the previous client behaviour (new connection per request) vs pooled client"""
+    # pylint: disable=import-outside-toplevel
+    import requests
+    from bot.mjapi.mjapi import MjapiClient
+
+    server = LocalMjapiServer(latency=latency)
+    server.start()
+    client = MjapiClient(server.url)
+    secret = client.register('bench')['secret']
+    client.login('bench', secret)
+    client.start_bot(0, 256, MODELS[0])
+    msg = {'type': 'dahai', 'actor': 1, 'pai': '5mr', 'tsumogiri': False}
+
+    def fresh(seq):
+        requests.post(server.url + '/mjai/act', json={'seq': seq, 'data': msg}, headers=client.headers, timeout=5)
+
+    def pooled(seq):
+        client.act(seq, msg)
+
+    for name, func in (("new connection", fresh), ("pooled", pooled)):
+        func(0)     # warm up
+        times = []
+        for i in range(n):
+            start = time.perf_counter()
+            func(i % 256)
+            times.append(time.perf_counter() - start)
+        times.sort()
+        print(f"{name:>15}: mean {sum(times) / n * 1000:.3f} ms, p50 {times[n // 2] * 1000:.3f} ms, "
+            f"p95 {times[int(n * 0.95)] * 1000:.3f} ms")
+    client.close()
+    server.stop()
+
+
+def main():
+    """ command line entry"""
+    parser = argparse.ArgumentParser(description="Local stand-in MJAPI server")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_serve = sub.add_parser("serve", help="run server")
+    p_serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p_serve.add_argument("--latency", type=float, default=0.0, help="simulated processing time (ms)")
+    p_serve.add_argument("--fail-rate", type=float, default=0.0, help="rate of failed (503) requests")
+    p_serve.add_argument("--msg-latency", type=float, default=0.0, help="simulated processing time per msg (ms)")
+    p_bench = sub.add_parser("bench", help="benchmark act round trip")
+    p_bench.add_argument("--n", type=int, default=500)
+    p_bench.add_argument("--latency", type=float, default=0.0, help="simulated processing time (ms)")
+    args = parser.parse_args()
+
+    if args.cmd == "bench":
+        _bench(args.n, args.latency / 1000)
+        return
+    server = LocalMjapiServer(args.port, args.latency / 1000, args.fail_rate, args.msg_latency / 1000)
+    print(f"Serving MJAPI stand-in on {server.url}. Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
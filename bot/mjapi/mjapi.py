@@ -1,17 +1,35 @@
 """ Python wrapper for MJAPI API
 API 文档: https://pastebin.com/wks80EsZ
 密码: EaSXeZycr4
-把文档内容粘贴到测试网址: https://editor.swagger.io/"""
+把文档内容粘贴到测试网址: https://editor.swagger.io/
+Requests go through one persistent session (keep-alive, pooled connections), so acts after the first one
+don't open new TCP+TLS connections.
+"""
 
 import requests
+from requests.adapters import HTTPAdapter
+
+
+POOL_SIZE = 4       # max kept-alive connections to the API host
 
 class MjapiClient:
     """ MJAPI API wrapper"""
     def __init__(self, base_url:str, timeout:float=5):
+        """ params:
+            base_url(str): API base url
+            timeout(float): default request timeout (seconds)"""
         self.base_url = base_url
         self.timeout = timeout
         self.token:str = None
         self.headers = {}
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        """ close pooled connections"""
+        self.session.close()
 
     def set_bearer_token(self, token):
         """Set the bearer token for authentication."""
@@ -22,7 +40,7 @@ class MjapiClient:
         """ send POST to API and process response"""
         try:
             full_url = f'{self.base_url}{path}'
-            res = requests.post(full_url, json=json, headers=self.headers, timeout=self.timeout)
+            res = self.session.post(full_url, json=json, headers=self.headers, timeout=self.timeout)
             return self._process_res(res, raise_error)
         except requests.RequestException as e:
             if raise_error:
@@ -34,7 +52,7 @@ class MjapiClient:
         """ send GET to API and process response"""
         try:
             full_url = f'{self.base_url}{path}'
-            res = requests.get(full_url, headers=self.headers, timeout=self.timeout)
+            res = self.session.get(full_url, headers=self.headers, timeout=self.timeout)
             return self._process_res(res, raise_error)
         except requests.RequestException as e:
             if raise_error:
@@ -44,7 +62,7 @@ class MjapiClient:
         
     def _process_res(self, res:requests.Response, raise_error:bool):
         """ return results or raise error"""            
-        if res.ok:
+        if 200 <= res.status_code < 300:
             return res.json() if res.content else None
         elif 'error' in res.json():
             message = res.json()['error']
@@ -111,23 +129,24 @@ class MjapiClient:
         res_json = self.post_req(path, json=data)
         return res_json
 
-    def act(self, seq, data) -> dict | None:
+    def act(self, seq, data, timeout:float=None) -> dict | None:
         """Query mjai bot with a single action. returns reaction dict /None"""
         path = '/mjai/act'
         data = {'seq': seq, 'data': data}
-        return self._post_act(path, seq, data)
+        return self._post_act(path, seq, data, timeout)
 
-    def batch(self, actions) -> dict | None:
+    def batch(self, actions, timeout:float=None) -> dict | None:
         """Query mjai bot with multiple actions."""
         if len(actions) == 0:
             return None
         seq = actions[-1]['seq']
         path = '/mjai/batch'
-        return self._post_act(path, seq, actions)
+        return self._post_act(path, seq, actions, timeout)
 
-    def _post_act(self, path, _seq, actions):
+    def _post_act(self, path, _seq, actions, timeout:float=None):
         # post request to MJAPI and process response/errors
-        response = requests.post(self.base_url + path, json=actions, headers=self.headers, timeout=self.timeout)
+        response = self.session.post(self.base_url + path, json=actions, headers=self.headers,
+            timeout=self.timeout if timeout is None else timeout)
         if response.content:
             response_json = response.json()
             if response.status_code == 200:
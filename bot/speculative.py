@@ -0,0 +1,254 @@
+""" Speculative pre-computation of the next own tsumo decision (for libriichi mjai bots)
+After kamicha's discard, the bot usually sits idle until its own tsumo arrives. The Speculator uses that time
+to compute the reactions for each possible tsumo tile ahead:
+1. Clone the mjai bot state: libriichi bots can't be copied, so a new bot is fed with the game's input
+   history (can_act=False), and then a candidate tsumo msg. A capturing engine records the model input.
+2. Run the captured inputs of all candidates as batched forward passes (in chunks, most likely tiles first).
+3. The main bot's engine (SpeculativeEngine) serves the real decision from the results, matched by the exact
+   model input (obs and mask bytes), so a hit is always the same result the engine would compute.
+"""
+import time
+import hashlib
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import numpy as np
+
+from common.log_helper import LOGGER
+from common.mj_helper import MjaiType, MJAI_TILES_34, MJAI_AKA_DORAS
+from bot.mjai_codec import encode_msg
+
+CHUNK_SIZE = 4              # candidates per batched forward pass. real decision cancels between chunks
+MAX_CANDIDATES = 37         # max candidate tsumo tiles (34 kinds + 3 aka doras)
+IDLE_BUDGET = 0.8           # fraction of the expected idle time to spend on speculation
+EMA_ALPHA = 0.3             # smoothing of idle time / candidate cost estimates
+TILES_3P_EXCLUDED = {"2m", "3m", "4m", "5m", "6m", "7m", "8m", "5mr"}
+
+
+def _input_key(obs:np.ndarray, mask:np.ndarray) -> bytes:
+    """ hash of one model input"""
+    h = hashlib.blake2b(np.ascontiguousarray(obs).data, digest_size=16)
+    h.update(np.ascontiguousarray(mask).data)
+    return h.digest()
+
+
+def unseen_tiles(history:list[dict], seat:int, is_3p:bool) -> Counter:
+    """ return {tile: number of copies not visible to seat} from the mjai msgs of the current kyoku"""
+    visible = Counter()
+    for msg in history:
+        actor = msg.get('actor')
+        match msg['type']:
+            case MjaiType.START_KYOKU:
+                visible.clear()
+                visible.update(msg['tehais'][seat])
+                visible[msg['dora_marker']] += 1
+            case MjaiType.DORA:
+                visible[msg['dora_marker']] += 1
+            case MjaiType.TSUMO if actor == seat:
+                visible[msg['pai']] += 1
+            case MjaiType.DAHAI | MjaiType.KAKAN | MjaiType.NUKIDORA if actor != seat:
+                visible[msg['pai']] += 1
+            case MjaiType.CHI | MjaiType.PON | MjaiType.DAIMINKAN | MjaiType.ANKAN if actor != seat:
+                visible.update(msg['consumed'])
+    unseen = Counter()
+    for tile in MJAI_TILES_34[:34] + MJAI_AKA_DORAS:
+        if is_3p and tile in TILES_3P_EXCLUDED:
+            continue
+        total = 1 if tile in MJAI_AKA_DORAS else (3 if tile in ('5m', '5p', '5s') else 4)
+        n = total - visible[tile]
+        if n > 0:
+            unseen[tile] = n
+    return unseen
+
+
+class _CaptureEngine:
+    """ engine for cloned bots: records model inputs and returns a legal placeholder action"""
+    def __init__(self, engine):
+        self._engine = engine
+        self.obs = []
+        self.masks = []
+
+    def __getattr__(self, name):
+        return getattr(self._engine, name)
+
+    def react_batch(self, obs, masks, invisible_obs):
+        """ record inputs, return first legal action"""
+        self.obs.extend(np.array(o, copy=True) for o in obs)
+        self.masks.extend(np.array(m, copy=True) for m in masks)
+        actions = [int(np.argmax(m)) for m in masks]
+        return actions, [[0.0] * len(m) for m in masks], [list(map(bool, m)) for m in masks], [True] * len(masks)
+
+
+class SpeculativeEngine:
+    """ engine wrapper for the main mjai bot: serves precomputed results, counts hits of speculation rounds"""
+    def __init__(self, engine):
+        self._engine = engine
+        self._lock = threading.Lock()
+        self._results:dict[bytes, tuple] = {}
+        self._generation = 0        # speculation round. increased to cancel the running round
+        self._armed = False         # a round was started and its decision has not come yet
+        self._armed_time = 0.0
+        self.idle_time:float = None     # EMA of time from first round start to the decision (seconds)
+        self.rounds = 0             # rounds whose decision came
+        self.hits = 0
+
+    def __getattr__(self, name):
+        return getattr(self._engine, name)
+
+    @property
+    def hit_rate(self) -> float:
+        """ rate of speculation rounds whose decision was served from precomputed results"""
+        return self.hits / self.rounds if self.rounds else 0.0
+
+    def new_round(self) -> int:
+        """ start a speculation round (cancelling the previous one). returns round generation"""
+        with self._lock:
+            if not self._armed:
+                self._armed_time = time.monotonic()
+            self._generation += 1
+            self._results = {}
+            self._armed = True
+            return self._generation
+
+    def cancel(self):
+        """ cancel running round. the next decision is not counted"""
+        with self._lock:
+            self._generation += 1
+            self._results = {}
+            self._armed = False
+
+    def is_current(self, generation:int) -> bool:
+        """ return True if round is not cancelled"""
+        return generation == self._generation
+
+    def add_results(self, generation:int, keys:list[bytes], results:list[tuple]):
+        """ store precomputed results of round"""
+        with self._lock:
+            if generation == self._generation:
+                self._results.update(zip(keys, results))
+
+    def react_batch(self, obs, masks, invisible_obs):
+        """ same as MortalEngine.react_batch.
+        Row 0 is the decision. Rows after it (post-reach clone rows, see LookaheadBot.react_with_reach) are computed"""
+        result = None
+        with self._lock:
+            if self._armed:
+                result = self._results.get(_input_key(obs[0], masks[0]))
+                self._generation += 1       # this is the decision the round was for. stop computing
+                self._results = {}
+                self._armed = False
+                self.rounds += 1
+                idle = time.monotonic() - self._armed_time
+                self.idle_time = idle if self.idle_time is None else (1 - EMA_ALPHA) * self.idle_time + EMA_ALPHA * idle
+                if result is not None:
+                    self.hits += 1
+        if result is None:
+            return self._engine.react_batch(obs, masks, invisible_obs)
+        if len(obs) == 1:
+            return result
+        rest = self._engine.react_batch(obs[1:], masks[1:], None if invisible_obs is None else invisible_obs[1:])
+        return tuple([*r, *x] for r, x in zip(result, rest))
+
+
+class Speculator:
+    """ Run speculation rounds in a background thread for one mjai bot"""
+    def __init__(self, engine, new_bot:Callable, seat:int, is_3p:bool):
+        """ params:
+            engine: MortalEngine of the bot
+            new_bot(Callable): (engine) -> new libriichi mjai.Bot for the same seat and mode
+            seat(int): seat of the bot
+            is_3p(bool): 3p game"""
+        self.engine = SpeculativeEngine(engine)
+        self._new_bot = new_bot
+        self.seat = seat
+        self.kamicha = (seat - 1) % (3 if is_3p else 4)
+        self.is_3p = is_3p
+        self._history:list[dict] = []
+        self._waiting_tsumo = False
+        self.candidate_cost:float = None    # EMA of time to capture and compute one candidate (seconds)
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="Speculator")
+
+    def on_inputs(self, msgs:list[dict]):
+        """ called with the msgs fed to the main bot (after it reacted), or fed ahead before the bot gets them.
+        Start a speculation round if own tsumo is next after the msgs, or cancel the running round"""
+        start = False
+        for msg in msgs:
+            msg_type = msg['type']
+            if msg_type == MjaiType.START_GAME:
+                self._history = []
+            elif msg_type == MjaiType.START_KYOKU:     # keep start_game msg only
+                self._history = [m for m in self._history if m['type'] == MjaiType.START_GAME]
+            self._history.append(msg)
+            if msg_type == MjaiType.DAHAI and msg['actor'] == self.kamicha:
+                self._waiting_tsumo = True
+                start = True
+            elif self._waiting_tsumo and msg_type in (MjaiType.REACH_ACCEPTED, MjaiType.DORA):
+                start = True    # still own tsumo next, but state changed. start a new round
+            elif self._waiting_tsumo:
+                self._waiting_tsumo = False
+                start = False   # own tsumo already in msgs (decided), or no own tsumo
+                if not (msg_type == MjaiType.TSUMO and msg['actor'] == self.seat):
+                    self.engine.cancel()    # someone called. no own tsumo
+        if start:
+            generation = self.engine.new_round()
+            self._executor.submit(self._run_round, generation, list(self._history))
+
+    def shutdown(self):
+        """ cancel running round and stop the thread"""
+        self.engine.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _run_round(self, generation:int, history:list[dict]):
+        try:
+            self._speculate(generation, history)
+        except Exception as e:     # pylint: disable=broad-except
+            LOGGER.warning("Speculation failed: %s", e, exc_info=True)
+
+    def _speculate(self, generation:int, history:list[dict]):
+        start = time.monotonic()
+        unseen = unseen_tiles(history, self.seat, self.is_3p)
+        candidates = [t for t, _n in unseen.most_common(self._n_candidates())]
+        lines = [encode_msg(msg, can_act=False) for msg in history]
+        done = 0
+        try:
+            # most likely tiles first: capture model inputs of a chunk of candidates on cloned bots,
+            # then compute them in one batched forward pass
+            for i in range(0, len(candidates), CHUNK_SIZE):
+                keys, obs, masks = [], [], []
+                for pai in candidates[i:i+CHUNK_SIZE]:
+                    if not self.engine.is_current(generation):
+                        return
+                    capture = _CaptureEngine(self.engine)
+                    bot = self._new_bot(capture)
+                    for line in lines:
+                        bot.react(line)
+                    try:
+                        bot.react(encode_msg({'type': MjaiType.TSUMO, 'actor': self.seat, 'pai': pai}))
+                    except Exception:      # pylint: disable=broad-except
+                        continue        # impossible tile in this state
+                    if len(capture.obs) != 1:
+                        continue
+                    keys.append(_input_key(capture.obs[0], capture.masks[0]))
+                    obs.append(capture.obs[0])
+                    masks.append(capture.masks[0])
+                if not obs or not self.engine.is_current(generation):
+                    continue
+                base_engine = self.engine._engine       # pylint: disable=protected-access
+                actions, q_out, masks_out, is_greedy = base_engine.react_batch(obs, masks, None)
+                results = [([a], [q], [m], [g]) for a, q, m, g in zip(actions, q_out, masks_out, is_greedy)]
+                self.engine.add_results(generation, keys, results)
+                done += len(results)
+        finally:
+            if done:
+                cost = (time.monotonic() - start) / done
+                self.candidate_cost = cost if self.candidate_cost is None else (
+                    (1 - EMA_ALPHA) * self.candidate_cost + EMA_ALPHA * cost)
+
+    def _n_candidates(self) -> int:
+        """ number of candidates that fit in the expected idle time (all if not known yet)"""
+        idle, cost = self.engine.idle_time, self.candidate_cost
+        if idle is None or not cost:
+            return MAX_CANDIDATES
+        return max(1, min(MAX_CANDIDATES, int(idle * IDLE_BUDGET / cost)))
@@ -15,12 +15,14 @@ import mitm
 import proxinject
 import liqi
 from common.mj_helper import MjaiType, GameInfo, MJAI_TILE_2_UNICODE, ActionUnicode, MJAI_TILES_34, MJAI_AKA_DORAS
-from common.log_helper import LOGGER
+from common.log_helper import LOGGER, dt_string
+from common.latency import TRACER, Stage
 from common.settings import Settings
 from common.lan_str import LanStr
 from common import utils
 from common.utils import FPSCounter
 from bot import Bot, get_bot
+from async_pipeline import AsyncPipeline
 
 
 METHODS_TO_IGNORE = [
@@ -30,6 +32,7 @@ METHODS_TO_IGNORE = [
     liqi.LiqiMethod.fetchAccountActivityData,
     liqi.LiqiMethod.fetchServerTime,
 ]
+HOUSEKEEPING_INTERVAL = 0.05    # seconds between housekeeping runs (bot/mitm update, overlay, lobby automation)
 
 class BotManager:
     """ Bot logic manager"""
@@ -37,12 +40,14 @@ class BotManager:
         self.st = setting
         self.game_state:GameState = None
 
-        self.liqi_parser = liqi.LiqiProto()
+        self.liqi_parser = liqi.LiqiProto(self.st.liqi_native_proto)
         self.mitm_server:mitm.MitmController = mitm.MitmController()      # no domain restrictions for now
         self.proxy_injector = proxinject.ProxyInjector()
         self.browser = GameBrowser(self.st.browser_width, self.st.browser_height)
         self.automation = Automation(self.browser, self.st)
         self.bot:Bot = None
+        # async mode: process msgs in mitm event loop, instead of this thread
+        self.async_pipeline:AsyncPipeline = AsyncPipeline(self) if self.st.async_pipeline else None
 
         self._thread:threading.Thread = None
         self._stop_event = threading.Event()
@@ -56,6 +61,8 @@ class BotManager:
         self.is_loading_bot:bool = False                # is bot being loaded
         self.main_thread_exception:Exception = None     # Exception that had stopped the main thread
         self.game_exception:Exception = None            # game run time error (but does not break main thread)        
+        # guide is rendered repeatedly for the same pending reaction (GUI, overlay)
+        self._guide_cache:tuple[dict, dict] = (None, {})    # (reaction, {(max_options, language): guide})
         
         
     def start(self):
@@ -99,6 +106,22 @@ class BotManager:
         return self.game_state.get_game_info()
     
     
+    def get_latency_summary(self) -> str:
+        """ return short decision latency summary string (p50/p95/p99), empty if no data"""
+        return TRACER.summary_str()
+
+    def export_latency_trace(self, file:str=None):
+        """ export latency traces to json file (default to log folder). skip if no traces"""
+        if not TRACER.traces():
+            return
+        if file is None:
+            file = utils.sub_file(utils.Folder.LOG, f"latency_{dt_string()}.json")
+        try:
+            TRACER.export_json(file)
+            LOGGER.info("Latency trace exported to %s: %s", file, TRACER.summary())
+        except Exception as e:
+            LOGGER.warning("Failed to export latency trace: %s", e)
+
     def is_game_syncing(self) -> bool:
         """ is mjai syncing game messages (from disconnection) """
         if self.game_state:
@@ -168,6 +191,22 @@ class BotManager:
             return reaction
         else:   # None
             return None
+
+
+    def get_pending_guide(self, max_options:int=3) -> tuple[str, list] | None:
+        """ returns AI guide (see mjai_reaction_2_guide) of the pending reaction in current language, or None"""
+        reaction = self.get_pending_reaction()
+        if not reaction:
+            return None
+        cached_reaction, cache = self._guide_cache     # read and replaced as one tuple (GUI and bot threads)
+        if cached_reaction is not reaction:     # reaction is kept referenced, so its identity can't be reused
+            cache = {}
+            self._guide_cache = (reaction, cache)
+        lan_str = self.st.lan()
+        key = (max_options, lan_str.LANGUAGE_NAME)
+        if key not in cache:
+            cache[key] = mjai_reaction_2_guide(reaction, max_options, lan_str)
+        return cache[key]
         
     
     def enable_overlay(self):
@@ -242,7 +281,12 @@ class BotManager:
         else:
             mode = mitm.HTTP
 
-        self.mitm_server.start(self.st.mitm_port, mode, self.st.upstream_proxy)
+        if self.st.ws_capture:
+            capture_file = utils.sub_file(utils.Folder.CAPTURE, f"ws_{dt_string()}.mjcap")
+        else:
+            capture_file = None
+        msg_handler = self.async_pipeline.on_message if self.async_pipeline else None
+        self.mitm_server.start(self.st.mitm_port, mode, self.st.upstream_proxy, capture_file, msg_handler)
         res = self.mitm_server.install_mitm_cert()
         if not res:
             self.main_thread_exception = utils.MitmCertNotInstalled(self.mitm_server.cert_file)
@@ -258,24 +302,39 @@ class BotManager:
             if self.st.auto_launch_browser:
                 self.start_browser()
 
+            next_housekeeping = 0.0
             while self._stop_event.is_set() is False:   # thread main loop
                 # keep processing majsoul game messages forwarded from mitm server
+                # block on the msg queue, and wake up for housekeeping on its own timer
                 self.fps_counter.frame()
-                self._loop_pre_msg()
-                try:                    
-                    msg = self.mitm_server.get_message()
-                    self._process_msg(msg)                                  
+                if self.async_pipeline:     # msgs are processed in async pipeline. only do housekeeping
+                    self.async_pipeline.run_job(self._housekeeping)
+                    self._stop_event.wait(HOUSEKEEPING_INTERVAL)
+                    continue
+                now = time.time()
+                if now >= next_housekeeping:
+                    self._housekeeping()
+                    next_housekeeping = now + HOUSEKEEPING_INTERVAL
+                try:
+                    msg = self.mitm_server.get_message(True, max(0.0, next_housekeeping - time.time()))
+                    if msg.type == mitm.WsType.MESSAGE:
+                        TRACER.begin(msg.timestamp)
+                        TRACER.mark(Stage.DEQUEUE)
+                    self._process_msg(msg)
+                    TRACER.discard()        # traces with reaction are already committed
                 except queue.Empty:
-                    time.sleep(0.002)
+                    pass
                 except Exception as e:
                     LOGGER.error("Error processing msg: %s",e, exc_info=True)
-                    self.game_exception = e                    
-                self._loop_post_msg()
+                    self.game_exception = e
                                     
             # loop ended, clean up before exit
+            self.export_latency_trace()
             LOGGER.info("Shutting down browser")
             self.browser.stop(True)                
             LOGGER.info("Shutting down MITM")
+            if self.async_pipeline:
+                self.async_pipeline.close()
             self.mitm_server.stop()
             if self.proxy_injector.is_running():
                 LOGGER.info("Shutting down proxy injector")
@@ -287,8 +346,13 @@ class BotManager:
             LOGGER.error("Bot Manager Thread Exception: %s", e, exc_info=True)
             
     
+    def _housekeeping(self):
+        """ periodic tasks besides msg processing"""
+        self._loop_pre_msg()
+        self._loop_post_msg()
+
     def _loop_pre_msg(self):
-        """ things to do every loop before processing msg"""
+        """ housekeeping: update bot and mitm if needed"""
         #  update bot if needed
         if self.bot_need_update and self.is_in_game() is False:
             self._create_bot()
@@ -299,13 +363,15 @@ class BotManager:
             if not (self.browser.is_running()):
                 LOGGER.debug("Updating mitm and proxy injector")
                 self.proxy_injector.stop(True)
+                if self.async_pipeline:
+                    self.async_pipeline.detach()
                 self.mitm_server.stop()
                 self._create_mitm_and_proxinject()
                 self.mitm_proxinject_need_update = False
         
                 
     def _loop_post_msg(self):
-        # things to do in every loop after processing msg
+        """ housekeeping: check mitm and overlay, retry automation and lobby actions"""
         # check mitm
         if self.mitm_server.is_running() is False:
             self.game_exception = utils.MITMException("MITM server stopped")
@@ -333,6 +399,18 @@ class BotManager:
         
     def _process_msg(self, msg:mitm.WSMessage):
         """ process websocket message from mitm server"""
+        liqimsg = self._route_msg(msg)
+        if liqimsg is not None:
+            reaction = self.game_state.input(liqimsg)
+            self._process_reaction(liqimsg, reaction)
+
+    def _route_msg(self, msg:mitm.WSMessage, header:liqi.LiqiHeader=None) -> dict | None:
+        """ process websocket message except in-game processing.
+        params:
+            msg(WSMessage): websocket message
+            header(LiqiHeader): header of the MESSAGE msg if already peeked by caller, else None to peek here
+        returns:
+            dict: parsed liqi msg of the game flow, to be fed into game state. None if msg is fully processed"""
         
         if msg.type == mitm.WsType.START:
             LOGGER.debug("Websocket Flow started: %s", msg.flow_id)
@@ -350,17 +428,14 @@ class BotManager:
                 self.automation.on_exit_lobby()
                 
         elif msg.type == mitm.WsType.MESSAGE:
-            # process ws message
-            try:
-                liqimsg = self.liqi_parser.parse(msg.content)
-            except Exception as e:
-                LOGGER.warning("Failed to parse liqi msg: %s\nError: %s", msg.content, e)
-                return
-            liqi_id = liqimsg.get("id")
-            liqi_type = liqimsg.get('type')
-            liqi_method = liqimsg.get('method')
-            # liqi_data = liqimsg['data']
-            # liqi_datalen = len(liqimsg['data'])
+            # process ws message. peek the header first, and only decode the body for wanted methods
+            if header is None:
+                header = self._peek(msg)
+            if header is None:
+                return None
+            liqi_id = header.id
+            liqi_type = header.type
+            liqi_method = header.method
             
             if liqi_method in METHODS_TO_IGNORE:
                 ...
@@ -368,6 +443,9 @@ class BotManager:
             elif (liqi_type, liqi_method) == (liqi.MsgType.RES, liqi.LiqiMethod.oauth2Login):
                 # lobby login msg
                 if self.lobby_flow_id is None:  # record first time in lobby
+                    liqimsg = self._parse_body(header)
+                    if liqimsg is None:
+                        return None
                     LOGGER.info("Lobby oauth2Login msg: %s", liqimsg)
                     LOGGER.info("Lobby login done. lobby flow ID = %s", msg.flow_id)                   
                     self.lobby_flow_id = msg.flow_id
@@ -378,6 +456,9 @@ class BotManager:
             elif (liqi_type, liqi_method) == (liqi.MsgType.REQ, liqi.LiqiMethod.authGame):
                 # Game Start request msg: found game flow, initialize game state
                 if self.game_flow_id is None:
+                    liqimsg = self._parse_body(header)
+                    if liqimsg is None:
+                        return None
                     LOGGER.info("authGame msg: %s", liqimsg)
                     LOGGER.info("Game Started. Game Flow ID=%s", msg.flow_id)
                     self.game_flow_id = msg.flow_id
@@ -386,28 +467,56 @@ class BotManager:
                     self.game_exception = None
                     self.automation.on_enter_game()
                 else:
-                    LOGGER.warning("Game flow %s already started. ignoring new game flow %s", self.game_flow_id, msg.flow_id)
+                    LOGGER.warning("Game flow %s already started. ignoring new game flow %s",
+                        self.game_flow_id, msg.flow_id)
                 
             elif msg.flow_id == self.game_flow_id:
                 # Game Flow Message (in-Game message)
-                # Feed msg to game_state for processing with AI bot
+                # return parsed msg to caller, for processing in game_state with AI bot
+                liqimsg = self._parse_body(header)
+                if liqimsg is None:
+                    return None
+                TRACER.mark(Stage.PARSE)
                 LOGGER.debug('Game msg: %s', str(liqimsg))
-                reaction = self.game_state.input(liqimsg)
-                if reaction:
-                    self._do_automation(reaction)
-                else:
-                    self._process_idle_automation(liqimsg)
-                # if self.game_state.is_game_ended:
-                #     self._process_end_game()
+                return liqimsg
             
             elif msg.flow_id == self.lobby_flow_id:
                 LOGGER.debug(
                     'Lobby msg(suppressed): id=%s, type=%s, method=%s, len=%d',
-                    liqi_id, liqi_type, liqi_method, len(str(liqimsg)))
+                    liqi_id, liqi_type, liqi_method, len(header.payload))
 
             else:
-                LOGGER.debug('Other msg (ignored): %s', liqimsg)
+                LOGGER.debug(
+                    'Other msg (ignored): id=%s, type=%s, method=%s, len=%d',
+                    liqi_id, liqi_type, liqi_method, len(header.payload))
+        return None
+                
+    def _peek(self, msg:mitm.WSMessage) -> liqi.LiqiHeader | None:
+        """ peek liqi header of ws message. return None if failed or unknown msg"""
+        try:
+            return self.liqi_parser.peek(msg.content)
+        except Exception as e:
+            LOGGER.warning("Failed to parse liqi msg: %s\nError: %s", msg.content, e)
+            return None
+
+    def _parse_body(self, header:liqi.LiqiHeader) -> dict | None:
+        """ decode full liqi msg from peeked header. return None if failed"""
+        try:
+            return self.liqi_parser.parse_body(header)
+        except Exception as e:
+            LOGGER.warning("Failed to parse liqi msg body: %s\nError: %s", header, e)
+            return None
                 
+    def _process_reaction(self, liqimsg:dict, reaction:dict | None):
+        """ automate bot reaction from game state, or do idle automation if no reaction"""
+        if reaction:
+            self._do_automation(reaction)
+            TRACER.commit()
+        else:
+            self._process_idle_automation(liqimsg)
+        # if self.game_state.is_game_ended:
+        #     self._process_end_game()
+
     def _process_idle_automation(self, liqimsg:dict):
         """ do some idle action based on liqi msg"""
         liqi_method = liqimsg['method']
@@ -441,9 +550,9 @@ class BotManager:
         
     def _update_overlay_guide(self):
         # Update overlay guide given pending reaction
-        reaction = self.get_pending_reaction()
-        if reaction:
-            guide, options = mjai_reaction_2_guide(reaction, 3, self.st.lan())
+        pending_guide = self.get_pending_guide(3)
+        if pending_guide:
+            guide, options = pending_guide
             self.browser.overlay_update_guidance(guide, self.st.lan().OPTIONS_TITLE, options)
         else:
             self.browser.overlay_clear_guidance()
@@ -572,5 +681,5 @@ def mjai_reaction_2_guide(reaction:dict, max_options:int=3, lan_str:LanStr=LanSt
                 else:
                     name_str = lan_str.mjai2str(code)                
                 options.append((name_str, q))
-        
+    
     return (action_str, options)
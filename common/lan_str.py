@@ -48,6 +48,7 @@ class LanStr:
     MODEL_TYPE = "AI Model Type"
     AI_MODEL_FILE = "Local Model File (4P)"
     AI_MODEL_FILE_3P = "Local Model File (3P)"
+    LOCAL_MODEL_BACKEND = "Local Backend"
     AKAGI_OT_URL = "AkagiOT Server URL"
     AKAGI_OT_APIKEY = "AkagiOT API Key"
     MJAPI_URL = "MJAPI Server URL"
@@ -181,6 +182,7 @@ class LanStrZHS(LanStr):
     MODEL_TYPE = "AI 模型类型"
     AI_MODEL_FILE = "本地模型文件(四麻)"
     AI_MODEL_FILE_3P = "本地模型文件(三麻)"
+    LOCAL_MODEL_BACKEND = "本地推理后端"
     AKAGI_OT_URL = "AkagiOT 服务器地址"
     AKAGI_OT_APIKEY = "AkagiOT API Key"
     MJAPI_URL = "MJAPI 服务器地址"
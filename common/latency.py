@@ -0,0 +1,193 @@
+""" Latency tracing from websocket frame to automation (mouse click)
+Each game msg processed by the bot manager gets a trace with per-stage timestamps.
+Traces that result in a bot reaction are kept in a ring buffer for percentile summaries and export.
+Timestamps use time.time() to be comparable with mitm WSMessage.timestamp
+"""
+import time
+import json
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+
+
+class Stage:
+    """ trace stage names (in pipeline order)"""
+    MITM_RECV = 'mitm_recv'         # mitm received the ws frame (WSMessage.timestamp)
+    DEQUEUE = 'dequeue'             # bot manager took the msg from mitm queue
+    PARSE = 'parse'                 # liqi msg parsed
+    REACT_START = 'react_start'     # bot react/react_batch called
+    REACT_END = 'react_end'         # bot react/react_batch returned
+    GAME_STATE = 'game_state'       # GameState.input returned
+    AUTOMATION = 'automation'       # Automation action steps generated
+    STEP_PREFIX = 'step:'           # AutomationTask.run_step finished, 'step:<ActionStep class name>'
+
+# decision latency: from the first mark (ws frame received) until automation steps are ready (before any
+# action delay), or until GameState returned the reaction if automation is not running
+DECISION_END_STAGES = (Stage.AUTOMATION, Stage.GAME_STATE)
+
+
+@dataclass
+class DecisionTrace:
+    """ timestamps of one decision, from ws frame to automation"""
+    trace_id:int
+    marks:list[tuple[str, float]] = field(default_factory=list)    # (stage, timestamp)
+
+    def mark(self, stage:str, timestamp:float=None):
+        """ record a stage timestamp (now if timestamp is None)"""
+        self.marks.append((stage, time.time() if timestamp is None else timestamp))
+
+    def time_of(self, stage:str) -> float | None:
+        """ return the first timestamp of stage, or None if not marked"""
+        for s, t in self.marks:
+            if s == stage:
+                return t
+        return None
+
+    def stage_durations(self) -> dict[str, float]:
+        """ return {stage: duration} where duration is the time since previous mark.
+        durations of repeated stages (e.g. steps) are summed"""
+        durations = {}
+        for (_s0, t0), (s1, t1) in zip(self.marks, self.marks[1:]):
+            durations[s1] = durations.get(s1, 0.0) + (t1 - t0)
+        return durations
+
+    def decision_time(self) -> float | None:
+        """ time from first mark to decision end stage, None if not available"""
+        if not self.marks:
+            return None
+        for stage in DECISION_END_STAGES:
+            t = self.time_of(stage)
+            if t is not None:
+                return t - self.marks[0][1]
+        return None
+
+    def total(self) -> float:
+        """ time from first to last mark"""
+        if len(self.marks) < 2:
+            return 0.0
+        return self.marks[-1][1] - self.marks[0][1]
+
+    def to_dict(self) -> dict:
+        """ return dict for export"""
+        return {'id': self.trace_id, 'marks': self.marks}
+
+
+def percentiles(values:list[float], ps:tuple=(50, 95, 99)) -> dict[int, float]:
+    """ return {p: percentile value} using nearest rank, 0.0 for empty values"""
+    if not values:
+        return {p: 0.0 for p in ps}
+    values = sorted(values)
+    n = len(values)
+    return {p: values[min(n - 1, int(round(p / 100 * (n - 1))))] for p in ps}
+
+
+class LatencyTracer:
+    """ Thread-safe latency tracer with ring buffer of finished traces"""
+
+    def __init__(self, capacity:int=500):
+        """ params:
+            capacity(int): max number of traces to keep"""
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._traces:deque[DecisionTrace] = deque(maxlen=capacity)
+        self._next_id = 1
+        self._local = threading.local()
+
+    @property
+    def current(self) -> DecisionTrace | None:
+        """ the trace being built in this thread, or None"""
+        return getattr(self._local, 'trace', None)
+
+    def begin(self, recv_time:float=None) -> DecisionTrace | None:
+        """ start a new trace in this thread (replacing the current one)
+        params:
+            recv_time(float): mitm receive timestamp of the ws msg
+        returns:
+            DecisionTrace: the new trace, or None if tracer is disabled"""
+        if not self.enabled:
+            self._local.trace = None
+            return None
+        with self._lock:
+            trace = DecisionTrace(self._next_id)
+            self._next_id += 1
+        if recv_time:
+            trace.mark(Stage.MITM_RECV, recv_time)
+        self._local.trace = trace
+        return trace
+
+    def attach(self, trace:DecisionTrace | None):
+        """ set the current trace of this thread (for continuing a trace in another thread)"""
+        self._local.trace = trace
+
+    def mark(self, stage:str):
+        """ mark stage on the current trace of this thread, if any"""
+        trace = self.current
+        if trace is not None:
+            trace.mark(stage)
+
+    def commit(self):
+        """ put current trace into the ring buffer and detach it from this thread.
+        The trace object can still receive marks afterwards (e.g. from automation thread)"""
+        trace = self.current
+        if trace is None:
+            return
+        with self._lock:
+            self._traces.append(trace)
+        self._local.trace = None
+
+    def discard(self):
+        """ drop the current trace of this thread"""
+        self._local.trace = None
+
+    def traces(self) -> list[DecisionTrace]:
+        """ return a copy of the traces in ring buffer (oldest first)"""
+        with self._lock:
+            return list(self._traces)
+
+    def clear(self):
+        """ clear ring buffer"""
+        with self._lock:
+            self._traces.clear()
+
+    def summary(self) -> dict:
+        """ return percentile summary (in seconds) of the traces in ring buffer
+        returns:
+            dict: {'count': n, 'stages': {stage: {50: p50, 95: p95, 99: p99}},
+                'decision': {...}, 'e2e': {...}}"""
+        traces = self.traces()
+        stage_values:dict[str, list[float]] = {}
+        decision_values = []
+        e2e_values = []
+        for trace in traces:
+            for stage, dur in trace.stage_durations().items():
+                stage_values.setdefault(stage, []).append(dur)
+            dec = trace.decision_time()
+            if dec is not None:
+                decision_values.append(dec)
+            e2e_values.append(trace.total())
+        return {
+            'count': len(traces),
+            'stages': {s: percentiles(v) for s, v in stage_values.items()},
+            'decision': percentiles(decision_values),
+            'e2e': percentiles(e2e_values),
+        }
+
+    def summary_str(self) -> str:
+        """ return short text summary of decision latency (ms), empty str if no traces"""
+        summary = self.summary()
+        if summary['count'] == 0:
+            return ""
+        dec = summary['decision']
+        return f"{dec[50]*1000:.0f}/{dec[95]*1000:.0f}/{dec[99]*1000:.0f}ms"
+
+    def export_json(self, file:str):
+        """ export traces and summary to json file"""
+        data = {
+            'summary': self.summary(),
+            'traces': [t.to_dict() for t in self.traces()],
+        }
+        with open(file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=1)
+
+
+TRACER = LatencyTracer()
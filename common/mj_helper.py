@@ -1,8 +1,8 @@
 """ Helper methods / constants that deal with tile converting / mjai message parsing / etc.
 """
 
-from dataclasses import dataclass, field
-from functools import cmp_to_key
+from typing import Iterable
+from dataclasses import dataclass
 
 import numpy as np
 
@@ -86,18 +86,18 @@ class MjaiType:
     END_GAME = 'end_game'
 
 
-def mask_bits_to_binary_string(mask_bits):
-    binary_string = bin(mask_bits)[2:]
-    binary_string = binary_string.zfill(46)
-    return binary_string
+MASK_SIZE = 46                  # number of mask bits (mjai actions)
+_MASK_SHIFTS = np.arange(MASK_SIZE, dtype=np.uint64)
 
 
-def mask_bits_to_bool_list(mask_bits):
-    binary_string = mask_bits_to_binary_string(mask_bits)
-    bool_list = []
-    for bit in binary_string[::-1]:
-        bool_list.append(bit == '1')
-    return bool_list
+def mask_bits_to_array(mask_bits:int) -> np.ndarray:
+    """ return bool array of mask bits (bit i -> element i)"""
+    return ((np.uint64(mask_bits) >> _MASK_SHIFTS) & np.uint64(1)).astype(bool)
+
+
+def mask_bits_to_bool_list(mask_bits:int) -> list[bool]:
+    """ return list of mask bits (bit i -> element i)"""
+    return mask_bits_to_array(mask_bits).tolist()
 
 
 def eq(l, r):
@@ -186,14 +186,93 @@ class ActionUnicode:
     RYUKYOKU = "⬛"
     
 
+MJAI_TILE_IDS:dict[str, int] = {tile: i for i, tile in enumerate(MJAI_TILES_SORTED)}
+""" integer tile id of mjai tile. ids are in sorting order: 38 slots, aka doras right before their normal 5"""
+N_TILE_IDS = len(MJAI_TILES_SORTED)
+_TILE_IS_AKA = [tile in MJAI_AKA_DORAS for tile in MJAI_TILES_SORTED]
+_EMPTY_COUNTS = (0,) * N_TILE_IDS
+
+
+def tile_id(tile:str) -> int:
+    """ return integer id of mjai tile"""
+    return MJAI_TILE_IDS[tile]
+
+
+def tile_str(tid:int) -> str:
+    """ return mjai tile of integer id"""
+    return MJAI_TILES_SORTED[tid]
+
+
+def tile_is_aka(tid:int) -> bool:
+    """ return True if tile id is an aka dora"""
+    return _TILE_IS_AKA[tid]
+
+
 def cmp_mjai_tiles(tile1: str, tile2: str):
     """ compare function for sorting tiles"""
-    return MJAI_TILES_SORTED.index(tile1) - MJAI_TILES_SORTED.index(tile2)
+    return MJAI_TILE_IDS[tile1] - MJAI_TILE_IDS[tile2]
 
 
 def sort_mjai_tiles(mjai_tiles:list[str]) -> list[str]:
     """ sort mjai tiles"""
-    return sorted(mjai_tiles, key=cmp_to_key(cmp_mjai_tiles))
+    return sorted(mjai_tiles, key=MJAI_TILE_IDS.__getitem__)
+
+
+class Hand:
+    """ Tiles in hand as counts per tile id (counting sort): add/remove are O(1) and tiles are always sorted"""
+    __slots__ = ('_counts', '_size')
+
+    def __init__(self, tids:Iterable[int]=()):
+        self._counts:list[int] = [0] * N_TILE_IDS
+        self._size:int = 0
+        for tid in tids:
+            self.add(tid)
+
+    @classmethod
+    def from_tiles(cls, tiles:Iterable[str]) -> 'Hand':
+        """ create hand from mjai tiles"""
+        return cls(MJAI_TILE_IDS[t] for t in tiles)
+
+    def set_tiles(self, tiles:Iterable[str]):
+        """ replace hand content with mjai tiles (in place)"""
+        self._counts[:] = _EMPTY_COUNTS
+        self._size = 0
+        for t in tiles:
+            self.add(MJAI_TILE_IDS[t])
+
+    def add(self, tid:int):
+        """ add tile id to hand"""
+        self._counts[tid] += 1
+        self._size += 1
+
+    def remove(self, tid:int):
+        """ remove tile id from hand. raise ValueError if not in hand"""
+        if self._counts[tid] == 0:
+            raise ValueError(f"Tile {tile_str(tid)} not in hand")
+        self._counts[tid] -= 1
+        self._size -= 1
+
+    def pop(self) -> int:
+        """ remove and return the last tile id (in sorting order)"""
+        for tid in range(N_TILE_IDS - 1, -1, -1):
+            if self._counts[tid]:
+                self.remove(tid)
+                return tid
+        raise IndexError("pop from empty hand")
+
+    def ids(self) -> list[int]:
+        """ return sorted tile ids"""
+        return [tid for tid, n in enumerate(self._counts) if n for _ in range(n)]
+
+    def tiles(self) -> list[str]:
+        """ return sorted mjai tiles"""
+        return [tile for tile, n in zip(MJAI_TILES_SORTED, self._counts) if n for _ in range(n)]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, tid:int) -> bool:
+        return self._counts[tid] > 0
 
 
 # sample data structure for mjai reaction - meta
@@ -208,32 +287,43 @@ _sample_meta = {
 }
 
 
-def meta_to_options(meta: dict, is_3p:bool=False) -> list:
+def _mask_bit_table(mask_list:list[str]) -> list[list[tuple[str]]]:
+    """ bit-index table: table[i][byte] = option names of the set bits in the i-th byte of mask bits"""
+    return [
+        [tuple(mask_list[i*8+b] for b in range(8) if byte >> b & 1 and i*8+b < len(mask_list)) for byte in range(256)]
+        for i in range((MASK_SIZE + 7) // 8)
+    ]
+
+_MASK_BIT_TABLE = _mask_bit_table(MJAI_MASK_LIST)
+_MASK_BIT_TABLE_3P = _mask_bit_table(MJAI_MASK_LIST_3P)
+
+
+def mask_bits_to_options(mask_bits:int, is_3p:bool=False) -> list[str]:
+    """ return names of the options in mask bits (in bit order), e.g. ['1m', 'P', 'reach']"""
+    options = []
+    for byte_table in (_MASK_BIT_TABLE_3P if is_3p else _MASK_BIT_TABLE):
+        options.extend(byte_table[mask_bits & 0xff])
+        mask_bits >>= 8
+    return options
+
+
+def meta_to_options(meta: dict, is_3p:bool=False, top_k:int=None) -> list:
     """ Convert meta from mjai reaction msg to readable list of tiles with weights
     params:
         meta object from bot reaction msg, see sample above
+        top_k(int): return only the top k options. None for all
     returns:
-        list of (tile, weights): e.g. [('1m', 0.987532), ('P', 0.011123), ...]
+        list of (tile, weights) sorted by weight: e.g. [('1m', 0.987532), ('P', 0.011123), ...]
     """
-    if is_3p:
-        mask_list = MJAI_MASK_LIST_3P
-    else:
-        mask_list = MJAI_MASK_LIST
-    
-    q_values = meta['q_values']
-    mask_bits = meta['mask_bits']
-    mask = mask_bits_to_bool_list(mask_bits)
-    weight_values = softmax(q_values)
-    
-    q_value_idx = 0
-    option_list = []
-    for i in range(46):
-        if mask[i]:
-            option_list.append((mask_list[i], weight_values[q_value_idx]))
-            q_value_idx += 1
-
-    option_list = sorted(option_list, key=lambda x: x[1], reverse=True)
-    return option_list
+    q_values = np.asarray(meta['q_values'], dtype=np.float64)
+    if q_values.size == 0:
+        return []
+    weights = np.exp(q_values - q_values.max())
+    weights /= weights.sum()
+    order = np.argsort(-weights, kind='stable')[:top_k].tolist()
+    options = mask_bits_to_options(meta['mask_bits'], is_3p)
+    weights = weights.tolist()
+    return [(options[i], weights[i]) for i in order]
 
 
 def decode_mjai_tehai(tehai34, akas, tsumohai) -> tuple[list[str], str]:
@@ -260,23 +350,21 @@ def decode_mjai_tehai(tehai34, akas, tsumohai) -> tuple[list[str], str]:
     return (tile_list, tsumohai)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class GameInfo:
-    """ data class containing game info"""
+    """ immutable snapshot of game info. A new snapshot (with new version) is made only when game info changes"""
     bakaze:str = None               # bakaze 场风
     jikaze:str = None               # self_wind 自风
     kyoku:int = None                # kyoku 局 (under bakaze)
     honba:int = None                # honba 本场 (times of consequetive dealing)
-    my_tehai:list = None            # tiles in hand
+    my_tehai:tuple[str, ...] = ()   # tiles in hand
     my_tsumohai:str = None          # new drawn tile if any
     self_reached:bool = False       # if self is in REACH state
     self_seat:int = None            # self seat index
-    player_reached:list[bool] = field(default_factory=lambda: [False]*4)  # players in REACH state
+    player_reached:tuple[bool, ...] = (False,)*4  # players in REACH state
     is_first_round:bool = False     # if self first round has not passed
-    
+    version:int = 0                 # snapshot version, unique in process. unchanged version = unchanged info
+
     def n_other_reach(self) -> int:
         """ number of other players in reach state"""
-        other_reach = self.player_reached.copy()
-        other_reach.pop(self.self_seat)
-        n = sum(1 for r in other_reach if r)
-        return n
+        return sum(1 for seat, r in enumerate(self.player_reached) if r and seat != self.self_seat)
@@ -30,6 +30,10 @@ class Settings:
         self.inject_process_name:str = self._get_value("inject_process_name", "jantama_mahjongsoul")
         self.language:str = self._get_value("language", list(LAN_OPTIONS.keys())[-1], self.valid_language)  # language code
         self.enable_overlay:bool = self._get_value("enable_overlay", True, self.valid_bool) # not shown
+        self.liqi_native_proto:bool = self._get_value("liqi_native_proto", False, self.valid_bool) # not shown
+        self.ws_capture:bool = self._get_value("ws_capture", False, self.valid_bool) # not shown. record ws capture
+        # process msgs in mitm event loop (async_pipeline.py)
+        self.async_pipeline:bool = self._get_value("async_pipeline", False, self.valid_bool) # not shown
         
         # AI Model settings
         self.model_type:str = self._get_value("model_type", "Local")
@@ -37,6 +41,16 @@ class Settings:
         # for local model
         self.model_file:str = self._get_value("model_file", "mortal.pth")
         self.model_file_3p:str = self._get_value("model_file_3p", "mortal_3p.pth")
+        self.local_model_backend:str = self._get_value(
+            "local_model_backend", utils.BACKEND_EAGER, self.valid_local_backend)
+        # run inference in worker process (bot/local/worker.py)
+        self.local_model_worker:bool = self._get_value("local_model_worker", False, self.valid_bool) # not shown
+        # precompute next tsumo decision (bot/speculative.py)
+        self.local_model_speculative:bool = self._get_value(
+            "local_model_speculative", False, self.valid_bool) # not shown
+        # use shared inference server (bot.local.batch_server) if > 0
+        self.local_model_server_port:int = self._get_value(
+            "local_model_server_port", 0, lambda x: 0 <= x < 65536) # not shown
         # akagi ot model
         self.akagi_ot_url:str = self._get_value("akagi_ot_url", "")
         self.akagi_ot_apikey:str = self._get_value("akagi_ot_apikey", "")
@@ -46,6 +60,8 @@ class Settings:
         self.mjapi_secret:str = self._get_value("mjapi_secret", "")
         self.mjapi_models:list = self._get_value("mjapi_models",[])
         self.mjapi_model_select:str = self._get_value("mjapi_model_select","baseline")
+        # send msgs to MJAPI ahead of decisions
+        self.mjapi_stream:bool = self._get_value("mjapi_stream", False, self.valid_bool) # not shown
         
         # Automation settings
         self.enable_automation:bool = self._get_value("enable_automation", False, self.valid_bool)
@@ -113,6 +129,10 @@ class Settings:
         """ return True if given language code is valid"""
         return (lan_code in LAN_OPTIONS)
     
+    def valid_local_backend(self, backend:str):
+        """ return True if backend is a valid local model backend"""
+        return backend in utils.LOCAL_MODEL_BACKENDS
+
     def valid_mitm_port(self, port:int):
         """ return true if port number if valid"""
         if 1000 <= port <= 65535:
@@ -38,6 +38,7 @@ class Folder:
     UPDATE = "update"
     TEMP = 'temp'
     CHROME_EXT = 'chrome_ext'
+    CAPTURE = 'capture'
 
 
 class GameClientType(Enum):
@@ -55,6 +56,12 @@ class GameMode(Enum):
 # for automation
 GAME_MODES = ['4E', '4S', '3E', '3S']
 
+# inference backends for local Mortal model
+BACKEND_EAGER = "Eager"
+BACKEND_TORCHSCRIPT = "TorchScript"
+BACKEND_INT8 = "Int8 (CPU)"
+LOCAL_MODEL_BACKENDS = [BACKEND_EAGER, BACKEND_TORCHSCRIPT, BACKEND_INT8]
+
 
 class UiState(Enum):
     """ UI State for the game"""
@@ -15,6 +15,7 @@ from typing import Iterable, Iterator
 from common.mj_helper import MjaiType, MSType, MJAI_TILES_19, MJAI_TILES_28, MJAI_TILES_SORTED
 from common.mj_helper import sort_mjai_tiles, cvt_ms2mjai
 from common.log_helper import LOGGER
+from common.latency import TRACER, Stage, DecisionTrace
 from common.settings import Settings
 from common.utils import UiState, GAME_MODES
 
@@ -192,15 +193,17 @@ class ActionStepDelay(ActionStep):
 class AutomationTask:
     """ Managing automation task and its thread
     an automation task corresponds to performing a bot reaction on game client (e.g. click dahai on web client)"""
-    def __init__(self, br:GameBrowser, name:str, desc:str=""):
+    def __init__(self, br:GameBrowser, name:str, desc:str="", trace:DecisionTrace=None):
         """
         params:
             br(GameBrowser): browser object
             name(str): name for the thread and task
-            desc(str): description of the task, for logging and readability"""
+            desc(str): description of the task, for logging and readability
+            trace(DecisionTrace): latency trace to mark step execution on, if any"""
         self.name = name
         self.desc = desc
         self.executor = br
+        self.trace = trace
         self._stop_event = threading.Event()        # set event to stop running
         self.last_exe_time:float = -1               # timestamp for the last actionstep execution
         
@@ -240,6 +243,8 @@ class AutomationTask:
         else:
             raise NotImplementedError(f"Execution not implemented for step type {type(step)}")
         self.last_exe_time = time.time()
+        if self.trace:
+            self.trace.mark(Stage.STEP_PREFIX + type(step).__name__, self.last_exe_time)
         
     def start_action_steps(self, action_steps:Iterable[ActionStep], game_state:GameState = None):
         """ start running action list/iterator in a thread"""
@@ -346,8 +351,9 @@ class Automation:
                 extra_time += 0.5
             else:
                 extra_time += random.uniform(0.75, 1.0)            
-            if gi.n_other_reach() > 0:    # extra time for other reach
-                extra_time += random.uniform(0.20, 0.30) * gi.n_other_reach()
+            n_other_reach = gi.n_other_reach()
+            if n_other_reach > 0:    # extra time for other reach
+                extra_time += random.uniform(0.20, 0.30) * n_other_reach
             extra_time = min(extra_time, 3.0)   # cap extra time
             delay += extra_time
                                 
@@ -419,7 +425,8 @@ class Automation:
             f" (step={op_step},"
             f" calc_time={calc_time:.2f}s, delay={delay:.2f}s, total_delay={calc_time+delay:.2f}s)"
         )
-        self._task = AutomationTask(self.executor, f"Auto_{mjai_type}_{pai}", desc)
+        TRACER.mark(Stage.AUTOMATION)
+        self._task = AutomationTask(self.executor, f"Auto_{mjai_type}_{pai}", desc, TRACER.current)
         self._task.start_action_steps(action_steps, game_state)
         return True
     
@@ -12,6 +12,8 @@ from common import utils
 from common.utils import Folder, FPSCounter, list_children
 from common.log_helper import LOGGER
 
+PAGE_CHECK_INTERVAL = 1.0      # seconds between page alive/zoom checks in browser thread
+
 class GameBrowser:
     """ Wrapper for Playwright browser controlling maj-soul operations
     Browser runs in a thread, and actions are queued to be processed by the thread"""
@@ -147,7 +149,7 @@ class GameBrowser:
             while self._stop_event.is_set() is False:
                 self.fps_counter.frame()
                 try:        # test if page is stil alive
-                    if time.time() - self._last_update_time > 1:
+                    if time.time() - self._last_update_time > PAGE_CHECK_INTERVAL:
                         self._page_title = self.page.title()
                         # check zoom level
                         self.zoomlevel_check = self.page.evaluate("() => window.devicePixelRatio")
@@ -156,12 +158,13 @@ class GameBrowser:
                     LOGGER.warning("Page error %s. exiting.", e)
                     break
 
-                try:
-                    action = self._action_queue.get_nowait()
+                try:    # block until next action or next page check
+                    timeout = max(0.0, self._last_update_time + PAGE_CHECK_INTERVAL - time.time())
+                    action = self._action_queue.get(True, timeout)
                     action()
                     # LOGGER.debug("Browser action %s",str(action))
                 except queue.Empty:
-                    time.sleep(0.002)
+                    pass
                 except Exception as e:
                     LOGGER.error('Error processing action: %s', e, exc_info=True)
 
@@ -192,6 +195,7 @@ class GameBrowser:
         """ Shutdown browser thread"""
         if self.is_running():
             self._stop_event.set()
+            self._action_queue.put(lambda: None)    # wake up the thread blocked on action queue
             if join_thread:
                 self._browser_thread.join()
             self._browser_thread = None
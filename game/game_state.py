@@ -3,6 +3,9 @@ This module processes Majsoul game state and take liqi messages as inputs,
 and interfaces with AI bot to generate reactions.
 """
 import time
+import itertools
+
+import numpy as np
 
 from liqi import MsgType
 from liqi import LiqiProto, LiqiMethod, LiqiAction
@@ -10,6 +13,7 @@ from liqi import LiqiProto, LiqiMethod, LiqiAction
 import common.mj_helper as mj_helper
 from common.mj_helper import MjaiType, GameInfo, MJAI_WINDS, ChiPengGang, MSGangType
 from common.log_helper import LOGGER
+from common.latency import TRACER, Stage
 from common.utils import GameMode
 from bot import Bot, reaction_convert_meta
 
@@ -30,22 +34,129 @@ NO_EFFECT_METHODS = [
     '.lq.NotifyPlayerConnectionState',      # 
 ]
 
+_INFO_VERSIONS = itertools.count(1)     # GameInfo versions, unique across GameState objects
+
+# KyokuState array sizes and river flags
+N_SEATS = 4
+MAX_RIVER = 40              # max discards per seat in a kyoku (3p: ~19 draws + rinshan/nukidora + calls)
+MAX_MELDS = 4               # max open/closed melds per seat
+MAX_DORAS = 5               # dora markers: 1 + 4 kans
+RIVER_TSUMOGIRI = 1         # river flag: discarded tsumohai
+RIVER_REACH = 2             # river flag: reach declaration tile
+RIVER_CALLED = 4            # river flag: taken by other player's chi/pon/daiminkan
+MELD_TYPES = (MjaiType.CHI, MjaiType.PON, MjaiType.DAIMINKAN, MjaiType.ANKAN, MjaiType.KAKAN)
+""" meld types by meld code in KyokuState.meld_types"""
+
 class KyokuState:
-    """ data class for kyoku info, will be reset every newround"""
+    """ kyoku info, reset in place every newround.
+    Per-seat state is kept in fixed-size numpy arrays (tile ids are mj_helper.tile_id, -1 = empty):
+    rivers (discards with RIVER_* flags), melds (MELD_TYPES code, tiles, from seat), reach and nukidora"""
+    __slots__ = (
+        'bakaze', 'jikaze', 'kyoku', 'honba', 'my_tehai', 'my_tsumohai', 'dora_markers', 'n_doras',
+        'pending_reach_acc', 'first_round', 'self_in_reach', 'player_reach', 'nukidora',
+        'river_tiles', 'river_flags', 'river_len', 'meld_types', 'meld_tiles', 'meld_from', 'n_melds',
+    )
+
     def __init__(self) -> None:
+        self.my_tehai = mj_helper.Hand()    # tehai as tile ids (mj_helper.tile_id)
+        self.dora_markers = np.full(MAX_DORAS, -1, dtype=np.int8)              # dora marker tile ids
+        self.player_reach = np.zeros(N_SEATS, dtype=np.bool_)                   # player reach states
+        self.nukidora = np.zeros(N_SEATS, dtype=np.int8)                        # nukidora count per seat
+        self.river_tiles = np.full((N_SEATS, MAX_RIVER), -1, dtype=np.int8)     # discarded tile ids
+        self.river_flags = np.zeros((N_SEATS, MAX_RIVER), dtype=np.int8)        # RIVER_* flags of discards
+        self.river_len = np.zeros(N_SEATS, dtype=np.int8)                       # number of discards
+        self.meld_types = np.full((N_SEATS, MAX_MELDS), -1, dtype=np.int8)      # MELD_TYPES code
+        self.meld_tiles = np.full((N_SEATS, MAX_MELDS, 4), -1, dtype=np.int8)   # consumed tiles + called tile
+        self.meld_from = np.full((N_SEATS, MAX_MELDS), -1, dtype=np.int8)       # seat the called tile is from
+        self.n_melds = np.zeros(N_SEATS, dtype=np.int8)                         # number of melds
+        self.reset()
+
+    def reset(self):
+        """ reset to the state before a new round, reusing the arrays"""
         self.bakaze:str = None              # Bakaze (場風)
         self.jikaze :str = None             # jikaze jifu (自风)
         self.kyoku:int = None               # Kyoku (局)
         self.honba:int = None               # Honba (本場)
-        self.my_tehai:list = None           # list of tehai in mjai format
-        self.my_tsumohai:str = None         # tsumohai in mjai format, or None
-        self.doras_ms:list[str] = []        # list of doras in ms tile format
+        self.my_tehai.set_tiles(())
+        self.my_tsumohai:int = None         # tsumohai tile id, or None
+        self.dora_markers.fill(-1)
+        self.n_doras:int = 0                # number of dora markers
 
         ### flags
         self.pending_reach_acc:dict = None  # Pending MJAI reach accepted message
         self.first_round:bool = True        # flag marking if it is the first move in new round
         self.self_in_reach:bool = False     # if self is in reach state
-        self.player_reach:list = [False]*4  # list of player reach states
+        self.player_reach.fill(False)
+        self.nukidora.fill(0)
+
+        ### rivers and melds
+        self.river_tiles.fill(-1)
+        self.river_flags.fill(0)
+        self.river_len.fill(0)
+        self.meld_types.fill(-1)
+        self.meld_tiles.fill(-1)
+        self.meld_from.fill(-1)
+        self.n_melds.fill(0)
+
+    def add_dora(self, tile:str):
+        """ add dora marker (mjai tile)"""
+        if self.n_doras < MAX_DORAS:
+            self.dora_markers[self.n_doras] = mj_helper.tile_id(tile)
+            self.n_doras += 1
+
+    def add_discard(self, seat:int, tile:str, tsumogiri:bool, is_reach:bool):
+        """ add discarded mjai tile to seat's river"""
+        n = self.river_len[seat]
+        if n >= MAX_RIVER:
+            LOGGER.warning("River of seat %d is full, discard %s not recorded", seat, tile)
+            return
+        self.river_tiles[seat, n] = mj_helper.tile_id(tile)
+        self.river_flags[seat, n] = (RIVER_TSUMOGIRI if tsumogiri else 0) | (RIVER_REACH if is_reach else 0)
+        self.river_len[seat] = n + 1
+
+    def add_meld(self, seat:int, meld_type:str, target:int, pai:str | None, consumed:list[str]):
+        """ add meld of seat. For chi/pon/daiminkan, the target's last discard is marked as called
+        params:
+            meld_type(str): one of MELD_TYPES
+            target(int): seat the called tile is from (seat itself for ankan)
+            pai(str): called tile, None for ankan
+            consumed(list[str]): tiles from seat's hand"""
+        if meld_type == MjaiType.KAKAN:     # kakan upgrades the pon of the same tiles
+            pon = MELD_TYPES.index(MjaiType.PON)
+            pon_ids = sorted(mj_helper.tile_id(c) for c in consumed)
+            for k in range(self.n_melds[seat]):
+                if self.meld_types[seat, k] == pon and sorted(self.meld_tiles[seat, k, :3].tolist()) == pon_ids:
+                    self.meld_types[seat, k] = MELD_TYPES.index(MjaiType.KAKAN)
+                    self.meld_tiles[seat, k, 3] = mj_helper.tile_id(pai)
+                    return
+            consumed = consumed + [pai]    # pon not known (e.g. no history): record as new meld
+            pai = None
+        if target != seat and self.river_len[target]:
+            self.river_flags[target, self.river_len[target] - 1] |= RIVER_CALLED
+        k = self.n_melds[seat]
+        if k >= MAX_MELDS:
+            LOGGER.warning("Melds of seat %d are full, %s not recorded", seat, meld_type)
+            return
+        tiles = consumed if pai is None else consumed + [pai]
+        self.meld_types[seat, k] = MELD_TYPES.index(meld_type)
+        self.meld_tiles[seat, k, :len(tiles)] = [mj_helper.tile_id(t) for t in tiles]
+        self.meld_from[seat, k] = target
+        self.n_melds[seat] = k + 1
+
+    def river(self, seat:int) -> list[str]:
+        """ return discarded mjai tiles of seat in order (see river_flags for tsumogiri/reach/called)"""
+        return [mj_helper.tile_str(t) for t in self.river_tiles[seat, :self.river_len[seat]].tolist()]
+
+    def melds(self, seat:int) -> list[tuple[str, list[str]]]:
+        """ return melds of seat as [(mjai meld type, mjai tiles)]"""
+        return [
+            (MELD_TYPES[self.meld_types[seat, k]], [mj_helper.tile_str(t) for t in self.meld_tiles[seat, k].tolist() if t >= 0])
+            for k in range(self.n_melds[seat])
+        ]
+
+    def dora_marker_tiles(self) -> list[str]:
+        """ return dora markers as mjai tiles"""
+        return [mj_helper.tile_str(t) for t in self.dora_markers[:self.n_doras].tolist()]
 
 class GameState:
     """ Stores Majsoul game state and processes inputs outputs to/from Bot"""
@@ -69,6 +180,8 @@ class GameState:
         #1-2-3 then goes counter-clockwise        
         self.player_scores:list = None          # player scores        
         self.kyoku_state:KyokuState = KyokuState()  # kyoku info - cleared every newround        
+        self.info_version:int = next(_INFO_VERSIONS)    # version of game info. renewed when game info changes
+        self._game_info:GameInfo = None         # game info snapshot of info_version
         
         ### about last reaction
         self.last_reaction:dict = None          # last bot output reaction
@@ -83,25 +196,35 @@ class GameState:
         self.is_round_started:bool = False
         """ if any new round has started (so game info is available)"""
         self.is_game_ended:bool = False         # if game has ended    
+        self._sync_inputs:list[dict] = None     # mjai msgs collected for the bot during bulk resync, else None
+        self._sync_last_fed:bool = False        # if the current sync msg fed msgs to the bot
              
     def get_game_info(self) -> GameInfo:
-        """ Return game info. Return None if N/A"""        
-        if self.is_round_started:
+        """ Return game info snapshot (immutable, shared until game info changes). Return None if N/A"""
+        if not self.is_round_started:   # if game not started: None
+            return None
+        gi = self._game_info
+        version = self.info_version     # read before the fields, so a snapshot is never newer than its version
+        if gi is None or gi.version != version:
             gi = GameInfo(
                 bakaze = self.kyoku_state.bakaze,
                 jikaze = self.kyoku_state.jikaze,
                 kyoku = self.kyoku_state.kyoku,
                 honba = self.kyoku_state.honba,
-                my_tehai = self.kyoku_state.my_tehai,
-                my_tsumohai = self.kyoku_state.my_tsumohai,
+                my_tehai = tuple(self.kyoku_state.my_tehai.tiles()),
+                my_tsumohai = self._my_tsumohai_str(),
                 self_reached = self.kyoku_state.self_in_reach,
                 self_seat = self.seat,
-                player_reached = self.kyoku_state.player_reach.copy(),
-                is_first_round = self.kyoku_state.first_round,                
+                player_reached = tuple(self.kyoku_state.player_reach.tolist()),
+                is_first_round = self.kyoku_state.first_round,
+                version = version,
             )
-            return gi
-        else:   # if game not started: None
-            return None
+            self._game_info = gi
+        return gi
+
+    def _info_changed(self):
+        """ mark game info as changed. call after changing kyoku state fields shown in GameInfo"""
+        self.info_version = next(_INFO_VERSIONS)
     
     # def _update_info_from_bot(self):
     #     if self.is_round_started:
@@ -122,7 +245,8 @@ class GameState:
         """ Input Majsoul liqi msg for processing and return result MJAI msg if any. 
         
         params:
-            liqi_msg(dict): parsed Majsoul message in liqi dict format
+            liqi_msg(dict): parsed Majsoul message in liqi dict format.
+                liqi_msg['data'] can be dict (MessageToDict) or liqi.ProtoView (native proto mode)
         returns:
             dict: Mjai message in dict format (i.e. AI's reaction) if any. May be None.
         """
@@ -136,6 +260,7 @@ class GameState:
             self.last_reaction_pending = True
             self.last_reaction_time = time_used
         self.is_bot_calculating = False
+        TRACER.mark(Stage.GAME_STATE)
         return reaction
     
     def _input_inner(self, liqi_msg: dict) -> dict | None:        
@@ -196,7 +321,9 @@ class GameState:
                 return self.ms_new_round(liqi_data)
             
             else:   # other rounds                             
-                self.kyoku_state.first_round = False        # not first round       
+                if self.kyoku_state.first_round:
+                    self.kyoku_state.first_round = False        # not first round       
+                    self._info_changed()
                 return self.ms_action_prototype(liqi_data) 
         
         # end_game
@@ -220,21 +347,35 @@ class GameState:
     
     def ms_sync_game(self, liqi_data:dict) -> dict:
         """ Sync Game
-        Every game start there is sync message (may contain no data)"""
+        Every game start there is sync message (may contain no data)
+        Bulk resync: restore actions are decoded in one pass and processed for game state, collecting the mjai msgs
+        that would be fed to the bot. They are fed in one react_batch, where only the last msg may act"""
         self.is_ms_syncing = True
         LOGGER.debug('Start syncing game')
-        sync_msgs = LiqiProto().parse_syncGame(liqi_data)
-        reacts = []
-        for msg in sync_msgs:
-            LOGGER.debug("sync msg: %s", msg)
-            react = self.input(msg)
-            reacts.append(react)
-        LOGGER.debug('Finished syncing game')
+        start_time = time.perf_counter()
+        sync_msgs = LiqiProto().parse_syncGame(liqi_data, as_view=True)
+        decode_time = time.perf_counter()
+        self._sync_inputs = []
+        try:
+            for msg in sync_msgs:
+                LOGGER.debug("sync msg: %s", msg)
+                self._sync_last_fed = False
+                self._input_inner(msg)
+            sync_inputs = self._sync_inputs
+        finally:
+            self._sync_inputs = None
+        state_time = time.perf_counter()
+        reaction = None
+        if sync_inputs:
+            if not self._sync_last_fed:     # last sync msg made no bot decision
+                sync_inputs[-1]['can_act'] = False
+            reaction = self._feed_bot(sync_inputs)
+        end_time = time.perf_counter()
+        LOGGER.info("Synced game: %d actions -> %d mjai msgs in %.1f ms (decode %.1f, state %.1f, bot %.1f)",
+            len(sync_msgs), len(sync_inputs), (end_time - start_time) * 1000, (decode_time - start_time) * 1000,
+            (state_time - decode_time) * 1000, (end_time - state_time) * 1000)
         self.is_ms_syncing = False
-        if reacts:
-            return reacts[-1]
-        else:
-            return None
+        return reaction
     
     def ms_auth_game(self, liqi_data:dict) -> dict:
         """ Game start, initial info"""
@@ -271,13 +412,13 @@ class GameState:
     
     def ms_new_round(self, liqi_data:dict) -> dict:
         """ Start kyoku """
-        self.kyoku_state = KyokuState()
+        self.kyoku_state.reset()
         self.mjai_pending_input_msgs = []
 
         liqi_data_data = liqi_data['data']
         self.kyoku_state.bakaze = MJAI_WINDS[liqi_data_data['chang']]
         dora_marker = mj_helper.cvt_ms2mjai(liqi_data_data['doras'][0])
-        self.kyoku_state.doras_ms = [dora_marker]
+        self.kyoku_state.add_dora(dora_marker)
         self.kyoku_state.honba = liqi_data_data['ben']
         oya = liqi_data_data['ju']           # oya is also the seat id of East
         self.kyoku_state.kyoku = oya + 1
@@ -288,26 +429,24 @@ class GameState:
             self.player_scores = self.player_scores + [0]
         tehais_mjai = [['?']*13]*4        
         my_tehai_ms = liqi_data_data['tiles']
-        self.kyoku_state.my_tehai = [mj_helper.cvt_ms2mjai(tile) for tile in my_tehai_ms]
-        self.kyoku_state.my_tehai = mj_helper.sort_mjai_tiles(self.kyoku_state.my_tehai)
+        self.kyoku_state.my_tehai.set_tiles(mj_helper.cvt_ms2mjai(tile) for tile in my_tehai_ms)
         
         # For starting hand, if player is East, majsoul gives 14 tiles + no tsumohai
         # mjai accepts 13 tiles + following tsumohai event
         # In Majsoul, last one of sorted tiles is the tsumohai
         if len(self.kyoku_state.my_tehai) == 14:        # self is East
             assert self.seat == oya
-            self.kyoku_state.my_tsumohai = self.kyoku_state.my_tehai[-1]
-            self.kyoku_state.my_tehai.pop()
-            tehais_mjai[self.seat] = self.kyoku_state.my_tehai     # take first 13 tiles
+            self.kyoku_state.my_tsumohai = self.kyoku_state.my_tehai.pop()
+            tehais_mjai[self.seat] = self.kyoku_state.my_tehai.tiles()     # take first 13 tiles
 
             tsumo_msg = {
                 'type': MjaiType.TSUMO,
                 'actor': self.seat,
-                'pai': self.kyoku_state.my_tsumohai
+                'pai': self._my_tsumohai_str()
                 }
             
         elif len(self.kyoku_state.my_tehai) == 13:      # self not East
-            tehais_mjai[self.seat] = self.kyoku_state.my_tehai
+            tehais_mjai[self.seat] = self.kyoku_state.my_tehai.tiles()
             tsumo_msg = {
                 'type': MjaiType.TSUMO,
                 'actor': oya,
@@ -333,8 +472,21 @@ class GameState:
             self.mjai_pending_input_msgs.append(tsumo_msg)
         
         self.is_round_started = True
+        self._info_changed()
         return self._react_all(liqi_data_data)
     
+    def _my_tsumohai_str(self) -> str | None:
+        """ return my tsumohai in mjai format, or None"""
+        if self.kyoku_state.my_tsumohai is None:
+            return None
+        return mj_helper.tile_str(self.kyoku_state.my_tsumohai)
+
+    def _merge_tsumohai(self):
+        """ move my tsumohai (if any) into tehai"""
+        if self.kyoku_state.my_tsumohai is not None:
+            self.kyoku_state.my_tehai.add(self.kyoku_state.my_tsumohai)
+            self.kyoku_state.my_tsumohai = None
+
     def ms_action_prototype(self, liqi_data:dict) -> dict:
         """ process actionPrototype msg, generate mjai msg and have mjai react to it"""        
         liqi_data_name = liqi_data['name']
@@ -349,14 +501,15 @@ class GameState:
             # Process dora events
             # According to mjai.app, in the case of an ankan, the dora event comes first, followed by the tsumo event.
             if 'doras' in liqi_data_data:
-                if len(liqi_data_data['doras']) > len(self.kyoku_state.doras_ms):
+                if len(liqi_data_data['doras']) > self.kyoku_state.n_doras:
                     self.mjai_pending_input_msgs.append(
                         {
                             'type': MjaiType.DORA,
                             'dora_marker': mj_helper.cvt_ms2mjai(liqi_data_data['doras'][-1])
                         }
                     )
-                    self.kyoku_state.doras_ms = liqi_data_data['doras']        
+                    for dora in liqi_data_data['doras'][self.kyoku_state.n_doras:]:
+                        self.kyoku_state.add_dora(mj_helper.cvt_ms2mjai(dora))
         
         # LiqiAction.DealTile -> MJAI_TYPE.TSUMO
         if liqi_data_name == LiqiAction.DealTile:
@@ -365,7 +518,8 @@ class GameState:
                 tile_mjai = '?'
             else:           # my tsumo
                 tile_mjai = mj_helper.cvt_ms2mjai(liqi_data_data['tile'])
-                self.kyoku_state.my_tsumohai = tile_mjai
+                self.kyoku_state.my_tsumohai = mj_helper.tile_id(tile_mjai)
+                self._info_changed()
             self.mjai_pending_input_msgs.append(
                 {
                     'type': MjaiType.TSUMO,
@@ -381,17 +535,16 @@ class GameState:
             tile_mjai = mj_helper.cvt_ms2mjai(liqi_data_data['tile'])
             tsumogiri = liqi_data_data['moqie']
             if actor == self.seat:  # update self hand info
-                if self.kyoku_state.my_tsumohai:                
-                    self.kyoku_state.my_tehai.append(self.kyoku_state.my_tsumohai)
-                    self.kyoku_state.my_tsumohai = None
-                self.kyoku_state.my_tehai.remove(tile_mjai)
-                self.kyoku_state.my_tehai = mj_helper.sort_mjai_tiles(self.kyoku_state.my_tehai)            
+                self._merge_tsumohai()
+                self.kyoku_state.my_tehai.remove(mj_helper.tile_id(tile_mjai))
+                self._info_changed()
             
             if liqi_data_data['isLiqi']:     # Player declares reach
                 if liqi_data_data['seat'] == self.seat:  # self reach
                     self.kyoku_state.self_in_reach = True                    
                 
                 self.kyoku_state.player_reach[actor] = True
+                self._info_changed()
                 self.mjai_pending_input_msgs.append(
                     {
                         'type': MjaiType.REACH,
@@ -412,6 +565,7 @@ class GameState:
                     'tsumogiri': tsumogiri
                 }
             )
+            self.kyoku_state.add_discard(actor, tile_mjai, tsumogiri, liqi_data_data['isLiqi'])
                 
             return self._react_all(liqi_data_data)        
         
@@ -429,8 +583,8 @@ class GameState:
                     consumed_mjai.append(mj_helper.cvt_ms2mjai(liqi_data_data['tiles'][idx]))
             if actor == self.seat:  # update my hand info
                 for c in consumed_mjai:
-                    self.kyoku_state.my_tehai.remove(c)                
-                self.kyoku_state.my_tehai = mj_helper.sort_mjai_tiles(self.kyoku_state.my_tehai)
+                    self.kyoku_state.my_tehai.remove(mj_helper.tile_id(c))
+                self._info_changed()
                 
             assert target != actor
             assert len(consumed_mjai) != 0
@@ -447,6 +601,7 @@ class GameState:
                             'consumed': consumed_mjai
                         }
                     )
+                    self.kyoku_state.add_meld(actor, MjaiType.CHI, target, tile_mjai, consumed_mjai)
                 case ChiPengGang.Peng:
                     assert len(consumed_mjai) == 2
                     self.mjai_pending_input_msgs.append(
@@ -458,6 +613,7 @@ class GameState:
                             'consumed': consumed_mjai
                         }
                     )
+                    self.kyoku_state.add_meld(actor, MjaiType.PON, target, tile_mjai, consumed_mjai)
                 case ChiPengGang.Gang:
                     assert len(consumed_mjai) == 3
                     self.mjai_pending_input_msgs.append(
@@ -469,6 +625,7 @@ class GameState:
                             'consumed': consumed_mjai
                         }
                     )
+                    self.kyoku_state.add_meld(actor, MjaiType.DAIMINKAN, target, tile_mjai, consumed_mjai)
                 case _:
                     raise ValueError(f"Unknown ChiPengGang type {liqi_data_data['type']}")
             return self._react_all(liqi_data_data)
@@ -484,11 +641,10 @@ class GameState:
                         consumed_mjai[0] += 'r'
                     
                     if actor == self.seat:      # update hand info. ankan is after tsumo, so there is tsumohai
-                        self.kyoku_state.my_tehai.append(self.kyoku_state.my_tsumohai)
-                        self.kyoku_state.my_tsumohai = None
+                        self._merge_tsumohai()
                         for c in consumed_mjai:
-                            self.kyoku_state.my_tehai.remove(c)
-                        self.kyoku_state.my_tehai = mj_helper.sort_mjai_tiles(self.kyoku_state.my_tehai)                        
+                            self.kyoku_state.my_tehai.remove(mj_helper.tile_id(c))
+                        self._info_changed()
 
                     self.mjai_pending_input_msgs.append(
                         {
@@ -497,6 +653,7 @@ class GameState:
                             'consumed': consumed_mjai
                         }
                     )
+                    self.kyoku_state.add_meld(actor, MjaiType.ANKAN, actor, None, consumed_mjai)
                 case MSGangType.AddGang:
                     tile_mjai = mj_helper.cvt_ms2mjai(liqi_data_data['tiles'])
                     consumed_mjai = [tile_mjai.replace("r", "")] * 3
@@ -504,10 +661,9 @@ class GameState:
                         consumed_mjai[0] = consumed_mjai[0] + "r"
                     
                     if actor == self.seat:      # update hand info. kakan is after tsumo, so there is tsumohai
-                        self.kyoku_state.my_tehai.append(self.kyoku_state.my_tsumohai)
-                        self.kyoku_state.my_tsumohai = None
-                        self.kyoku_state.my_tehai.remove(tile_mjai)
-                        self.kyoku_state.my_tehai = mj_helper.sort_mjai_tiles(self.kyoku_state.my_tehai)
+                        self._merge_tsumohai()
+                        self.kyoku_state.my_tehai.remove(mj_helper.tile_id(tile_mjai))
+                        self._info_changed()
                         
                     self.mjai_pending_input_msgs.append(
                         {
@@ -517,16 +673,16 @@ class GameState:
                             'consumed': consumed_mjai
                         }
                     )
+                    self.kyoku_state.add_meld(actor, MjaiType.KAKAN, actor, tile_mjai, consumed_mjai)
             return self._react_all(liqi_data_data)
         
         # (3p Mahjong only) LiqiAction.BaBei -> MJAI NUKIDORA
         elif liqi_data_name == LiqiAction.BaBei:
             actor = liqi_data_data['seat']
             if actor == self.seat:      # update hand info. babei is after tsumo, so there is tsumohai
-                self.kyoku_state.my_tehai.append(self.kyoku_state.my_tsumohai)
-                self.kyoku_state.my_tsumohai = None
-                self.kyoku_state.my_tehai.remove('N')
-                self.kyoku_state.my_tehai = mj_helper.sort_mjai_tiles(self.kyoku_state.my_tehai)
+                self._merge_tsumohai()
+                self.kyoku_state.my_tehai.remove(mj_helper.tile_id('N'))
+                self._info_changed()
             
             self.mjai_pending_input_msgs.append(
                 {
@@ -535,6 +691,7 @@ class GameState:
                     'pai': 'N'
                 }
             )
+            self.kyoku_state.nukidora[actor] += 1
             return self._react_all(liqi_data_data)
         
         # LiqiAction.Hule -> MJAI END_KYOKU
@@ -598,18 +755,31 @@ class GameState:
         """
         if data: 
             if 'operation' not in data or 'operationList' not in data['operation'] or len(data['operation']['operationList']) == 0:
+                if self._sync_inputs is None and self.mjai_pending_input_msgs:
+                    self.mjai_bot.feed_ahead(self.mjai_pending_input_msgs)     # no decision: bot may send ahead
                 return None
+        pending_msgs = self.mjai_pending_input_msgs
+        self.mjai_pending_input_msgs = [] # clear intput queue
+        if self._sync_inputs is not None:  # bulk resync: fed all at once at the end of sync
+            self._sync_inputs.extend(pending_msgs)
+            self._sync_last_fed = True
+            return None
+        return self._feed_bot(pending_msgs)
+
+    def _feed_bot(self, input_msgs:list[dict]) -> dict | None:
+        """ Feed mjai msgs to AI bot and return the reaction to the last one (with meta converted), or None"""
+        TRACER.mark(Stage.REACT_START)
         try:
-            if len(self.mjai_pending_input_msgs) == 1:
-                LOGGER.info("Bot in: %s", self.mjai_pending_input_msgs[0])
-                output_reaction = self.mjai_bot.react(self.mjai_pending_input_msgs[0])
+            if len(input_msgs) == 1:
+                LOGGER.info("Bot in: %s", input_msgs[0])
+                output_reaction = self.mjai_bot.react(input_msgs[0])
             else:
-                LOGGER.info("Bot in (batch):\n%s", '\n'.join(str(m) for m in self.mjai_pending_input_msgs))
-                output_reaction = self.mjai_bot.react_batch(self.mjai_pending_input_msgs)
+                LOGGER.info("Bot in (batch):\n%s", '\n'.join(str(m) for m in input_msgs))
+                output_reaction = self.mjai_bot.react_batch(input_msgs)
         except Exception as e:
             LOGGER.error("Bot react error: %s", e, exc_info=True)
             output_reaction = None
-        self.mjai_pending_input_msgs = [] # clear intput queue
+        TRACER.mark(Stage.REACT_END)
         
         if output_reaction is None:
             return None
@@ -8,7 +8,7 @@ import os
 import tkinter as tk
 from tkinter import ttk, messagebox
 
-from bot_manager import BotManager, mjai_reaction_2_guide
+from bot_manager import BotManager
 from common.utils import Folder, GameMode, GAME_MODES, GameClientType
 from common.utils import UiState, sub_file, error_to_str
 from common.log_helper import LOGGER, LogHelper
@@ -152,6 +152,7 @@ class MainGUI(tk.Tk):
         self.grid_frame.grid_rowconfigure(cur_row, weight=0)
         cur_row += 1
         self.gameinfo_var = tk.StringVar()
+        self._gameinfo_version = -1      # version of GameInfo shown in gameinfo_var
         self.text_gameinfo = tk.Label(
             self.grid_frame,
             textvariable=self.gameinfo_var,
@@ -316,9 +317,9 @@ class MainGUI(tk.Tk):
                 sw.switch_off()
 
         # Update AI guide from Reaction
-        pending_reaction = self.bot_manager.get_pending_reaction()
-        if pending_reaction:
-            ai_guide_str, options = mjai_reaction_2_guide(pending_reaction, 3, self.st.lan())
+        pending_guide = self.bot_manager.get_pending_guide(3)
+        if pending_guide:
+            ai_guide_str, options = pending_guide
             ai_guide_str += '\n'
             for tile_str, weight in options:
                 ai_guide_str += f" {tile_str:8}  {weight*100:4.0f}%\n"
@@ -328,15 +329,18 @@ class MainGUI(tk.Tk):
 
         # update game info: display tehai + tsumohai
         gi:GameInfo = self.bot_manager.get_game_info()
-        if gi and gi.my_tehai:
-            tehai = gi.my_tehai
-            tsumohai = gi.my_tsumohai
-            hand_str = ''.join(MJAI_TILE_2_UNICODE[t] for t in tehai)
-            if tsumohai:
-                hand_str += f" + {MJAI_TILE_2_UNICODE[tsumohai]}"
-            self.gameinfo_var.set(hand_str)
-        else:
-            self.gameinfo_var.set("")
+        gi_version = gi.version if gi else 0
+        if gi_version != self._gameinfo_version:     # skip if game info not changed since last update
+            self._gameinfo_version = gi_version
+            if gi and gi.my_tehai:
+                tehai = gi.my_tehai
+                tsumohai = gi.my_tsumohai
+                hand_str = ''.join(MJAI_TILE_2_UNICODE[t] for t in tehai)
+                if tsumohai:
+                    hand_str += f" + {MJAI_TILE_2_UNICODE[tsumohai]}"
+                self.gameinfo_var.set(hand_str)
+            else:
+                self.gameinfo_var.set("")
 
         # bot/model info
         if self.bot_manager.is_bot_created():
@@ -354,7 +358,11 @@ class MainGUI(tk.Tk):
             elif self.bot_manager.is_bot_calculating():
                 self.model_bar.update_column(1, '⌛ ' + self.st.lan().CALCULATING)
             else:
-                self.model_bar.update_column(1, 'ℹ️' + self.bot_manager.bot.info_str)
+                info_str = 'ℹ️' + self.bot_manager.bot.info_str
+                latency_str = self.bot_manager.get_latency_summary()
+                if latency_str:
+                    info_str += f" ⏱{latency_str}"
+                self.model_bar.update_column(1, info_str)
         else:   # bot is not ready
             if self.bot_manager.is_loading_bot:
                 text = self.st.lan().MODEL_LOADING
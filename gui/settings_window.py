@@ -3,7 +3,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 
 from common.utils import Folder
-from common.utils import list_children
+from common.utils import list_children, LOCAL_MODEL_BACKENDS
 from common.log_helper import LOGGER
 from common.settings import Settings
 from common.lan_str import LAN_OPTIONS
@@ -122,6 +122,13 @@ class SettingsWindow(tk.Toplevel):
         self.model_type_var = tk.StringVar(value=self.st.model_type)
         select_menu = ttk.Combobox(main_frame, textvariable=self.model_type_var, values=MODEL_TYPE_STRINGS, state="readonly", width=std_wid)
         select_menu.grid(row=cur_row, column=1, **args_entry)
+        # local model backend
+        _label = ttk.Label(main_frame, text=self.st.lan().LOCAL_MODEL_BACKEND)
+        _label.grid(row=cur_row, column=2, **args_label)
+        self.local_backend_var = tk.StringVar(value=self.st.local_model_backend)
+        select_menu = ttk.Combobox(main_frame, textvariable=self.local_backend_var, values=LOCAL_MODEL_BACKENDS,
+            state="readonly", width=std_wid)
+        select_menu.grid(row=cur_row, column=3, **args_entry)
         
         # Select Model File
         model_files = [""] + list_children(Folder.MODEL)
@@ -288,6 +295,7 @@ class SettingsWindow(tk.Toplevel):
         
         # models
         model_type_new = self.model_type_var.get()
+        local_backend_new = self.local_backend_var.get()
         model_file_new = self.model_file_var.get()
         mode_file_3p_new = self.model_file_3p_var.get()
         akagi_url_new = self.akagiot_url_var.get()
@@ -298,6 +306,7 @@ class SettingsWindow(tk.Toplevel):
         mjapi_model_select_new = self.mjapi_model_select_var.get()        
         if (
             self.st.model_type != model_type_new or
+            self.st.local_model_backend != local_backend_new or
             self.st.model_file != model_file_new or
             self.st.model_file_3p != mode_file_3p_new or
             self.st.akagi_ot_url != akagi_url_new or
@@ -333,6 +342,7 @@ class SettingsWindow(tk.Toplevel):
         self.st.enable_proxinject = proxy_inject_new
         
         self.st.model_type = model_type_new
+        self.st.local_model_backend = local_backend_new
         self.st.model_file = model_file_new
         self.st.model_file_3p = mode_file_3p_new
         self.st.akagi_ot_url = akagi_url_new
@@ -3,12 +3,20 @@
 """
 
 import json
+import math
 import struct
 import base64
 from enum import Enum
-from typing import List, Dict
+from dataclasses import dataclass
+from functools import lru_cache, cached_property
+from typing import List, Dict, Iterator
+from collections.abc import Mapping
+
+import numpy as np
 
 from google.protobuf.json_format import MessageToDict, ParseDict
+from google.protobuf.descriptor import FieldDescriptor
+from google.protobuf.internal import type_checkers
 import common.utils as utils
 from liqi_proto import liqi_pb2 as pb
 from common.log_helper import LOGGER
@@ -59,32 +67,228 @@ class LiqiAction:
     
 
 keys = [0x84, 0x5e, 0x4e, 0x42, 0x39, 0xa2, 0x1f, 0x60, 0x1c]
+_KEYS_NP = np.array(keys, dtype=np.int64)
 
 
-def decode(data: bytes):
+@lru_cache(maxsize=1024)
+def _keystream(length:int) -> np.ndarray:
+    """ return the XOR keystream (uint8 array) for a payload of given length.
+    u[i] = ((23 ^ length) + 5 * i + keys[i % 9]) & 255, cached per length"""
+    idx = np.arange(length, dtype=np.int64)
+    stream = ((23 ^ length) + 5 * idx + _KEYS_NP[idx % len(keys)]) & 255
+    stream = stream.astype(np.uint8)
+    stream.flags.writeable = False
+    return stream
+
+
+def _xor_keystream(data:bytes) -> bytes:
+    """ apply the rolling XOR key to the whole buffer in one operation"""
+    if not data:
+        return bytes(data)
+    buf = np.frombuffer(data, dtype=np.uint8)
+    return np.bitwise_xor(buf, _keystream(len(buf))).tobytes()
+
+
+def _xor_keystream_loop(data:bytes) -> bytes:
+    """ reference per-byte implementation of the XOR codec (used for benchmark/parity check)"""
     data = bytearray(data)
     for i in range(len(data)):
         u = (23 ^ len(data)) + 5 * i + keys[i % len(keys)] & 255
         data[i] ^= u
     return bytes(data)
 
+
+def decode(data: bytes):
+    """ decode ActionPrototype payload data"""
+    return _xor_keystream(data)
+
 # Just XOR it back
 def encode(data: bytes):
-    data = bytearray(data)
-    for i in range(len(data)):
-        u = (23 ^ len(data)) + 5 * i + keys[i % len(keys)] & 255
-        data[i] ^= u
-    return bytes(data)
+    """ encode ActionPrototype payload data"""
+    return _xor_keystream(data)
+
+
+@dataclass(frozen=True)
+class MethodProto:
+    """ protobuf message classes for a liqi method name"""
+    name:str                        # method name str, e.g. '.lq.FastTest.authGame'
+    req_class:type = None           # request message class (REQ/RES methods)
+    res_class:type = None           # response message class (REQ/RES methods)
+    notify_class:type = None        # notify message class (NOTIFY methods)
+
+
+@lru_cache(maxsize=None)
+def _load_json_proto() -> dict:
+    """ load liqi.json (lazily, once per process)"""
+    jsonf = utils.sub_file('liqi_proto','liqi.json')
+    with open(jsonf, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=None)
+def _message_classes() -> dict[str, type]:
+    """ return dict of {message name: liqi_pb2 message class}"""
+    return {name: getattr(pb, name) for name in pb.DESCRIPTOR.message_types_by_name}
+
+
+@lru_cache(maxsize=None)
+def _method_index() -> dict[bytes, MethodProto]:
+    """ build the dispatch index {raw method name bytes: MethodProto} (once per process)
+    covers all RPC methods (.lq.Service.rpc) in liqi.json and all notify messages (.lq.Message)"""
+    index:dict[bytes, MethodProto] = {}
+    msg_classes = _message_classes()
+    for name, cls in msg_classes.items():
+        method_name = f'.{pb.DESCRIPTOR.package}.{name}'
+        index[method_name.encode()] = MethodProto(method_name, notify_class=cls)
+    for lq, lq_domain in _load_json_proto()['nested'].items():
+        for service, service_domain in lq_domain['nested'].items():
+            if 'methods' not in service_domain:
+                continue
+            for rpc, proto_domain in service_domain['methods'].items():
+                method_name = f'.{lq}.{service}.{rpc}'
+                index[method_name.encode()] = MethodProto(
+                    method_name,
+                    req_class=msg_classes[proto_domain['requestType']],
+                    res_class=msg_classes[proto_domain['responseType']])
+    return index
+
+
+class ProtoView(Mapping):
+    """ Read-only dict-like view of a liqi_pb2 message, with the same keys (camelCase) and values as
+    MessageToDict(including_default_value_fields=True), converted lazily on first access.
+    Singular message and oneof fields are present only if set; repeated fields are plain lists.
+    Values are converted the same way: enums to names, 64-bit ints to str, bytes to base64 str, map keys to str.
+    The raw values (e.g. bytes) are available from the underlying message (.message)
+    Item assignment is kept in the view only, and does not modify the message."""
+    __slots__ = ('_msg', '_fields', '_values')
+
+    def __init__(self, msg, overrides:dict=None):
+        """ params:
+            msg: liqi_pb2 message object
+            overrides(dict): values to use instead of the message fields, e.g. decoded action 'data'"""
+        self._msg = msg
+        self._fields = msg.DESCRIPTOR.fields_by_camelcase_name
+        self._values:dict = dict(overrides) if overrides else {}
+
+    @property
+    def message(self):
+        """ the underlying protobuf message"""
+        return self._msg
+
+    def __getitem__(self, key:str):
+        if key in self._values:
+            return self._values[key]
+        field = self._fields.get(key)
+        if field is None or not self._has_field(field):
+            raise KeyError(key)
+        value = _proto_value(field, getattr(self._msg, field.name))
+        self._values[key] = value
+        return value
+
+    def __setitem__(self, key:str, value):
+        self._values[key] = value
+
+    def __contains__(self, key) -> bool:
+        if key in self._values:
+            return True
+        field = self._fields.get(key)
+        return field is not None and self._has_field(field)
+
+    def __iter__(self):
+        keys = [k for k, f in self._fields.items() if self._has_field(f)]
+        keys += [k for k in self._values if k not in self._fields]
+        return iter(keys)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __bool__(self) -> bool:     # without counting all keys as Mapping does via __len__
+        return bool(self._values) or any(self._has_field(f) for f in self._fields.values())
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+    def _has_field(self, field) -> bool:
+        if field.label != field.LABEL_REPEATED and (field.type == field.TYPE_MESSAGE or field.containing_oneof):
+            return self._msg.HasField(field.name)
+        return True
+
+
+_INT64_CPP_TYPES = (FieldDescriptor.CPPTYPE_INT64, FieldDescriptor.CPPTYPE_UINT64)
+_FLOAT_CPP_TYPES = (FieldDescriptor.CPPTYPE_FLOAT, FieldDescriptor.CPPTYPE_DOUBLE)
+
+
+def _proto_value(field, value):
+    """ convert protobuf field value to the MessageToDict-like python value (messages are wrapped in ProtoView)"""
+    if field.label == field.LABEL_REPEATED:
+        if field.type == field.TYPE_MESSAGE:
+            if field.message_type.GetOptions().map_entry:
+                val_field = field.message_type.fields_by_name['value']
+                return {_map_key(k): _proto_value(val_field, v) for k, v in value.items()}
+            return [ProtoView(v) for v in value]
+        return [_scalar_value(field, v) for v in value]
+    if field.type == field.TYPE_MESSAGE:
+        return ProtoView(value)
+    return _scalar_value(field, value)
+
+
+def _scalar_value(field, value):
+    """ convert non-message field value as MessageToDict does"""
+    cpp_type = field.cpp_type
+    if cpp_type == FieldDescriptor.CPPTYPE_ENUM:
+        enum_value = field.enum_type.values_by_number.get(value)
+        return enum_value.name if enum_value is not None else value
+    if field.type == field.TYPE_BYTES:
+        return base64.b64encode(value).decode('utf-8')
+    if cpp_type in _INT64_CPP_TYPES:
+        return str(value)
+    if cpp_type in _FLOAT_CPP_TYPES:
+        if math.isinf(value):
+            return '-Infinity' if value < 0 else 'Infinity'
+        if math.isnan(value):
+            return 'NaN'
+        if cpp_type == FieldDescriptor.CPPTYPE_FLOAT:
+            return type_checkers.ToShortestFloat(value)
+    return value
+
+
+def _map_key(key) -> str:
+    """ map key as MessageToDict: str, bools as 'true'/'false'"""
+    if isinstance(key, bool):
+        return 'true' if key else 'false'
+    return str(key)
+
+
+@dataclass
+class LiqiHeader:
+    """ Liqi frame header, peeked without decoding the message body"""
+    id:int                          # msg_id for REQ/RES, -1 for NOTIFY
+    type:MsgType                    # msg type
+    method:str                      # method name str, e.g. '.lq.ActionPrototype'
+    payload:memoryview              # protobuf bytes of the message body (view of the frame, no copy)
+    msg_class:type                  # protobuf message class for decoding payload
 
 
 class LiqiProto:
     """ converting Majsoul protobuf data captured from websocket to readable json messages"""
-    def __init__(self):
+    def __init__(self, native_proto:bool=False):
+        """ params:
+            native_proto(bool): True to output liqi msg 'data' as ProtoView over the typed liqi_pb2 message,
+                False to output dict converted with MessageToDict"""
+        self.native_proto = native_proto
         self.msg_id = 1
         self.tot = 0
         self.res_type = dict()
-        jsonf = utils.sub_file('liqi_proto','liqi.json')
-        self.jsonProto = json.load(open(jsonf, 'r', encoding='utf-8'))
+
+    @property
+    def jsonProto(self) -> dict:     # pylint: disable=invalid-name
+        """ liqi.json proto definitions (loaded lazily)"""
+        return _load_json_proto()
+
+    @cached_property
+    def methods(self) -> dict[bytes, MethodProto]:
+        """ dispatch index {raw method name bytes: MethodProto}"""
+        return _method_index()
 
     def init(self):
         self.msg_id = 1
@@ -92,80 +296,111 @@ class LiqiProto:
 
     def parse(self, flow_msg) -> dict:
         #parse一帧WS flow msg，要求按顺序parse
+        header = self.peek(flow_msg)
+        if header is None:
+            return None
+        return self.parse_body(header)
+
+    def peek(self, flow_msg) -> 'LiqiHeader':
+        """ Parse only the frame header (type, msg_id, method name) without decoding the message body.
+        Must be called for every frame in order (REQ/RES msg_id matching is tracked here).
+        Use parse_body() on the returned header to get the full liqi message
+        params:
+            flow_msg(bytes | WebSocketMessage): websocket frame
+        returns:
+            LiqiHeader: frame header, or None if msg type is unknown"""
         if isinstance(flow_msg, bytes):
             buf = flow_msg
         else:
             buf = flow_msg.content
             # from_client = flow_msg.from_client
-        result = dict()
         msg_type = MsgType(buf[0]) # 通信报文类型
         if msg_type == MsgType.NOTIFY:
-            msg_block = fromProtobuf(buf[1:])        # 解析剩余报文结构
-            method_name = msg_block[0]['data'].decode()
-
-            # msg_block结构通常为
-            # [{'id': 1, 'type': 'string', 'data': b'.lq.ActionPrototype'},
-            # {'id': 2, 'type': 'string','data': b'protobuf_bytes'}]
-
-            _, lq, message_name = method_name.split('.')
-            liqi_pb2_notify = getattr(pb, message_name)
-            proto_obj = liqi_pb2_notify.FromString(msg_block[1]['data'])
-            dict_obj = MessageToDict(proto_obj, including_default_value_fields=True)
-            if 'data' in dict_obj:
-                B = base64.b64decode(dict_obj['data'])
-                action_proto_obj = getattr(pb, dict_obj['name']).FromString(decode(B))
-                action_dict_obj = MessageToDict(action_proto_obj, including_default_value_fields=True)
-                dict_obj['data'] = action_dict_obj
-            msg_id = -1
+            # envelope: field 1 method name, e.g. b'.lq.ActionPrototype', field 2 protobuf bytes
+            method_bytes, payload = parseEnvelope(buf, 1)     # 解析剩余报文结构
+            method_proto = self.methods[method_bytes]
+            header = LiqiHeader(-1, msg_type, method_proto.name, payload, method_proto.notify_class)
         else:
-            msg_id = struct.unpack('<H', buf[1:3])[0]       # 小端序解析报文编号(0~255)
-            msg_block = fromProtobuf(buf[3:])               # 解析剩余报文结构
-            # """
-            #     msg_block结构通常为
-            #     [{'id': 1, 'type': 'string', 'data': b'.lq.FastTest.authGame'},
-            #     {'id': 2, 'type': 'string','data': b'protobuf_bytes'}]
-            # """
+            msg_id = buf[1] | (buf[2] << 8)                     # 小端序解析报文编号(0~255)
+            # envelope: field 1 method name, e.g. b'.lq.FastTest.authGame' (empty for RES), field 2 protobuf bytes
+            method_bytes, payload = parseEnvelope(buf, 3)     # 解析剩余报文结构
             if msg_type == MsgType.REQ:
                 assert(msg_id < 1 << 16)
-                assert(len(msg_block) == 2)
                 # assert(msg_id not in self.res_type)
-                method_name = msg_block[0]['data'].decode()                
-                _, lq, service, rpc = method_name.split('.')
-                proto_domain = self.jsonProto['nested'][lq]['nested'][service]['methods'][rpc]
-                liqi_pb2_req = getattr(pb, proto_domain['requestType'])
-                proto_obj = liqi_pb2_req.FromString(msg_block[1]['data'])
-                dict_obj = MessageToDict(proto_obj, including_default_value_fields=True)
-                self.res_type[msg_id] = (method_name, getattr(
-                    pb, proto_domain['responseType']))
+                method_proto = self.methods[method_bytes]
+                header = LiqiHeader(msg_id, msg_type, method_proto.name, payload, method_proto.req_class)
+                self.res_type[msg_id] = (method_proto.name, method_proto.res_class)
                 self.msg_id = msg_id
             elif msg_type == MsgType.RES:
-                assert(len(msg_block[0]['data']) == 0)
+                assert(len(method_bytes) == 0)
                 assert(msg_id in self.res_type)
                 method_name, liqi_pb2_res = self.res_type.pop(msg_id)
-                proto_obj = liqi_pb2_res.FromString(msg_block[1]['data'])
-                dict_obj = MessageToDict(proto_obj, including_default_value_fields=True)
+                header = LiqiHeader(msg_id, msg_type, method_name, payload, liqi_pb2_res)
             else:
                 LOGGER.error('unknow msg (type=%s): %s', msg_type, buf)
                 return None
-        result = {'id': msg_id, 'type': msg_type,
-                'method': method_name, 'data': dict_obj}
         self.tot += 1
+        return header
+
+    def parse_body(self, header:'LiqiHeader') -> dict:
+        """ Decode the message body of a peeked frame into liqi message dict
+        params:
+            header(LiqiHeader): header returned by peek()
+        returns:
+            dict: liqi message {'id', 'type', 'method', 'data'}"""
+        proto_obj = header.msg_class.FromString(header.payload)
+        if self.native_proto:
+            return {'id': header.id, 'type': header.type,
+                'method': header.method, 'data': self._proto_view(proto_obj, header.type)}
+        dict_obj = MessageToDict(proto_obj, including_default_value_fields=True)
+        if header.type == MsgType.NOTIFY and 'data' in dict_obj:
+            B = base64.b64decode(dict_obj['data'])
+            action_proto_obj = _message_classes()[dict_obj['name']].FromString(decode(B))
+            action_dict_obj = MessageToDict(action_proto_obj, including_default_value_fields=True)
+            dict_obj['data'] = action_dict_obj
+        result = {'id': header.id, 'type': header.type,
+                'method': header.method, 'data': dict_obj}
         return result
     
-    def parse_syncGame(self, liqi_data):
+    def _proto_view(self, proto_obj, msg_type:MsgType) -> ProtoView:
+        """ return ProtoView of the message. ActionPrototype data is decoded without base64 round trip"""
+        if msg_type == MsgType.NOTIFY and isinstance(proto_obj, pb.ActionPrototype) and proto_obj.name:
+            action_proto_obj = _message_classes()[proto_obj.name].FromString(decode(proto_obj.data))
+            return ProtoView(proto_obj, {'data': ProtoView(action_proto_obj)})
+        return ProtoView(proto_obj)
+
+    def parse_syncGame(self, liqi_data, as_view:bool=False):
         """ sync game
         params:
             liqi_data(dict): liqi message['data']
+            as_view(bool): True to decode all restore actions in one pass into ProtoView data
+                (no MessageToDict), for bulk resync
         """
         # assert syncGame['method'] == '.lq.FastTest.syncGame' or syncGame['method'] == '.lq.FastTest.enterGame'
+        if 'gameRestore' not in liqi_data:
+            return []
+        actions = liqi_data['gameRestore']['actions']
+        if not as_view:
+            return [self.parse_syncGameActions(action) for action in actions]
+        classes = _message_classes()
         msgs = []
-        if 'gameRestore' in liqi_data:
-            for action in liqi_data['gameRestore']['actions']:
-                msgs.append(self.parse_syncGameActions(action))
+        for action in actions:
+            if isinstance(action, ProtoView):      # raw bytes from the message, no base64 round trip
+                data = action.message.data
+            else:
+                data = base64.b64decode(action['data'])
+            msgs.append({'id': -1, 'type': MsgType.NOTIFY, 'method': '.lq.ActionPrototype',
+                'data': {'name': action['name'], 'step': action['step'],
+                    'data': ProtoView(classes[action['name']].FromString(data))}})
         return msgs
 
     def parse_syncGameActions(self, dict_obj):
-        dict_obj['data'] = MessageToDict(getattr(pb, dict_obj['name']).FromString(base64.b64decode(dict_obj['data'])), including_default_value_fields=True)
+        action_class = _message_classes()[dict_obj['name']]
+        if isinstance(dict_obj, ProtoView):     # native proto: raw bytes from the message
+            dict_obj['data'] = ProtoView(action_class.FromString(dict_obj.message.data))
+        else:
+            dict_obj['data'] = MessageToDict(
+                action_class.FromString(base64.b64decode(dict_obj['data'])), including_default_value_fields=True)
         msg_id = -1
         result = {'id': msg_id, 'type': MsgType.NOTIFY,
                   'method': '.lq.ActionPrototype', 'data': dict_obj}
@@ -180,12 +415,11 @@ class LiqiProto:
             {'id': 1, 'type': 'string', 'data': b'.lq.FastTest.authGame'},
             {'id': 2, 'type': 'string','data': b'protobuf_bytes'}
         ]
-        _, lq, service, rpc = data['method'].split('.')
-        proto_domain = self.jsonProto['nested'][lq]['nested'][service]['methods'][rpc]
+        method_proto = self.methods[data['method'].encode()]
         if data['type'] == MsgType.REQ:
-            message = ParseDict(data['data'], getattr(pb, proto_domain['requestType'])())
+            message = ParseDict(data['data'], method_proto.req_class())
         elif data['type'] == MsgType.RES:
-            message = ParseDict(data['data'], getattr(pb, proto_domain['responseType'])())
+            message = ParseDict(data['data'], method_proto.res_class())
         msg_block[0]['data'] = data['method'].encode()
         msg_block[1]['data'] = message.SerializeToString()
         if msg_id == -1:
@@ -210,19 +444,19 @@ class LiqiProto:
             {'id': 2, 'type': 'string','data': b'protobuf_bytes'}
         ]
 
-        _, _lq, message_name = data['method'].split('.')
+        method_proto = self.methods[data['method'].encode()]
 
         msg_block[0]['data'] = data['method'].encode()
         msg_block[1]['data'] = ...
 
         if 'data' in data['data']:
             action_dict_obj = data['data']['data']
-            action_proto_obj = ParseDict(action_dict_obj, getattr(pb, data['data']['name'])())
+            action_proto_obj = ParseDict(action_dict_obj, _message_classes()[data['data']['name']]())
             action_proto_obj = action_proto_obj.SerializeToString()
             B = encode(action_proto_obj)
             data['data']['data'] = base64.b64encode(B)
 
-        message = ParseDict(data['data'], getattr(pb, message_name)())
+        message = ParseDict(data['data'], method_proto.notify_class())
         msg_block[1]['data'] = message.SerializeToString()
         composed = b'\x01' + toProtobuf(msg_block)
         return composed
@@ -246,6 +480,9 @@ def toVarint(x: int) -> bytes:
 
 def parseVarint(buf, p):
     # parse a varint from protobuf
+    b = buf[p]
+    if b < 0x80:        # fast path: single byte varint
+        return (b, p + 1)
     data = 0
     base = 0
     while(p < len(buf)):
@@ -257,48 +494,145 @@ def parseVarint(buf, p):
     return (data, p)
 
 
-def fromProtobuf(buf) -> List[Dict]:
+def walkProtobuf(buf:memoryview, p:int=0) -> Iterator[tuple[int, str, int, int, int]]:
     # """
-    # dump the struct of protobuf
-    # buf: protobuf bytes
+    # walk the wire format of protobuf without copying
+    # buf: protobuf bytes / memoryview
+    # yields (block_id, block_type, value, length, begin) for each field:
+    #   'varint': value is the int, length = 0
+    #   'string': value is the data offset in buf, length is the data length
     # """
-    p = 0
-    result = []
-    while(p < len(buf)):
+    end = len(buf)
+    while(p < end):
         block_begin = p
         block_type = (buf[p] & 7)
         block_id = buf[p] >> 3
         p += 1
         if block_type == 0:
             #varint
-            block_type = 'varint'
             data, p = parseVarint(buf, p)
+            yield (block_id, 'varint', data, 0, block_begin)
         elif block_type == 2:
             #string
-            block_type = 'string'
             s_len, p = parseVarint(buf, p)
-            data = buf[p:p+s_len]
+            yield (block_id, 'string', p, s_len, block_begin)
             p += s_len
         else:
             raise ValueError(f"Unknown type: {block_type}, at {p}")
+
+
+def fromProtobuf(buf) -> List[Dict]:
+    # """
+    # dump the struct of protobuf
+    # buf: protobuf bytes / memoryview
+    # 'data' of string blocks are memoryview slices of buf (no copy)
+    # """
+    view = _readonly_view(buf)
+    result = []
+    for block_id, block_type, value, length, block_begin in walkProtobuf(view):
+        if block_type == 'string':
+            data = view[value:value+length]
+        else:
+            data = value
         result.append({'id': block_id, 'type': block_type,
                        'data': data, 'begin': block_begin})
     return result
 
 
+def parseEnvelope(buf, p:int=0) -> tuple[memoryview, memoryview]:
+    # """
+    # fast path for the two-field envelope of every Majsoul frame:
+    #   field 1 (string): method name, field 2 (string): protobuf payload
+    # buf: frame bytes / memoryview; p: envelope start offset
+    # returns (method_name, payload) as memoryview slices of buf (no copy)
+    # """
+    view = _readonly_view(buf)
+    end = len(view)
+    if p < end and view[p] == 0x0a:                 # field 1, string
+        n, q = parseVarint(view, p + 1)
+        name = view[q:q+n]
+        q += n
+        if q == end:                                # no payload field
+            return name, view[end:]
+        if view[q] == 0x12:                         # field 2, string
+            n, q = parseVarint(view, q + 1)
+            if q + n == end:
+                return name, view[q:end]
+    # not the usual layout: generic walk
+    blocks = fromProtobuf(view[p:])
+    return blocks[0]['data'], blocks[1]['data']
+
+
+def _readonly_view(buf) -> memoryview:
+    # readonly (hashable) memoryview over buf
+    if isinstance(buf, memoryview):
+        return buf if buf.readonly else buf.toreadonly()
+    return memoryview(buf).toreadonly()
+
+
 def toProtobuf(data: List[Dict]) -> bytes:
     # """
     # Inverse operation of 'fromProtobuf'
     # """
-    result = b''
+    result = bytearray()
     for d in data:
         if d['type'] == 'varint':
-            result += ((d['id'] << 3)+0).to_bytes(length=1, byteorder='little')
+            result.append((d['id'] << 3)+0)
             result += toVarint(d['data'])
         elif d['type'] == 'string':
-            result += ((d['id'] << 3)+2).to_bytes(length=1, byteorder='little')
+            result.append((d['id'] << 3)+2)
             result += toVarint(len(d['data']))
             result += d['data']
         else:
             raise NotImplementedError
-    return result
\ No newline at end of file
+    return bytes(result)
+
+
+def _benchmark_codec(n_msgs:int=20000):
+    """ micro-benchmark: per-message cost of the XOR codec, loop vs vectorized"""
+    import random
+    import timeit
+    # typical ActionPrototype payload sizes (DealTile/DiscardTile with operations ~ 20-200 bytes)
+    payloads = [random.randbytes(random.randint(16, 256)) for _ in range(200)]
+    for p in payloads:
+        assert _xor_keystream(p) == _xor_keystream_loop(p), "codec mismatch"
+        assert decode(encode(p)) == p
+    for name, func in (("loop", _xor_keystream_loop), ("vectorized", _xor_keystream)):
+        t = timeit.timeit(lambda f=func: [f(p) for p in payloads], number=n_msgs // len(payloads))
+        print(f"{name:>10}: {t / n_msgs * 1e6:8.2f} us/msg")
+
+
+def _benchmark_parse(frames:list[bytes]=None, n_rounds:int=200):
+    """ benchmark: per-message parse cost, MessageToDict dicts vs native proto (ProtoView)
+    params:
+        frames(list[bytes]): websocket frames to parse in order (e.g. from recorded game traffic).
+            None to use composed sample ActionPrototype frames"""
+    import timeit
+    if frames is None:
+        composer = LiqiProto()
+        samples = [
+            {'step': 5, 'name': LiqiAction.DealTile, 'data': {'seat': 0, 'tile': '3p', 'leftTileCount': 60,
+                'doras': ['1m'], 'operation': {'seat': 0, 'operationList': [{'type': 1}, {'type': 7}]}}},
+            {'step': 6, 'name': LiqiAction.DiscardTile, 'data': {'seat': 0, 'tile': '3p', 'moqie': True,
+                'doras': ['1m'], 'operation': {'seat': 1, 'operationList': [{'type': 3, 'combination': ['3p|3p']}]}}},
+            {'step': 7, 'name': LiqiAction.DealTile, 'data': {'seat': 1, 'leftTileCount': 59, 'doras': ['1m']}},
+        ]
+        frames = [composer.compose({'type': MsgType.NOTIFY, 'method': LiqiMethod.ActionPrototype, 'data': s})
+            for s in samples]
+
+    def run(parser:LiqiProto):
+        for f in frames:
+            msg = parser.parse(f)
+            if msg and msg['method'] == LiqiMethod.ActionPrototype:   # typical GameState access pattern
+                data = msg['data']
+                if 'data' in data and 'operation' in data['data']:
+                    _ = data['data']['operation']['operationList']
+
+    for name, native in (("dict", False), ("native", True)):
+        t = timeit.timeit(lambda p=LiqiProto(native): run(p), number=n_rounds)
+        print(f"{name:>10}: {t / (n_rounds*len(frames)) * 1e6:8.2f} us/msg")
+
+
+if __name__ == '__main__':
+    _benchmark_codec()
+    _benchmark_parse()
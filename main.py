@@ -16,6 +16,7 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import multiprocessing
 from gui.main_gui import MainGUI
 from common import utils
 from common.log_helper import LogHelper
@@ -34,4 +35,5 @@ def main():
     gui.mainloop()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()    # for inference worker process in frozen (pyinstaller) build
     main()
@@ -3,6 +3,9 @@ import threading
 import asyncio
 import queue
 import json
+import struct
+import pathlib
+from typing import Iterator, Callable
 from dataclasses import dataclass
 from urllib.parse import urlparse, parse_qs
 from mitmproxy.http import HTTPFlow
@@ -26,20 +29,120 @@ class WSMessage:
     content:bytes = None
     type:int = WsType.MESSAGE
 
+CAPTURE_MAGIC = b'MJCAP\x01'
+""" header of websocket capture files"""
+_CAPTURE_RECORD = struct.Struct('<BdBI')
+""" capture record header: type(u8), timestamp(f64), flow_id length(u8), content length(u32)
+followed by flow_id (utf-8) and content bytes"""
+
+class WSCaptureWriter:
+    """ Append-only binary capture file writer for websocket messages (thread safe)"""
+    def __init__(self, file:str):
+        self.file = file
+        self._lock = threading.Lock()
+        is_new = not pathlib.Path(file).exists() or pathlib.Path(file).stat().st_size == 0
+        self._f = open(file, 'ab')     # pylint: disable=consider-using-with
+        if is_new:
+            self._f.write(CAPTURE_MAGIC)
+
+    def write(self, msg:WSMessage):
+        """ append the message as a record to the capture file"""
+        flow_id = msg.flow_id.encode('utf-8')
+        content = msg.content if msg.content else b''
+        with self._lock:
+            if self._f is None:
+                return
+            self._f.write(_CAPTURE_RECORD.pack(msg.type, msg.timestamp or 0.0, len(flow_id), len(content)))
+            self._f.write(flow_id)
+            self._f.write(content)
+            self._f.flush()
+
+    def close(self):
+        """ close the capture file"""
+        with self._lock:
+            if self._f:
+                self._f.close()
+                self._f = None
+
+
+def read_capture(file:str) -> Iterator[WSMessage]:
+    """ read websocket messages from capture file written by WSCaptureWriter
+    A truncated last record (e.g. recorder killed while writing) is ignored"""
+    with open(file, 'rb') as f:
+        if f.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"Not a websocket capture file: {file}")
+        while True:
+            head = f.read(_CAPTURE_RECORD.size)
+            if len(head) < _CAPTURE_RECORD.size:
+                return
+            msg_type, timestamp, id_len, content_len = _CAPTURE_RECORD.unpack(head)
+            flow_id = f.read(id_len)
+            content = f.read(content_len)
+            if len(flow_id) < id_len or len(content) < content_len:
+                return
+            yield WSMessage(
+                flow_id.decode('utf-8'), timestamp, content if msg_type == WsType.MESSAGE else None, msg_type)
+
+
+class WSCaptureRecorder:
+    """ mitm websocket addon that records every START/MESSAGE/END into a capture file"""
+    def __init__(self, file:str, allowed_domains:list=None):
+        """ params:
+            file(str): capture file to append to
+            allowed_domains: list of domains to record. record all if None/empty"""
+        self.allowed_domains = allowed_domains
+        self.writer = WSCaptureWriter(file)
+
+    def _allowed(self, flow:HTTPFlow) -> bool:
+        if not self.allowed_domains:
+            return True
+        return any(d in flow.request.pretty_url for d in self.allowed_domains)
+
+    def websocket_start(self, flow:HTTPFlow):
+        """ ws start handler"""
+        if self._allowed(flow):
+            self.writer.write(WSMessage(flow.id, flow.timestamp_start, None, WsType.START))
+
+    def websocket_message(self, flow:HTTPFlow):
+        """ ws message handler"""
+        if self._allowed(flow):
+            msg = flow.websocket.messages[-1]
+            self.writer.write(WSMessage(flow.id, msg.timestamp, msg.content))
+
+    def websocket_end(self, flow:HTTPFlow):
+        """ ws flow end handler"""
+        if self._allowed(flow):
+            self.writer.write(WSMessage(flow.id, flow.timestamp_start, None, WsType.END))
+
+    def done(self):
+        """ addon shutdown handler"""
+        self.writer.close()
+
+
 class WSDataInterceptor:
     """ mitm websocket addon that intercepts data"""
 
-    def __init__(self, allowed_domains:list=None):
+    def __init__(self, allowed_domains:list=None, msg_handler:Callable[[WSMessage], None]=None):
         """ pass flow_message_dict for storing intercepted flow data
         params:
-            allowed_domains: list of allowed domains to intercept. websocket connection for other websites will be killed"""
+            allowed_domains: list of allowed domains to intercept.
+                websocket connection for other websites will be killed
+            msg_handler: if set, messages are passed to this handler (called in mitm event loop) instead of the queue"""
         if allowed_domains:
             self.allowed_domains = allowed_domains
         else:
             self.allowed_domains = None
+        self.msg_handler = msg_handler
         self.message_queue = queue.Queue()      
         """Queue for unretrieved messages
         each element is: WSMessage"""
+
+    def _deliver(self, msg:WSMessage):
+        """ pass message to handler if set, or put it in the queue"""
+        if self.msg_handler:
+            self.msg_handler(msg)
+        else:
+            self.message_queue.put(msg)
         
     def allow_url(self, url:str) -> bool:
         """ return true if url is allowed"""
@@ -56,7 +159,7 @@ class WSDataInterceptor:
     def websocket_start(self, flow:HTTPFlow):
         """ ws start handler"""
         if self.allow_url(flow.request.pretty_url):
-            self.message_queue.put(WSMessage(flow.id, flow.timestamp_start, None, WsType.START))
+            self._deliver(WSMessage(flow.id, flow.timestamp_start, None, WsType.START))
         else:
             flow.kill()
             LOGGER.info("Killing flow since it is not in allowed domains: %s", flow.request.pretty_url)            
@@ -65,12 +168,12 @@ class WSDataInterceptor:
         """ ws message handler"""
         msg = flow.websocket.messages[-1]
         if self.allow_url(flow.request.pretty_url):
-            self.message_queue.put(WSMessage(flow.id, msg.timestamp, msg.content))
+            self._deliver(WSMessage(flow.id, msg.timestamp, msg.content))
         
     def websocket_end(self, flow:HTTPFlow):
         """ ws flow end handler"""
         if self.allow_url(flow.request.pretty_url):
-            self.message_queue.put(WSMessage(flow.id, flow.timestamp_start, None, WsType.END))        
+            self._deliver(WSMessage(flow.id, flow.timestamp_start, None, WsType.END))        
 
     def replace_next_msg(self):
         pass
@@ -114,16 +217,28 @@ class MitmController:
         self.upstream_proxy = None
         self.proxy_str:str = None
         
+        self.allowed_domains = allowed_domains
         self.ws_data_addon = WSDataInterceptor(allowed_domains)
+        self.capture_addon:WSCaptureRecorder = None
         
-    def start(self, port:int, mode=HTTP, upstream_proxy:str=None):
+    def start(self, port:int, mode=HTTP, upstream_proxy:str=None, capture_file:str=None,
+        msg_handler:Callable[[WSMessage], None]=None):
         """ Start mitm server thread
         params:
             port(int): port to open
-            upstream_proxy(str): upstream proxy server to forward data to. Format: http://ip:port"""
+            upstream_proxy(str): upstream proxy server to forward data to. Format: http://ip:port
+            capture_file(str): if set, record websocket messages into this capture file
+            msg_handler: if set, ws messages are passed to this handler in mitm event loop, instead of
+                the queue for get_message()"""
+        self.ws_data_addon.msg_handler = msg_handler
         self.proxy_port = port
         self.upstream_proxy = upstream_proxy
         self.mode = mode
+        if capture_file:
+            LOGGER.info("Recording websocket capture to %s", capture_file)
+            self.capture_addon = WSCaptureRecorder(capture_file, self.allowed_domains)
+        else:
+            self.capture_addon = None
         # Start thread
         self.mitm_thread = threading.Thread(
             name="MitmThread",
@@ -175,6 +290,8 @@ class MitmController:
         try:
             LOGGER.info("Starting mitm server%s, proxy=%s", up_log_str, self.proxy_str)
             self.dump_master.addons.add(self.ws_data_addon)
+            if self.capture_addon:
+                self.dump_master.addons.add(self.capture_addon)
             await self.dump_master.run()
         except Exception as e:
             LOGGER.error("Exception in starting MITM server: %s", e, exc_info=True)
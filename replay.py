@@ -0,0 +1,203 @@
+""" Offline replay of websocket capture files (recorded by mitm.WSCaptureRecorder)
+Feeds captured messages into BotManager._process_msg, without mitm proxy or browser,
+for measuring parse -> GameState -> bot latency and reproducing game issues.
+
+Usage: python replay.py <capture_file> [--realtime] [--speed 1.0] [--mode direct|threaded|async]
+    [--settings settings.json]
+Compare threaded and async modes with --realtime for per-message latency of the two pipeline designs
+"""
+import time
+import queue
+import asyncio
+import argparse
+import threading
+import dataclasses
+import pathlib
+from typing import Iterator
+from dataclasses import dataclass, field
+
+import mitm
+from async_pipeline import AsyncPipeline
+from common.log_helper import LOGGER, LogHelper
+from common.latency import TRACER, Stage, percentiles
+from common.settings import Settings
+from bot_manager import BotManager
+from bot.local.bot_local import BotMortalLocal
+
+
+@dataclass
+class ReplayStats:
+    """ processing time stats of a replay"""
+    n_msgs:int = 0                  # number of ws messages replayed (all types)
+    total_time:float = 0.0          # wall time of the replay
+    msg_times:list[float] = field(default_factory=list)  # processing time of each MESSAGE msg
+
+    def summary(self) -> str:
+        """ return summary string"""
+        n = len(self.msg_times)
+        mean = sum(self.msg_times) / n if n else 0.0
+        pcts = percentiles(self.msg_times)
+        return (
+            f"Replayed {self.n_msgs} msgs ({n} ws messages) in {self.total_time:.2f}s. "
+            f"Per message: mean={mean*1000:.3f}ms, p50={pcts[50]*1000:.3f}ms, "
+            f"p95={pcts[95]*1000:.3f}ms, p99={pcts[99]*1000:.3f}ms, "
+            f"max={max(self.msg_times, default=0)*1000:.3f}ms")
+
+
+REPLAY_DIRECT = "direct"        # call BotManager._process_msg for each msg, no thread hop
+REPLAY_THREADED = "threaded"    # queue msgs to a worker thread, same as BotManager thread loop
+REPLAY_ASYNC = "async"          # feed msgs into AsyncPipeline in an event loop, same as async_pipeline mode
+REPLAY_MODES = (REPLAY_DIRECT, REPLAY_THREADED, REPLAY_ASYNC)
+
+
+def _iter_paced(msgs:Iterator[mitm.WSMessage], realtime:bool, speed:float, start_time:float):
+    """ yield (msg, wait seconds before feeding it)"""
+    first_ts = None
+    for msg in msgs:
+        wait = 0.0
+        if realtime and msg.timestamp:
+            if first_ts is None:
+                first_ts = msg.timestamp
+            wait = (msg.timestamp - first_ts) / speed - (time.perf_counter() - start_time)
+        yield msg, wait
+
+
+def replay_capture(capture_file:str, bot_manager:BotManager, realtime:bool=False, speed:float=1.0,
+    mode:str=REPLAY_DIRECT) -> ReplayStats:
+    """ Feed capture file messages into bot manager (blocking)
+    params:
+        capture_file(str): capture file path
+        bot_manager(BotManager): bot manager (not started) to process the messages
+        realtime(bool): True to replay following the captured timestamps, False to replay as fast as possible
+        speed(float): replay speed multiplier for realtime mode
+        mode(str): one of REPLAY_MODES. In threaded/async modes, msg times are from feeding the msg to
+            finishing processing, including queueing and thread hops
+    returns:
+        ReplayStats: processing time stats"""
+    if mode not in REPLAY_MODES:
+        raise ValueError(f"Unsupported replay mode: {mode}")
+    stats = ReplayStats()
+    if bot_manager.bot is None:
+        bot_manager._create_bot()           # pylint: disable=protected-access
+        bot_manager.bot_need_update = False
+    start_time = time.perf_counter()
+    msgs = mitm.read_capture(capture_file)
+    if mode == REPLAY_THREADED:
+        _replay_threaded(msgs, bot_manager, realtime, speed, start_time, stats)
+    elif mode == REPLAY_ASYNC:
+        asyncio.run(_replay_async(msgs, bot_manager, realtime, speed, start_time, stats))
+    else:
+        for msg, wait in _iter_paced(msgs, realtime, speed, start_time):
+            if wait > 0:
+                time.sleep(wait)
+            t0 = time.perf_counter()
+            _process_traced(bot_manager, msg)
+            if msg.type == mitm.WsType.MESSAGE:
+                stats.msg_times.append(time.perf_counter() - t0)
+            stats.n_msgs += 1
+    stats.total_time = time.perf_counter() - start_time
+    return stats
+
+
+def _process_traced(bot_manager:BotManager, msg:mitm.WSMessage, feed_time:float=None):
+    """ process msg in bot manager with latency tracing
+    (captured recv timestamp is not comparable in replay, so time of feeding the msg is used if given)"""
+    if msg.type == mitm.WsType.MESSAGE:
+        TRACER.begin(feed_time)
+        TRACER.mark(Stage.DEQUEUE)
+    try:
+        bot_manager._process_msg(msg)   # pylint: disable=protected-access
+    except Exception as e:              # pylint: disable=broad-except
+        LOGGER.error("Error processing msg: %s", e, exc_info=True)
+    TRACER.discard()
+
+
+def _replay_threaded(msgs:Iterator[mitm.WSMessage], bot_manager:BotManager, realtime:bool, speed:float,
+    start_time:float, stats:ReplayStats):
+    msg_queue = queue.Queue()
+
+    def worker():
+        while True:
+            item = msg_queue.get(True)
+            if item is None:
+                return
+            msg, t0, feed_time = item
+            _process_traced(bot_manager, msg, feed_time)
+            if msg.type == mitm.WsType.MESSAGE:
+                stats.msg_times.append(time.perf_counter() - t0)
+
+    thread = threading.Thread(target=worker, name="ReplayWorker", daemon=True)
+    thread.start()
+    for msg, wait in _iter_paced(msgs, realtime, speed, start_time):
+        if wait > 0:
+            time.sleep(wait)
+        msg_queue.put((msg, time.perf_counter(), time.time()))
+        stats.n_msgs += 1
+    msg_queue.put(None)
+    thread.join()
+
+
+async def _replay_async(msgs:Iterator[mitm.WSMessage], bot_manager:BotManager, realtime:bool, speed:float,
+    start_time:float, stats:ReplayStats):
+    pipeline = bot_manager.async_pipeline or AsyncPipeline(bot_manager)
+    feed_times = {}
+
+    def on_processed(msg:mitm.WSMessage):
+        if msg.type == mitm.WsType.MESSAGE:
+            stats.msg_times.append(time.perf_counter() - feed_times.pop(id(msg)))
+
+    pipeline.on_processed = on_processed
+    for msg, wait in _iter_paced(msgs, realtime, speed, start_time):
+        if wait > 0:
+            await asyncio.sleep(wait)
+        msg = dataclasses.replace(msg, timestamp=time.time())     # feed time as recv time for tracing
+        feed_times[id(msg)] = time.perf_counter()
+        pipeline.on_message(msg)
+        stats.n_msgs += 1
+        await asyncio.sleep(0)          # let consumer task run, as mitm loop would between frames
+    await pipeline.drain()
+    pipeline.on_processed = None
+    pipeline.detach()
+
+
+def main():
+    """ replay command line entry point """
+    parser = argparse.ArgumentParser(description="Replay websocket capture file through BotManager")
+    parser.add_argument("capture_file", help="capture file (.mjcap) recorded by mitm capture")
+    parser.add_argument("--realtime", action="store_true", help="replay at captured timing instead of max speed")
+    parser.add_argument("--speed", type=float, default=1.0, help="speed multiplier for realtime replay")
+    parser.add_argument("--mode", choices=REPLAY_MODES, default=REPLAY_DIRECT,
+        help="processing mode: direct call, threaded (queue + bot thread) or async (async pipeline)")
+    parser.add_argument("--settings", default="settings.json", help="settings file (for bot/model selection)")
+    parser.add_argument("--record-obs", metavar="FILE",
+        help="record local model inputs into observation corpus FILE_<mode>.npz, for verifying model backends. "
+        "Save it as <model_file>.obs.npz to calibrate the int8 backend")
+    args = parser.parse_args()
+
+    LogHelper.config_logging("replay", console=False)
+    setting = Settings(args.settings)      # automation will not run since there is no browser
+    bot_manager = BotManager(setting)
+    corpora = {}
+    if args.record_obs:
+        bot_manager._create_bot()           # pylint: disable=protected-access
+        bot_manager.bot_need_update = False
+        if isinstance(bot_manager.bot, BotMortalLocal):
+            corpora = bot_manager.bot.record_obs()
+        else:
+            print("Recording observations requires local model bot (non-worker mode)")
+    stats = replay_capture(args.capture_file, bot_manager, args.realtime, args.speed, args.mode)
+    print(stats.summary())
+    for mode, corpus in corpora.items():
+        if len(corpus):
+            file = f"{pathlib.Path(args.record_obs).with_suffix('')}_{mode.value}.npz"
+            corpus.save(file)
+            print(f"Saved {len(corpus)} observations to {file}")
+    summary = TRACER.summary()
+    if summary['count']:
+        print(f"Latency of {summary['count']} decisions (p50/p95/p99 ms):")
+        for stage, pct in summary['stages'].items():
+            print(f"  {stage:<24}{pct[50]*1000:8.3f}{pct[95]*1000:8.3f}{pct[99]*1000:8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+""" pytest setup: run tests from the repo root modules"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
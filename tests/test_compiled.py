@@ -0,0 +1,60 @@
+""" Compiled (TorchScript) backend parity with the eager Mortal modules, over an observation corpus file"""
+import pytest
+import torch
+from torch import nn
+
+try:        # bot.local.model needs libriichi
+    import libriichi        # pylint: disable=unused-import
+except ImportError:
+    pytest.importorskip("riichi")
+
+# pylint: disable=wrong-import-position
+from bot.local.model import Brain, DQN
+from bot.local.corpus import ObsCorpus
+from bot.local.compiled import PARITY_ATOL, MortalNet, compile_mortal, check_parity, compare_q, q_values, \
+    model_io_shapes
+
+
+class _Consts:
+    """ small observation shape and action space, instead of the libriichi consts"""
+    ACTION_SPACE = 46
+
+    @staticmethod
+    def obs_shape(version:int) -> tuple[int, int]:
+        return (93 + version, 34)
+
+    @staticmethod
+    def oracle_obs_shape(version:int) -> tuple[int, int]:
+        return (32, 34)
+
+
+def _random_model(version:int) -> tuple[Brain, DQN]:
+    torch.manual_seed(version)
+    brain = Brain(version=version, conv_channels=32, num_blocks=2, consts=_Consts).eval()
+    dqn = DQN(version=version, consts=_Consts).eval()
+    for module in brain.modules():      # non-trivial BatchNorm stats, so folding is exercised
+        if isinstance(module, nn.BatchNorm1d):
+            module.running_mean.uniform_(-0.5, 0.5)
+            module.running_var.uniform_(0.5, 2.0)
+            module.weight.data.uniform_(0.5, 1.5)
+            module.bias.data.uniform_(-0.5, 0.5)
+    return brain, dqn
+
+
+@pytest.mark.parametrize("version", [1, 2, 4])
+def test_compiled_parity_over_corpus_file(version, tmp_path):
+    brain, dqn = _random_model(version)
+    obs_shape, action_space = model_io_shapes(brain, dqn)
+    assert (obs_shape, action_space) == (_Consts.obs_shape(version), _Consts.ACTION_SPACE)
+    corpus_file = str(tmp_path / "obs.npz")
+    ObsCorpus.synthetic(obs_shape, action_space, n=48, seed=version).save(corpus_file)
+    corpus = ObsCorpus.load(corpus_file)
+    assert len(corpus) == 48
+
+    device = torch.device('cpu')
+    compiled = compile_mortal(brain, dqn, device)
+    assert check_parity(brain, dqn, compiled, device, corpus)
+    max_diff, agreement = compare_q(
+        q_values(MortalNet(brain, dqn).eval(), corpus, device), q_values(compiled, corpus, device))
+    assert max_diff <= PARITY_ATOL
+    assert agreement == 1.0
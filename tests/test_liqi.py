@@ -0,0 +1,59 @@
+""" liqi.ProtoView must read the same as MessageToDict(including_default_value_fields=True)"""
+from google.protobuf import descriptor_pb2
+from google.protobuf.json_format import MessageToDict
+
+import liqi
+from liqi import ProtoView, LiqiProto, MsgType, LiqiMethod
+from liqi_proto import liqi_pb2 as pb
+
+
+def _as_dict(value):
+    """ convert ProtoView (recursively) to plain dicts/lists"""
+    if isinstance(value, ProtoView):
+        return {k: _as_dict(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_as_dict(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _as_dict(v) for k, v in value.items()}
+    return value
+
+
+def _assert_same(msg):
+    assert _as_dict(ProtoView(msg)) == MessageToDict(msg, including_default_value_fields=True)
+
+
+def test_int64_bytes_double():
+    # UninterpretedOption has uint64, int64, double, bytes and repeated message fields
+    msg = descriptor_pb2.UninterpretedOption(
+        positive_int_value=2**63 + 5, negative_int_value=-2**62, double_value=1.5,
+        string_value=b'\x00\xffraw', name=[descriptor_pb2.UninterpretedOption.NamePart(name_part='a', is_extension=True)])
+    _assert_same(msg)
+    view = ProtoView(msg)
+    assert view['positiveIntValue'] == str(2**63 + 5)
+    assert view['stringValue'] == 'AP9yYXc='
+    assert view.message.string_value == b'\x00\xffraw'      # raw value from the message
+    _assert_same(descriptor_pb2.UninterpretedOption(double_value=float('nan')))
+    _assert_same(descriptor_pb2.UninterpretedOption(double_value=float('-inf')))
+
+
+def test_liqi_bytes_float_and_defaults():
+    _assert_same(pb.ActionPrototype(step=3, name='ActionDealTile', data=b'\x01\x02\x03'))
+    _assert_same(pb.ActionPrototype())
+    _assert_same(pb.AccountStatisticByGameMode(gold_earn_sum=0.1, dadian_sum=3.3))
+
+
+def test_sync_game_native_and_dict():
+    """ restore actions decode the same from dict and native (ProtoView) syncGame data"""
+    action = pb.ActionDealTile(seat=1, tile='3p', left_tile_count=50, doras=['1m'])
+    restore = pb.GameRestore(actions=[pb.ActionPrototype(step=7, name='ActionDealTile', data=action.SerializeToString())])
+    res = pb.ResSyncGame(game_restore=restore)
+    dict_data = MessageToDict(res, including_default_value_fields=True)
+    parser = LiqiProto()
+    from_dict = parser.parse_syncGame(dict_data, as_view=True)
+    from_view = parser.parse_syncGame(ProtoView(res), as_view=True)
+    expected = MessageToDict(action, including_default_value_fields=True)
+    for msgs in (from_dict, from_view):
+        assert msgs[0]['method'] == LiqiMethod.ActionPrototype and msgs[0]['type'] == MsgType.NOTIFY
+        assert _as_dict(msgs[0]['data']['data']) == expected
+    assert parser.parse_syncGameActions(ProtoView(restore).get('actions')[0])['data']['data']['seat'] == 1
+    assert liqi.ProtoView(restore)['actions'][0]['data'] == dict_data['gameRestore']['actions'][0]['data']
@@ -0,0 +1,137 @@
+""" Speculator driven through GameState: rounds start on kamicha's discard, before the own tsumo decision"""
+import numpy as np
+import pytest
+from google.protobuf.json_format import MessageToDict
+
+try:        # bot and game modules need libriichi
+    import libriichi        # pylint: disable=unused-import
+except ImportError:
+    pytest.importorskip("riichi")
+
+# pylint: disable=wrong-import-position
+from bot.bot import BotMjai
+from bot.speculative import SpeculativeEngine, _input_key
+from common.utils import GameMode
+from game.game_state import GameState
+from liqi import MsgType, LiqiMethod
+from liqi_proto import liqi_pb2 as pb
+
+ACCOUNT_ID = 5      # seat 0, kamicha is seat 3
+
+
+class _Engine:
+    """ deterministic engine: first legal action"""
+    engine_type = 'mortal'
+    name = 'test'
+    version = 4
+    is_oracle = False
+    enable_quick_eval = False
+    enable_rule_based_agari_guard = False
+    enable_amp = False
+    stochastic_latent = False
+
+    def __init__(self):
+        self.n_calls = 0
+
+    def react_batch(self, obs, masks, invisible_obs):
+        self.n_calls += len(obs)
+        actions = [int(np.argmax(m)) for m in masks]
+        q_out = [[float(x) for x in m] for m in masks]
+        return actions, q_out, [list(map(bool, m)) for m in masks], [True] * len(masks)
+
+
+class _SpecBot(BotMjai):
+    def __init__(self):
+        super().__init__("Speculative Test Bot")
+        self.speculative = True
+        self.engine = _Engine()
+
+    def _get_engine(self, mode:GameMode):
+        return self.engine
+
+
+def _action(name:str, msg_class, step:int, **data) -> dict:
+    return {'id': -1, 'type': MsgType.NOTIFY, 'method': LiqiMethod.ActionPrototype, 'data': {
+        'step': step, 'name': name, 'data': MessageToDict(msg_class(**data), including_default_value_fields=True)}}
+
+
+def _operation(*types:int) -> dict:
+    return {'seat': 0, 'operationList': [{'type': t} for t in types]}
+
+
+def _wait_round(bot:_SpecBot):
+    bot._speculator._executor.submit(lambda: None).result()     # pylint: disable=protected-access
+
+
+def _start_game(bot:_SpecBot) -> GameState:
+    gs = GameState(bot)
+    gs.input({'id': 1, 'type': MsgType.REQ, 'method': LiqiMethod.authGame, 'data': {'accountId': ACCOUNT_ID}})
+    gs.input({'id': 1, 'type': MsgType.RES, 'method': LiqiMethod.authGame,
+        'data': MessageToDict(pb.ResAuthGame(seat_list=[ACCOUNT_ID, 2, 3, 4]), including_default_value_fields=True)})
+    tiles = ['1m', '2m', '3m', '4m', '5m', '6m', '7m', '8m', '9m', '1p', '2p', '3p', '4p', '5p']
+    new_round = _action('ActionNewRound', pb.ActionNewRound, 1, chang=0, ju=0, ben=0, tiles=tiles, doras=['1z'],
+        scores=[25000] * 4, liqibang=0)
+    new_round['data']['data']['operation'] = _operation(1)
+    assert gs.input(new_round)['type'] == 'dahai'
+    return gs
+
+
+def test_round_starts_on_kamicha_discard_without_call_option():
+    bot = _SpecBot()
+    gs = _start_game(bot)
+    engine = bot._speculator.engine     # pylint: disable=protected-access
+    step = 2
+    gs.input(_action('ActionDiscardTile', pb.ActionDiscardTile, step, seat=0, tile='5p', moqie=True, doras=['1z']))
+    for seat in (1, 2, 3):
+        step += 1
+        gs.input(_action('ActionDealTile', pb.ActionDealTile, step, seat=seat, doras=['1z']))
+        step += 1
+        # no call option on the discards: no decision, msgs stay pending in game state
+        assert gs.input(_action('ActionDiscardTile', pb.ActionDiscardTile, step, seat=seat, tile='9s', moqie=True,
+            doras=['1z'])) is None
+    assert gs.mjai_pending_input_msgs
+    assert engine._armed        # pylint: disable=protected-access
+    _wait_round(bot)
+    n_calls = bot.engine.n_calls
+
+    step += 1
+    own_tsumo = _action('ActionDealTile', pb.ActionDealTile, step, seat=0, tile='7z', doras=['1z'])
+    own_tsumo['data']['data']['operation'] = _operation(1)
+    reaction = gs.input(own_tsumo)
+    assert reaction['type'] == 'dahai'
+    assert (engine.rounds, engine.hits) == (1, 1)
+    assert bot.engine.n_calls == n_calls        # served from the speculation round
+    assert not engine._armed        # pylint: disable=protected-access
+    history = bot._speculator._history      # pylint: disable=protected-access
+    assert [m['type'] for m in history].count('dahai') == 4     # msgs fed ahead are not passed again
+
+
+def test_no_round_for_dahai_and_own_tsumo_in_one_batch():
+    bot = _SpecBot()
+    bot.init_bot(0, GameMode.MJ4P)
+    engine = bot._speculator.engine     # pylint: disable=protected-access
+    bot.react_batch([
+        {'type': 'start_game', 'id': 0},
+        {'type': 'start_kyoku', 'bakaze': 'E', 'kyoku': 1, 'honba': 0, 'kyotaku': 0, 'oya': 0, 'dora_marker': '1p',
+            'scores': [25000] * 4, 'tehais': [['1m'] * 13] + [['?'] * 13] * 3},
+        {'type': 'tsumo', 'actor': 3, 'pai': '?'},
+        {'type': 'dahai', 'actor': 3, 'pai': '9s', 'tsumogiri': True},
+        {'type': 'tsumo', 'actor': 0, 'pai': '2m'}])
+    assert not engine._armed        # pylint: disable=protected-access
+    assert engine.rounds == 0
+
+
+def test_reach_lookahead_batch_served_from_round():
+    """ decision with reach option comes with the post-reach clone row (LookaheadBot.react_with_reach)"""
+    inner = _Engine()
+    engine = SpeculativeEngine(inner)
+    rng = np.random.default_rng(0)
+    obs = [rng.random((4, 34)).astype(np.float32) for _ in range(2)]
+    masks = [np.ones(46, dtype=bool), np.eye(46, dtype=bool)[3]]
+    precomputed = ([7], [[0.5] * 46], [[True] * 46], [True])
+    engine.add_results(engine.new_round(), [_input_key(obs[0], masks[0])], [precomputed])
+    actions, q_out, masks_out, is_greedy = engine.react_batch(obs, masks, None)
+    assert actions == [7, 3]
+    assert q_out[0] == precomputed[1][0] and len(masks_out) == len(is_greedy) == 2
+    assert inner.n_calls == 1           # only the clone row is computed
+    assert (engine.rounds, engine.hits) == (1, 1)